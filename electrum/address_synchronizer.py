@@ -24,10 +24,10 @@
 import asyncio
 import threading
 import itertools
+import bisect
 from collections import defaultdict
 from typing import TYPE_CHECKING, Dict, Optional, Set, Tuple, NamedTuple, Sequence, List
 
-from .crypto import sha256
 from . import bitcoin, util
 from .bitcoin import COINBASE_MATURITY
 from .util import profiler, bfh, TxMinedInfo, UnrelatedTransactionException, with_lock, OldTaskGroup
@@ -62,9 +62,112 @@ class HistoryItem(NamedTuple):
     balance: int
 
 
+class AddrBalance(NamedTuple):
+    """Unspent outputs of an address, summarised for get_balance."""
+    confirmed: int  # value of mined, non-coinbase utxos
+    other_utxos: Sequence[Tuple[str, int, int, bool]]  # (prevout_str, height, value, is_coinbase) of the rest
+
+
+class HistoryIndex:
+    """Sorted history of a set of addresses, with running balances.
+
+    Txs are kept sorted by (height, txpos), with their delta on the domain.
+    When addresses of the domain are marked dirty, only their txs are
+    re-sorted, and balances are recomputed from the first position that changed.
+    """
+
+    def __init__(self, domain: frozenset):
+        self.domain = domain
+        self.dirty_addrs = set()  # type: Set[str]
+        self._addr_deltas = {}  # type: Dict[str, Dict[str, int]]  # addr -> txid -> delta on addr
+        self._tx_deltas = {}  # type: Dict[str, int]
+        self._tx_refcount = defaultdict(int)  # type: Dict[str, int]  # number of domain addrs with tx in history
+        self._sort_keys = {}  # type: Dict[str, Tuple[int, int, str]]  # (sort height, txpos, txid)
+        self._keys = []  # type: List[Tuple[int, int, str]]
+        self._balances = []  # type: List[int]
+        self._is_built = False
+
+    def update(self, adb: 'AddressSynchronizer') -> bool:
+        """Applies pending changes. Returns whether anything changed.
+        Caller must hold both locks of adb.
+        """
+        if self._is_built and not self.dirty_addrs:
+            return False
+        addrs = self.dirty_addrs if self._is_built else self.domain
+        affected = {}  # ordered set of txids
+        for addr in addrs:
+            old_deltas = self._addr_deltas.pop(addr, {})
+            new_deltas = {}
+            for txid in adb.get_address_history(addr):
+                new_deltas[txid] = adb.get_tx_delta(txid, addr)
+            for txid, delta in old_deltas.items():
+                self._tx_deltas[txid] -= delta
+                self._tx_refcount[txid] -= 1
+                affected[txid] = None
+            for txid, delta in new_deltas.items():
+                self._tx_deltas[txid] = self._tx_deltas.get(txid, 0) + delta
+                self._tx_refcount[txid] += 1
+                affected[txid] = None
+            if new_deltas:
+                self._addr_deltas[addr] = new_deltas
+        self.dirty_addrs.clear()
+        self._is_built = True
+        first_changed_pos = len(self._keys)
+        for txid in affected:
+            old_key = self._sort_keys.pop(txid, None)
+            if old_key is not None:
+                pos = bisect.bisect_left(self._keys, old_key)
+                del self._keys[pos]
+                first_changed_pos = min(first_changed_pos, pos)
+            if self._tx_refcount[txid] == 0:
+                del self._tx_refcount[txid]
+                del self._tx_deltas[txid]
+                continue
+            key = adb._get_tx_sort_key(txid) + (txid,)
+            pos = bisect.bisect_left(self._keys, key)
+            self._keys.insert(pos, key)
+            self._sort_keys[txid] = key
+            first_changed_pos = min(first_changed_pos, pos)
+        del self._balances[first_changed_pos:]
+        balance = self._balances[-1] if self._balances else 0
+        for key in self._keys[first_changed_pos:]:
+            balance += self._tx_deltas[key[2]]
+            self._balances.append(balance)
+        return bool(affected)
+
+    def get_balance(self) -> int:
+        return self._balances[-1] if self._balances else 0
+
+    def items(
+            self,
+            *,
+            from_height: int = None,
+            to_height: int = None,
+            after_key: Tuple[int, int, str] = None,
+            limit: int = None,
+    ) -> Tuple[Sequence[Tuple[Tuple[int, int, str], int, int]], bool]:
+        """Returns (sort key, delta, balance) tuples, sorted, and whether there are more.
+        Sort keys are (sort height, txpos, txid), see tx_height_to_sort_height.
+        If a height bound is set, only mined txs are returned.
+        Items start after after_key, which need not be in the index (anymore).
+        """
+        start = 0 if from_height is None else bisect.bisect_left(self._keys, (from_height,))
+        end = len(self._keys) if to_height is None else bisect.bisect_left(self._keys, (to_height,))
+        if from_height is not None or to_height is not None:
+            end = min(end, bisect.bisect_left(self._keys, (TX_HEIGHT_INF,)))
+        if after_key is not None:
+            start = max(start, bisect.bisect_right(self._keys, tuple(after_key)))
+        stop = end if limit is None else max(start, min(end, start + limit))
+        items = [(key, self._tx_deltas[key[2]], balance)
+                 for key, balance in zip(self._keys[start:stop], self._balances[start:stop])]
+        return items, stop < end
+
+
 class AddressSynchronizer(Logger, EventListener):
     """ address database """
 
+    MAX_HISTORY_INDEXES = 4
+
     network: Optional['Network']
     asyncio_loop: Optional['asyncio.AbstractEventLoop'] = None
     synchronizer: Optional['Synchronizer']
@@ -90,7 +193,13 @@ class AddressSynchronizer(Logger, EventListener):
         # thread local storage for caching stuff
         self.threadlocal_cache = threading.local()
 
-        self._get_balance_cache = {}
+        # Index of the outputs of each address, derived from the history.
+        # Entries are computed lazily, and invalidated for the addresses touched by a tx
+        # when the tx is added or removed, or its mined status changes. Access with both locks.
+        self._addr_io_cache = {}  # type: Dict[str, Tuple[Dict[str, tuple], Dict[str, tuple]]]
+        self._addr_balance_index = {}  # type: Dict[str, AddrBalance]
+        # sorted histories of the last few domains passed to get_history
+        self._history_indexes = {}  # type: Dict[frozenset, HistoryIndex]
 
         self.load_and_cleanup()
 
@@ -192,7 +301,10 @@ class AddressSynchronizer(Logger, EventListener):
 
     @event_listener
     def on_event_blockchain_updated(self, *args):
-        self._get_balance_cache = {}  # invalidate cache
+        with self.lock, self.transaction_lock:
+            # future txs become local at their wanted height
+            for txid in list(self.future_tx):
+                self._invalidate_addr_index_for_tx(txid)
         self.db.put('stored_height', self.get_local_height())
 
     async def stop(self):
@@ -209,10 +321,16 @@ class AddressSynchronizer(Logger, EventListener):
                 self.unregister_callbacks()
 
     def add_address(self, address):
-        if address not in self.db.history:
-            self.db.history[address] = []
+        self.add_addresses([address])
+
+    def add_addresses(self, addresses: Sequence[str]) -> None:
+        with self.lock:
+            for address in addresses:
+                if address not in self.db.history:
+                    self.db.history[address] = []
         if self.synchronizer:
-            self.synchronizer.add(address)
+            for address in addresses:
+                self.synchronizer.add(address)
         self.up_to_date_changed()
 
     def get_conflicting_transactions(self, tx_hash, tx: Transaction, include_self=False):
@@ -321,7 +439,7 @@ class AddressSynchronizer(Logger, EventListener):
                         pass
                     else:
                         self.db.add_txi_addr(tx_hash, addr, ser, v)
-                        self._get_balance_cache.clear()  # invalidate cache
+                        self._invalidate_addr_index(addr)
             for txi in tx.inputs():
                 if txi.is_coinbase_input():
                     continue
@@ -339,7 +457,7 @@ class AddressSynchronizer(Logger, EventListener):
                 addr = txo.address
                 if addr and self.is_mine(addr):
                     self.db.add_txo_addr(tx_hash, addr, n, v, is_coinbase)
-                    self._get_balance_cache.clear()  # invalidate cache
+                    self._invalidate_addr_index(addr)
                     # give v to txi that spends me
                     next_tx = self.db.get_spent_outpoint(tx_hash, n)
                     if next_tx is not None:
@@ -390,8 +508,7 @@ class AddressSynchronizer(Logger, EventListener):
             tx = self.db.remove_transaction(tx_hash)
             remove_from_spent_outpoints()
             self._remove_tx_from_local_history(tx_hash)
-            for addr in itertools.chain(self.db.get_txi_addresses(tx_hash), self.db.get_txo_addresses(tx_hash)):
-                self._get_balance_cache.clear()  # invalidate cache
+            self._invalidate_addr_index_for_tx(tx_hash)
             self.db.remove_txi(tx_hash)
             self.db.remove_txo(tx_hash)
             self.db.remove_tx_fee(tx_hash)
@@ -430,9 +547,11 @@ class AddressSynchronizer(Logger, EventListener):
                     self.unverified_tx.pop(tx_hash, None)
                     self.unconfirmed_tx.pop(tx_hash, None)
                     self.db.remove_verified_tx(tx_hash)
+                    self._invalidate_addr_index_for_tx(tx_hash)
                     if self.verifier:
                         self.verifier.remove_spv_proof_for_tx(tx_hash)
             self.db.set_addr_history(addr, hist)
+            self._invalidate_addr_index(addr)
 
         for tx_hash, tx_height in hist:
             # add it in case it was previously unconfirmed
@@ -484,7 +603,9 @@ class AddressSynchronizer(Logger, EventListener):
             with self.transaction_lock:
                 self.db.clear_history()
                 self._history_local.clear()
-                self._get_balance_cache.clear()  # invalidate cache
+                self._addr_io_cache.clear()
+                self._addr_balance_index.clear()
+                self._history_indexes.clear()
 
     def _get_tx_sort_key(self, tx_hash: str) -> Tuple[int, int]:
         """Returns a key to be used for sorting txs."""
@@ -526,39 +647,62 @@ class AddressSynchronizer(Logger, EventListener):
     @with_transaction_lock
     @with_local_height_cached
     def get_history(self, domain) -> Sequence[HistoryItem]:
-        domain = set(domain)
-        # 1. Get the history of each address in the domain, maintain the
-        #    delta of a tx as the sum of its deltas on domain addresses
-        tx_deltas = defaultdict(int)  # type: Dict[str, int]
-        for addr in domain:
-            h = self.get_address_history(addr).items()
-            for tx_hash, height in h:
-                tx_deltas[tx_hash] += self.get_tx_delta(tx_hash, addr)
-        # 2. create sorted history
-        history = []
-        for tx_hash in tx_deltas:
-            delta = tx_deltas[tx_hash]
-            tx_mined_status = self.get_tx_height(tx_hash)
-            fee = self.get_tx_fee(tx_hash)
-            history.append((tx_hash, tx_mined_status, delta, fee))
-        history.sort(key = lambda x: self._get_tx_sort_key(x[0]))
-        # 3. add balance
+        history, _ = self.get_history_page(domain)
+        return [item for key, item in history]
+
+    @with_lock
+    @with_transaction_lock
+    @with_local_height_cached
+    def get_history_page(
+            self,
+            domain,
+            *,
+            from_height: int = None,
+            to_height: int = None,
+            after_key: Tuple[int, int, str] = None,
+            limit: int = None,
+    ) -> Tuple[Sequence[Tuple[Tuple[int, int, str], HistoryItem]], bool]:
+        """Returns a slice of get_history, as (sort key, item) pairs,
+        and whether there are more items after it.
+        from_height/to_height select txs mined in [from_height, to_height);
+        if either is set, unconfirmed and local txs are excluded.
+        The slice starts after after_key, the sort key of an item of a previous
+        slice. It does not matter if that tx has been removed since.
+        """
+        history_index = self._get_history_index(frozenset(domain))
+        items, has_more = history_index.items(
+            from_height=from_height,
+            to_height=to_height,
+            after_key=after_key,
+            limit=limit)
         h2 = []
-        balance = 0
-        for tx_hash, tx_mined_status, delta, fee in history:
-            balance += delta
-            h2.append(HistoryItem(
+        for key, delta, balance in items:
+            tx_hash = key[2]
+            h2.append((key, HistoryItem(
                 txid=tx_hash,
-                tx_mined_status=tx_mined_status,
+                tx_mined_status=self.get_tx_height(tx_hash),
                 delta=delta,
-                fee=fee,
-                balance=balance))
-        # sanity check
-        c, u, x = self.get_balance(domain)
-        if balance != c + u + x:
-            self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
-            raise Exception("wallet.get_history() failed balance sanity-check")
-        return h2
+                fee=self.get_tx_fee(tx_hash),
+                balance=balance)))
+        return h2, has_more
+
+    def _get_history_index(self, domain: frozenset) -> HistoryIndex:
+        history_index = self._history_indexes.pop(domain, None)
+        if history_index is None:
+            history_index = HistoryIndex(domain)
+            while len(self._history_indexes) >= self.MAX_HISTORY_INDEXES:
+                del self._history_indexes[next(iter(self._history_indexes))]
+        self._history_indexes[domain] = history_index  # most recently used last
+        changed = history_index.update(self)
+        if changed:
+            # sanity check
+            c, u, x = self.get_balance(domain)
+            balance = history_index.get_balance()
+            if balance != c + u + x:
+                self._history_indexes.pop(domain, None)
+                self.logger.error(f'sanity check failed! c={c},u={u},x={x} while history balance={balance}')
+                raise Exception("wallet.get_history() failed balance sanity-check")
+        return history_index
 
     def _add_tx_to_local_history(self, txid):
         with self.transaction_lock:
@@ -566,6 +710,7 @@ class AddressSynchronizer(Logger, EventListener):
                 cur_hist = self._history_local.get(addr, set())
                 cur_hist.add(txid)
                 self._history_local[addr] = cur_hist
+                self._invalidate_addr_index(addr)
                 self._mark_address_history_changed(addr)
 
     def _remove_tx_from_local_history(self, txid):
@@ -578,8 +723,22 @@ class AddressSynchronizer(Logger, EventListener):
                     pass
                 else:
                     self._history_local[addr] = cur_hist
+                    self._invalidate_addr_index(addr)
                     self._mark_address_history_changed(addr)
 
+    def _invalidate_addr_index(self, addr: str) -> None:
+        self._addr_io_cache.pop(addr, None)
+        self._addr_balance_index.pop(addr, None)
+        for history_index in self._history_indexes.values():
+            if addr in history_index.domain:
+                history_index.dirty_addrs.add(addr)
+
+    def _invalidate_addr_index_for_tx(self, txid: str) -> None:
+        """To be called when txid is added or removed, or its mined status changes."""
+        with self.transaction_lock:
+            for addr in itertools.chain(self.db.get_txi_addresses(txid), self.db.get_txo_addresses(txid)):
+                self._invalidate_addr_index(addr)
+
     def _mark_address_history_changed(self, addr: str) -> None:
         def set_and_clear():
             event = self._address_history_changed_events[addr]
@@ -606,27 +765,36 @@ class AddressSynchronizer(Logger, EventListener):
                 with self.lock:
                     self.db.remove_verified_tx(tx_hash)
                     self.unconfirmed_tx[tx_hash] = tx_height
+                    self._invalidate_addr_index_for_tx(tx_hash)
                 if self.verifier:
                     self.verifier.remove_spv_proof_for_tx(tx_hash)
         else:
             with self.lock:
+                old_info = self.get_tx_height(tx_hash)
                 if tx_height > 0:
                     self.unverified_tx[tx_hash] = tx_height
                 else:
                     self.unconfirmed_tx[tx_hash] = tx_height
+                if self.get_tx_height(tx_hash) != old_info:
+                    self._invalidate_addr_index_for_tx(tx_hash)
+        self._wakeup_synchronizer()
 
     def remove_unverified_tx(self, tx_hash, tx_height):
         with self.lock:
             new_height = self.unverified_tx.get(tx_hash)
             if new_height == tx_height:
                 self.unverified_tx.pop(tx_hash, None)
+                self._invalidate_addr_index_for_tx(tx_hash)
+        self._wakeup_synchronizer()
 
     def add_verified_tx(self, tx_hash: str, info: TxMinedInfo):
         # Remove from the unverified map and add to the verified map
         with self.lock:
             self.unverified_tx.pop(tx_hash, None)
             self.db.add_verified_tx(tx_hash, info)
+            self._invalidate_addr_index_for_tx(tx_hash)
         util.trigger_callback('adb_added_verified_tx', self, tx_hash)
+        self._wakeup_synchronizer()
 
     def get_unverified_txs(self) -> Dict[str, int]:
         '''Returns a map from tx hash to transaction height'''
@@ -654,6 +822,7 @@ class AddressSynchronizer(Logger, EventListener):
                         # into unverified_tx with the old height, and if we get
                         # a status update, that will overwrite it.
                         self.unverified_tx[tx_hash] = tx_height
+                        self._invalidate_addr_index_for_tx(tx_hash)
                         txs.add(tx_hash)
 
         for tx_hash in txs:
@@ -676,6 +845,7 @@ class AddressSynchronizer(Logger, EventListener):
         with self.lock:
             old_height = self.future_tx.get(txid) or None
             self.future_tx[txid] = wanted_height
+            self._invalidate_addr_index_for_tx(txid)
         if old_height != wanted_height:
             util.trigger_callback('adb_set_future_tx', self, txid)
 
@@ -706,6 +876,11 @@ class AddressSynchronizer(Logger, EventListener):
         # fire triggers
         util.trigger_callback('adb_set_up_to_date', self)
 
+    def _wakeup_synchronizer(self) -> None:
+        # the verifier's progress is part of is_up_to_date, which the synchronizer reports
+        if self.synchronizer:
+            self.synchronizer.wakeup()
+
     def is_up_to_date(self):
         if not self.synchronizer or not self.verifier:
             return False
@@ -798,20 +973,48 @@ class AddressSynchronizer(Logger, EventListener):
 
     def get_addr_io(self, address: str):
         with self.lock, self.transaction_lock:
-            h = self.get_address_history(address).items()
-            received = {}
-            sent = {}
-            for tx_hash, height in h:
-                tx_mined_info = self.get_tx_height(tx_hash)
-                txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
-                d = self.db.get_txo_addr(tx_hash, address)
-                for n, (v, is_cb) in d.items():
-                    received[tx_hash + ':%d'%n] = (height, txpos, v, is_cb)
-                l = self.db.get_txi_addr(tx_hash, address)
-                for txi, v in l:
-                    sent[txi] = tx_hash, height, txpos
+            received, sent = self._get_addr_io(address)
+            return dict(received), dict(sent)
+
+    def _get_addr_io(self, address: str):
+        # note: returns the cached dicts; callers must hold both locks and not modify them
+        io = self._addr_io_cache.get(address)
+        if io is not None:
+            return io
+        h = self.get_address_history(address).items()
+        received = {}
+        sent = {}
+        for tx_hash, height in h:
+            tx_mined_info = self.get_tx_height(tx_hash)
+            txpos = tx_mined_info.txpos if tx_mined_info.txpos is not None else -1
+            d = self.db.get_txo_addr(tx_hash, address)
+            for n, (v, is_cb) in d.items():
+                received[tx_hash + ':%d'%n] = (height, txpos, v, is_cb)
+            l = self.db.get_txi_addr(tx_hash, address)
+            for txi, v in l:
+                sent[txi] = tx_hash, height, txpos
+        self._addr_io_cache[address] = received, sent
         return received, sent
 
+    def _get_addr_balance(self, address: str) -> AddrBalance:
+        # callers must hold both locks
+        addr_balance = self._addr_balance_index.get(address)
+        if addr_balance is not None:
+            return addr_balance
+        received, sent = self._get_addr_io(address)
+        confirmed = 0
+        other_utxos = []
+        for prevout_str, (tx_height, txpos, v, is_cb) in received.items():
+            if prevout_str in sent:
+                continue
+            if tx_height > 0 and not is_cb:
+                confirmed += v
+            else:
+                other_utxos.append((prevout_str, tx_height, v, is_cb))
+        addr_balance = AddrBalance(confirmed=confirmed, other_utxos=other_utxos)
+        self._addr_balance_index[address] = addr_balance
+        return addr_balance
+
     def get_addr_outputs(self, address: str) -> Dict[TxOutpoint, PartialTxInput]:
         received, sent = self.get_addr_io(address)
         out = {}
@@ -861,55 +1064,57 @@ class AddressSynchronizer(Logger, EventListener):
             excluded_coins = set()
         assert isinstance(excluded_coins, set), f"excluded_coins should be set, not {type(excluded_coins)}"
 
-        cache_key = sha256(','.join(sorted(domain)) + ';'
-                           + ','.join(sorted(excluded_coins)))
-        cached_value = self._get_balance_cache.get(cache_key)
-        if cached_value:
-            return cached_value
-
-        coins = {}
-        for address in domain:
-            coins.update(self.get_addr_outputs(address))
-
         c = u = x = 0
         mempool_height = self.get_local_height() + 1  # height of next block
-        for utxo in coins.values():  # type: PartialTxInput
-            if utxo.spent_height is not None:
-                continue
-            if utxo.prevout.to_str() in excluded_coins:
-                continue
-            v = utxo.value_sats()
-            tx_height = utxo.block_height
-            is_cb = utxo.is_coinbase_output()
-            if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
-                x += v
-            elif tx_height > 0:
-                c += v
-            else:
-                txid = utxo.prevout.txid.hex()
-                tx = self.db.get_transaction(txid)
-                assert tx is not None # txid comes from get_addr_io
-                # we look at the outputs that are spent by this transaction
-                # if those outputs are ours and confirmed, we count this coin as confirmed
-                confirmed_spent_amount = 0
-                for txin in tx.inputs():
-                    if txin.prevout in coins:
-                        coin = coins[txin.prevout]
-                        if coin.block_height > 0:
-                            confirmed_spent_amount += coin.value_sats()
-                # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
-                # (fixme: tx may have multiple change outputs)
-                if confirmed_spent_amount >= v:
+        for address in domain:
+            addr_balance = self._get_addr_balance(address)
+            c += addr_balance.confirmed
+            for prevout_str, tx_height, v, is_cb in addr_balance.other_utxos:
+                if prevout_str in excluded_coins:
+                    continue
+                if is_cb and tx_height + COINBASE_MATURITY > mempool_height:
+                    x += v
+                elif tx_height > 0:
                     c += v
                 else:
-                    c += confirmed_spent_amount
-                    u += v - confirmed_spent_amount
-        result = c, u, x
-        # cache result.
-        # Cache needs to be invalidated if a transaction is added to/
-        # removed from history; or on new blocks (maturity...)
-        self._get_balance_cache[cache_key] = result
-        return result
+                    txid = prevout_str.split(':')[0]
+                    tx = self.db.get_transaction(txid)
+                    assert tx is not None # txid comes from get_addr_io
+                    # we look at the outputs that are spent by this transaction
+                    # if those outputs are ours and confirmed, we count this coin as confirmed
+                    confirmed_spent_amount = 0
+                    for txin in tx.inputs():
+                        coin = self._get_domain_coin(txin.prevout.to_str(), domain)
+                        if coin is not None and coin[0] > 0:
+                            confirmed_spent_amount += coin[2]
+                    # Compare amount, in case tx has confirmed and unconfirmed inputs, or is a coinjoin.
+                    # (fixme: tx may have multiple change outputs)
+                    if confirmed_spent_amount >= v:
+                        c += v
+                    else:
+                        c += confirmed_spent_amount
+                        u += v - confirmed_spent_amount
+        for prevout_str in excluded_coins:
+            coin = self._get_domain_coin(prevout_str, domain)
+            if coin is None:
+                continue
+            tx_height, txpos, v, is_cb, is_spent = coin
+            if tx_height > 0 and not is_cb and not is_spent:
+                c -= v
+        return c, u, x
+
+    def _get_domain_coin(self, prevout_str: str, domain: Set[str]) -> Optional[Tuple[int, int, int, bool, bool]]:
+        """Returns (height, txpos, value, is_coinbase, is_spent) of an output
+        that belongs to an address in domain, or None.
+        """
+        txid = prevout_str.split(':')[0]
+        for addr in self.db.get_txo_addresses(txid):
+            if addr not in domain:
+                continue
+            received, sent = self._get_addr_io(addr)
+            if prevout_str in received:
+                return received[prevout_str] + (prevout_str in sent,)
+        return None
 
     @with_local_height_cached
     def get_utxos(
@@ -281,6 +281,26 @@ class BIP32Node(NamedTuple):
                          fingerprint=fingerprint,
                          child_number=child_number)
 
+    def derive_public_children(self, start: int, count: int) -> Sequence[bytes]:
+        """Returns the compressed pubkeys of the children start, ..., start+count-1
+        of this node. Same as subkey_at_public_derivation((i,)) for each i,
+        but the parent is only parsed once, and the children are not turned into nodes.
+        """
+        if start < 0 or count < 0:
+            raise ValueError('the bip32 index needs to be non-negative')
+        if start + count > BIP32_PRIME:
+            raise Exception('not possible to derive hardened child from parent pubkey')
+        parent_pubkey = self.eckey.get_public_key_bytes(compressed=True)
+        tweaks = []
+        for child_index in range(start, start + count):
+            I = hmac_oneshot(self.chaincode, parent_pubkey + child_index.to_bytes(4, byteorder="big"), hashlib.sha512)
+            tweaks.append(I[0:32])
+        pubkeys = self.eckey.add_tweaks(tweaks)
+        for i, pubkey in enumerate(pubkeys):
+            if pubkey is None:  # invalid child, see protect_against_invalid_ecpoint
+                pubkeys[i], _ = CKD_pub(parent_pubkey, self.chaincode, start + i)
+        return pubkeys
+
     def calc_fingerprint_of_this_node(self) -> bytes:
         """Returns the fingerprint of this node.
         Note that self.fingerprint is of the *parent*.
@@ -518,6 +518,19 @@ def script_to_scripthash(script: str) -> str:
     h = sha256(bfh(script))[0:32]
     return h[::-1].hex()
 
+
+def history_status(h) -> Optional[str]:
+    """The status of an address, as in Electrum protocol notifications,
+    given its history as a list of (tx_hash, height).
+    """
+    if not h:
+        return None
+    status = ''
+    for tx_hash, height in h:
+        status += tx_hash + ':%d:' % height
+    return hashlib.sha256(status.encode('ascii')).digest().hex()
+
+
 def public_key_to_p2pk_script(pubkey: str) -> str:
     return construct_script([pubkey, opcodes.OP_CHECKSIG])
 
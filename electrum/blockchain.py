@@ -20,16 +20,24 @@
 # ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
+import asyncio
+import collections.abc
+import concurrent.futures
+import json
+import mmap
+import multiprocessing
 import os
+import struct
 import threading
 import time
-from typing import Optional, Dict, Mapping, Sequence, TYPE_CHECKING
+import zlib
+from typing import Optional, Dict, List, Mapping, Sequence, TYPE_CHECKING
 
 from . import util
 from .bitcoin import hash_encode, int_to_hex, rev_hex
-from .crypto import sha256d
+from .crypto import sha256, sha256d
 from . import constants
-from .util import bfh, with_lock
+from .util import bfh, with_lock, LRUCache
 from .logging import get_logger, Logger
 
 if TYPE_CHECKING:
@@ -38,14 +46,19 @@ if TYPE_CHECKING:
 try:
     import scrypt
     getPoWHash = lambda x: scrypt.hash(x, x, N=1024, r=1, p=1, buflen=32)
+    getPoWHashes = lambda xs: [getPoWHash(x) for x in xs]
 except ImportError:
-    util.print_msg("Warning: package scrypt not available; synchronization could be very slow")
+    if multiprocessing.parent_process() is None:  # not again in each PoW hashing worker
+        util.print_msg("Warning: package scrypt not available; synchronization could be very slow")
     from .scrypt import scrypt_1024_1_1_80 as getPoWHash
+    from .scrypt import scrypt_1024_1_1_80_batch as getPoWHashes
 
 
 _logger = get_logger(__name__)
 
 HEADER_SIZE = 80  # bytes
+HASH_SIZE = 32  # bytes; size of an entry in the hash index
+HEADER_CACHE_SIZE = 2016  # number of deserialized headers kept per chain
 
 # see https://github.com/bitcoin/bitcoin/blob/feedb9c84e72e4fff489810a2bbeec09bcda5763/src/chainparams.cpp#L76
 MAX_TARGET = 0x00000fffffffffffffffffffffffffffffffffffffffffffffffffffffffffff  # compact: 0x1e0ffff0
@@ -57,7 +70,80 @@ class MissingHeader(Exception):
 class InvalidHeader(Exception):
     pass
 
-def serialize_header(header_dict: dict) -> str:
+class BlockHeader(collections.abc.Mapping):
+    """A block header at a given height, backed by its raw 80 bytes.
+
+    Fields are decoded from the raw bytes on access, and the block hash
+    is computed once. It can also be used as a read-only header dict.
+    """
+
+    __slots__ = ('raw', 'block_height', '_hash')
+    _FIELDS = ('version', 'prev_block_hash', 'merkle_root', 'timestamp', 'bits', 'nonce', 'block_height')
+
+    def __init__(self, raw: bytes, height: int):
+        if len(raw) != HEADER_SIZE:
+            raise InvalidHeader('Invalid header length: {}'.format(len(raw)))
+        self.raw = bytes(raw)
+        self.block_height = height
+        self._hash = None  # type: Optional[str]
+
+    @property
+    def version(self) -> int:
+        return int.from_bytes(self.raw[0:4], byteorder='little')
+
+    @property
+    def prev_block_hash(self) -> str:
+        return hash_encode(self.raw[4:36])
+
+    @property
+    def merkle_root(self) -> str:
+        return hash_encode(self.raw[36:68])
+
+    @property
+    def timestamp(self) -> int:
+        return int.from_bytes(self.raw[68:72], byteorder='little')
+
+    @property
+    def bits(self) -> int:
+        return int.from_bytes(self.raw[72:76], byteorder='little')
+
+    @property
+    def nonce(self) -> int:
+        return int.from_bytes(self.raw[76:80], byteorder='little')
+
+    def hash(self) -> str:
+        if self._hash is None:
+            self._hash = hash_encode(sha256d(self.raw))
+        return self._hash
+
+    def __getitem__(self, key):
+        if key not in self._FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __contains__(self, key) -> bool:
+        return key in self._FIELDS
+
+    def __iter__(self):
+        return iter(self._FIELDS)
+
+    def __len__(self) -> int:
+        return len(self._FIELDS)
+
+    def __eq__(self, other):
+        if isinstance(other, BlockHeader):
+            return self.block_height == other.block_height and self.raw == other.raw
+        return super().__eq__(other)
+
+    __hash__ = None
+
+    def __repr__(self):
+        return f"<BlockHeader height={self.block_height} hash={self.hash()}>"
+
+
+def serialize_header(header_dict: Mapping) -> str:
+    if isinstance(header_dict, BlockHeader):
+        return header_dict.raw.hex()
     s = int_to_hex(header_dict['version'], 4) \
         + rev_hex(header_dict['prev_block_hash']) \
         + rev_hex(header_dict['merkle_root']) \
@@ -66,25 +152,16 @@ def serialize_header(header_dict: dict) -> str:
         + int_to_hex(int(header_dict['nonce']), 4)
     return s
 
-def deserialize_header(s: bytes, height: int) -> dict:
+def deserialize_header(s: bytes, height: int) -> BlockHeader:
     if not s:
         raise InvalidHeader('Invalid header: {}'.format(s))
-    if len(s) != HEADER_SIZE:
-        raise InvalidHeader('Invalid header length: {}'.format(len(s)))
-    hex_to_int = lambda s: int.from_bytes(s, byteorder='little')
-    h = {}
-    h['version'] = hex_to_int(s[0:4])
-    h['prev_block_hash'] = hash_encode(s[4:36])
-    h['merkle_root'] = hash_encode(s[36:68])
-    h['timestamp'] = hex_to_int(s[68:72])
-    h['bits'] = hex_to_int(s[72:76])
-    h['nonce'] = hex_to_int(s[76:80])
-    h['block_height'] = height
-    return h
-
-def hash_header(header: dict) -> str:
+    return BlockHeader(s, height)
+
+def hash_header(header: Optional[Mapping]) -> str:
     if header is None:
         return '0' * 64
+    if isinstance(header, BlockHeader):
+        return header.hash()
     if header.get('prev_block_hash') is None:
         header['prev_block_hash'] = '00'*32
     return hash_raw_header(serialize_header(header))
@@ -93,8 +170,75 @@ def hash_header(header: dict) -> str:
 def hash_raw_header(header: str) -> str:
     return hash_encode(sha256d(bfh(header)))
 
-def pow_hash_header(header):
-    return hash_encode(getPoWHash(bfh(serialize_header(header))))
+def pow_hash_header(header: Mapping) -> str:
+    raw = header.raw if isinstance(header, BlockHeader) else bfh(serialize_header(header))
+    return hash_encode(getPoWHash(raw))
+
+
+def pow_hash_raw_headers(data: bytes) -> List[str]:
+    """Returns the PoW hashes of the concatenated raw headers in data."""
+    headers = [data[i:i+HEADER_SIZE] for i in range(0, len(data), HEADER_SIZE)]
+    return [hash_encode(h) for h in getPoWHashes(headers)]
+
+
+# scrypt dominates the time it takes to verify a chunk, so PoW hashes of
+# chunks are computed in a pool of worker processes
+_pow_executor = None  # type: Optional[concurrent.futures.Executor]
+_pow_executor_lock = threading.Lock()
+MIN_HEADERS_FOR_POW_POOL = 64
+
+
+def _get_pow_executor(num_workers: int) -> Optional[concurrent.futures.Executor]:
+    global _pow_executor
+    with _pow_executor_lock:
+        if _pow_executor is None:
+            try:
+                # note: 'fork' is not safe here as we are multi-threaded
+                _pow_executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=num_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+            except (ImportError, NotImplementedError, OSError, ValueError) as e:
+                # e.g. no working sem_open on Android
+                _logger.info(f"cannot create process pool for PoW hashing: {repr(e)}")
+                return None
+        return _pow_executor
+
+
+def _discard_pow_executor(executor: concurrent.futures.Executor) -> None:
+    global _pow_executor
+    with _pow_executor_lock:
+        if _pow_executor is executor:
+            _pow_executor = None
+    executor.shutdown(wait=False)
+
+
+async def pow_hash_chunk(data: bytes, *, num_workers: int = None) -> Optional[List[str]]:
+    """Returns the PoW hashes of the concatenated raw headers in data,
+    computed across num_workers processes, without blocking the event loop.
+    Returns None if PoW is not checked on this network.
+    """
+    if constants.net.TESTNET:
+        return None
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+    num_headers = len(data) // HEADER_SIZE
+    loop = asyncio.get_running_loop()
+    executor = None
+    if num_workers > 1 and num_headers >= MIN_HEADERS_FOR_POW_POOL:
+        executor = _get_pow_executor(num_workers)
+    if executor is None:
+        return await loop.run_in_executor(None, pow_hash_raw_headers, data)
+    per_worker = -(-num_headers // num_workers)  # ceil div
+    slices = [data[i*HEADER_SIZE:(i+per_worker)*HEADER_SIZE]
+              for i in range(0, num_headers, per_worker)]
+    try:
+        results = await asyncio.gather(*[loop.run_in_executor(executor, pow_hash_raw_headers, s)
+                                         for s in slices])
+    except concurrent.futures.process.BrokenProcessPool as e:
+        _logger.info(f"PoW process pool broke, hashing in thread instead: {repr(e)}")
+        _discard_pow_executor(executor)
+        return await loop.run_in_executor(None, pow_hash_raw_headers, data)
+    return [h for result in results for h in result]
 
 
 # key: blockhash hex at forkpoint
@@ -115,6 +259,7 @@ def read_blockchains(config: 'SimpleConfig'):
         header_after_cp = best_chain.read_header(constants.net.max_checkpoint()+1)
         if not header_after_cp or not best_chain.can_connect(header_after_cp, check_height=False):
             _logger.info("[blockchain] deleting best chain. cannot connect header after last cp to last cp.")
+            best_chain.close_mmap()
             os.unlink(best_chain.path())
             best_chain.update_size()
     # forks
@@ -124,9 +269,14 @@ def read_blockchains(config: 'SimpleConfig'):
     l = filter(lambda x: x.startswith('fork2_') and '.' not in x, os.listdir(fdir))
     l = sorted(l, key=lambda x: int(x.split('_')[1]))  # sort by forkpoint
 
-    def delete_chain(filename, reason):
+    def delete_chain(filename, reason, chain: 'Blockchain' = None):
         _logger.info(f"[blockchain] deleting chain {filename}: {reason}")
+        if chain is not None:
+            chain.close_mmap()
         os.unlink(os.path.join(fdir, filename))
+        index_path = os.path.join(util.get_headers_dir(config), 'hash_index', filename)
+        if os.path.exists(index_path):
+            os.unlink(index_path)
 
     def instantiate_chain(filename):
         __, forkpoint, prev_hash, first_hash = filename.split('_')
@@ -152,10 +302,10 @@ def read_blockchains(config: 'SimpleConfig'):
         # consistency checks
         h = b.read_header(b.forkpoint)
         if first_hash != hash_header(h):
-            delete_chain(filename, "incorrect first hash for chain")
+            delete_chain(filename, "incorrect first hash for chain", b)
             return
         if not b.parent.can_connect(h, check_height=False):
-            delete_chain(filename, "cannot connect chain to parent")
+            delete_chain(filename, "cannot connect chain to parent", b)
             return
         chain_id = b.get_id()
         assert first_hash == chain_id, (first_hash, chain_id)
@@ -163,6 +313,7 @@ def read_blockchains(config: 'SimpleConfig'):
 
     for filename in l:
         instantiate_chain(filename)
+    load_chainwork_cache(config)
 
 
 def get_best_chain() -> 'Blockchain':
@@ -172,6 +323,79 @@ def get_best_chain() -> 'Blockchain':
 _CHAINWORK_CACHE = {
     "0000000000000000000000000000000000000000000000000000000000000000": 0,  # virtual block at height -1
 }  # type: Dict[str, int]
+_chainwork_cache_dirty = False
+
+
+def _get_chainwork_cache_path(config: 'SimpleConfig') -> str:
+    return os.path.join(util.get_headers_dir(config), 'chainwork_cache')
+
+
+def load_chainwork_cache(config: 'SimpleConfig') -> None:
+    """Seeds _CHAINWORK_CACHE from disk, so that get_chainwork does not
+    have to walk the whole chain after a restart. Entries for blocks that
+    are not in any of our chains (e.g. after a reorg) are ignored.
+    """
+    path = _get_chainwork_cache_path(config)
+    if not os.path.exists(path):
+        return
+    with blockchains_lock: chains = list(blockchains.values())
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+        for height, block_hash, work in entries:
+            if any(chain.check_hash(height, block_hash) for chain in chains):
+                _CHAINWORK_CACHE[block_hash] = int(work)
+    except (OSError, ValueError, TypeError, AssertionError) as e:
+        _logger.info(f"ignoring chainwork cache: {repr(e)}")
+
+
+def flush_pending_writes() -> None:
+    """fsync all headers files that have group-committed writes pending."""
+    with blockchains_lock:
+        chains = list(blockchains.values())
+    for b in chains:
+        b.flush_pending_writes()
+
+
+def flush_due_writes() -> None:
+    """Like flush_pending_writes, but only for the headers files whose
+    pending writes are older than NETWORK_HEADERS_FSYNC_INTERVAL_MS.
+    """
+    with blockchains_lock:
+        chains = list(blockchains.values())
+    for b in chains:
+        if b.is_flush_due():
+            b.flush_pending_writes()
+
+
+def save_chainwork_cache(config: 'SimpleConfig') -> None:
+    """Persists the entries of _CHAINWORK_CACHE that are part of our chains."""
+    global _chainwork_cache_dirty
+    if not _chainwork_cache_dirty:
+        return
+    _chainwork_cache_dirty = False
+    with blockchains_lock: chains = list(blockchains.values())
+    entries = []
+    for chain in chains:
+        # heights below the forkpoint are covered by the parent
+        for height in range(chain.forkpoint // 2016 * 2016 + 2015, chain.height() + 1, 2016):
+            try:
+                block_hash = chain.get_hash(height)
+            except MissingHeader:
+                continue
+            work = _CHAINWORK_CACHE.get(block_hash)
+            if work is not None:
+                entries.append([height, block_hash, work])
+    path = _get_chainwork_cache_path(config)
+    tmp_path = path + '.tmp'
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        _logger.info(f"failed to save chainwork cache: {repr(e)}")
 
 
 def init_headers_file_for_best_chain():
@@ -179,6 +403,7 @@ def init_headers_file_for_best_chain():
     filename = b.path()
     length = HEADER_SIZE * len(constants.net.CHECKPOINTS) * 2016
     if not os.path.exists(filename) or os.path.getsize(filename) < length:
+        b.close_mmap()
         with open(filename, 'wb') as f:
             if length > 0:
                 f.seek(length - 1)
@@ -207,6 +432,12 @@ class Blockchain(Logger):
         self._forkpoint_hash = forkpoint_hash  # blockhash at forkpoint. "first hash"
         self._prev_hash = prev_hash  # blockhash immediately before forkpoint
         self.lock = threading.RLock()
+        self._mmap = None  # type: Optional[mmap.mmap]
+        self._hash_index_mmap = None  # type: Optional[mmap.mmap]
+        self._header_cache = LRUCache(maxsize=HEADER_CACHE_SIZE)  # type: Dict[int, BlockHeader]  # height -> header
+        self._unsynced_headers = 0  # headers written since the last fsync
+        self._last_fsync = time.monotonic()
+        self._maps_stale = False  # the file grew since the maps were created
         self.update_size()
 
     @property
@@ -257,7 +488,7 @@ class Blockchain(Logger):
     def get_name(self) -> str:
         return self.get_hash(self.get_max_forkpoint()).lstrip('0')[0:10]
 
-    def check_header(self, header: dict) -> bool:
+    def check_header(self, header: Mapping) -> bool:
         header_hash = hash_header(header)
         height = header.get('block_height')
         return self.check_hash(height, header_hash)
@@ -272,7 +503,7 @@ class Blockchain(Logger):
         except Exception:
             return False
 
-    def fork(parent, header: dict) -> 'Blockchain':
+    def fork(parent, header: Mapping) -> 'Blockchain':
         if not parent.can_connect(header, check_height=False):
             raise Exception("forking header does not connect to parent chain")
         forkpoint = header.get('block_height')
@@ -302,25 +533,144 @@ class Blockchain(Logger):
     @with_lock
     def update_size(self) -> None:
         p = self.path()
-        self._size = os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0
+        self._set_size(os.path.getsize(p)//HEADER_SIZE if os.path.exists(p) else 0)
+
+    @with_lock
+    def _set_size(self, size: int) -> None:
+        self._size = size
+        self._maps_stale = True
+        self._refresh_maps()
+
+    @with_lock
+    def _refresh_maps(self) -> None:
+        """Brings the hash index up to date with our file, and maps both again."""
+        if not self._maps_stale:
+            return
+        self._maps_stale = False
+        self.close_mmap()
+        self._sync_hash_index()
+        self._remap()
+
+    @with_lock
+    def _remap(self) -> None:
+        """(Re-)creates the read-only memory map over our headers file,
+        so that read_header does not need to open/seek/read the file.
+        Falls back to regular file reads if the file cannot be mapped.
+        """
+        self.close_mmap()
+        if self._size == 0:
+            return  # cannot mmap an empty file
+        try:
+            with open(self.path(), 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with open(self.hash_index_path(), 'rb') as f:
+                self._hash_index_mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            self.logger.info(f"cannot mmap headers file, falling back to file reads: {repr(e)}")
+
+    @with_lock
+    def close_mmap(self) -> None:
+        """Releases the memory map. Must be called before the file
+        is truncated, replaced or deleted. (note: read_header falls back
+        to file reads until the next update_size)
+        """
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._hash_index_mmap is not None:
+            self._hash_index_mmap.close()
+            self._hash_index_mmap = None
+
+    @with_lock
+    def hash_index_path(self) -> str:
+        """The hash index is a sidecar of the headers file, storing the
+        block hash of each header (in internal byte order) at delta*HASH_SIZE.
+        All-zero entries are for missing headers.
+        """
+        d = util.get_headers_dir(self.config)
+        return os.path.join(d, 'hash_index', os.path.basename(self.path()))
+
+    @with_lock
+    def _sync_hash_index(self) -> None:
+        """Makes the hash index cover exactly the headers in our file:
+        truncates it, or appends the hashes of headers it does not cover yet.
+        """
+        assert self._hash_index_mmap is None
+        index_path = self.hash_index_path()
+        util.make_dir(os.path.dirname(index_path))
+        index_size = os.path.getsize(index_path) // HASH_SIZE if os.path.exists(index_path) else 0
+        if index_size == self._size and os.path.exists(index_path):
+            return
+        with open(index_path, 'r+b' if os.path.exists(index_path) else 'w+b') as f:
+            if index_size >= self._size:
+                f.truncate(self._size * HASH_SIZE)
+                return
+            f.truncate(index_size * HASH_SIZE)
+            f.seek(index_size * HASH_SIZE)
+            with open(self.path(), 'rb') as headers_file:
+                headers_file.seek(index_size * HEADER_SIZE)
+                delta = index_size
+                while delta < self._size:
+                    data = headers_file.read(min(self._size - delta, 2016) * HEADER_SIZE)
+                    if not data:
+                        break
+                    f.write(self._hash_index_entries(data))
+                    delta += len(data) // HEADER_SIZE
+
+    @classmethod
+    def _hash_index_entries(cls, data: bytes) -> bytes:
+        empty_header = bytes(HEADER_SIZE)
+        entries = []
+        for i in range(0, len(data) - HEADER_SIZE + 1, HEADER_SIZE):
+            raw_header = data[i:i+HEADER_SIZE]
+            entries.append(bytes(HASH_SIZE) if raw_header == empty_header else sha256d(raw_header))
+        return b''.join(entries)
+
+    @with_lock
+    def _write_hash_index(self, delta: int, data: bytes, truncate: bool) -> None:
+        """Updates the hash index for 'data' being written at header 'delta'.
+        Entries past the end of the index are left to _sync_hash_index.
+        """
+        index_path = self.hash_index_path()
+        if not os.path.exists(index_path):
+            return
+        with open(index_path, 'r+b') as f:
+            index_size = os.path.getsize(index_path) // HASH_SIZE
+            if truncate:
+                if index_size > delta:
+                    f.truncate(delta * HASH_SIZE)
+                    # make sure no stale hashes survive a crash before the headers are rewritten
+                    os.fsync(f.fileno())
+                return
+            num = min(len(data) // HEADER_SIZE, index_size - delta)
+            if num > 0:
+                f.seek(delta * HASH_SIZE)
+                f.write(self._hash_index_entries(data[:num * HEADER_SIZE]))
 
     @classmethod
-    def verify_header(cls, header: dict, prev_hash: str, target: int, expected_header_hash: str=None) -> None:
+    def verify_header(cls, header: Mapping, prev_hash: str, target: int, expected_header_hash: str=None,
+                      *, pow_hash: str = None) -> None:
+        """pow_hash, if given, must be the precomputed pow_hash_header(header)."""
         _hash = hash_header(header)
-        _powhash = pow_hash_header(header)
         if expected_header_hash and expected_header_hash != _hash:
             raise InvalidHeader("hash mismatches with expected: {} vs {}".format(expected_header_hash, _hash))
         if prev_hash != header.get('prev_block_hash'):
             raise InvalidHeader("prev hash mismatch: %s vs %s" % (prev_hash, header.get('prev_block_hash')))
         if constants.net.TESTNET:
             return
+        _powhash = pow_hash if pow_hash is not None else pow_hash_header(header)
         target = cls.bits_to_target(header.get('bits'))
         block_hash_as_num = int.from_bytes(bfh(_powhash), byteorder='big')
         if block_hash_as_num > target:
             raise InvalidHeader(f"insufficient proof of work: {block_hash_as_num} vs target {target}")
 
-    def verify_chunk(self, index: int, data: bytes) -> None:
+    def verify_chunk(self, index: int, data: bytes, *, pow_hashes: Sequence[str] = None) -> None:
+        """pow_hashes, if given, must be pow_hash_raw_headers(data)."""
         num = len(data) // HEADER_SIZE
+        if pow_hashes is None and not constants.net.TESTNET:
+            pow_hashes = pow_hash_raw_headers(data[:num*HEADER_SIZE])
+        if pow_hashes is not None and len(pow_hashes) != num:
+            raise Exception(f"unexpected number of PoW hashes: {len(pow_hashes)} != {num}")
         start_height = index * 2016
         prev_hash = self.get_hash(start_height - 1)
         target = self.get_target(index-1)
@@ -330,10 +680,10 @@ class Blockchain(Logger):
                 expected_header_hash = self.get_hash(height)
             except MissingHeader:
                 expected_header_hash = None
-            raw_header = data[i*HEADER_SIZE : (i+1)*HEADER_SIZE]
-            header = deserialize_header(raw_header, index*2016 + i)
-            self.verify_header(header, prev_hash, target, expected_header_hash)
-            prev_hash = hash_header(header)
+            header = BlockHeader(data[i*HEADER_SIZE : (i+1)*HEADER_SIZE], height)
+            pow_hash = pow_hashes[i] if pow_hashes is not None else None
+            self.verify_header(header, prev_hash, target, expected_header_hash, pow_hash=pow_hash)
+            prev_hash = header.hash()
 
     @with_lock
     def path(self):
@@ -416,6 +766,13 @@ class Blockchain(Logger):
             parent_data = f.read(parent_branch_size*HEADER_SIZE)
         self.write(parent_data, 0)
         parent.write(my_data, (forkpoint - parent.forkpoint)*HEADER_SIZE)
+        # the renames below must not become durable before the data they point to
+        self.flush_pending_writes()
+        parent.flush_pending_writes()
+        # the files are about to be renamed; mappings get recreated in update_size
+        self.close_mmap()
+        parent.close_mmap()
+        child_old_index_name = self.hash_index_path()
         # swap parameters
         self.parent, parent.parent = parent.parent, self  # type: Optional[Blockchain], Optional[Blockchain]
         self.forkpoint, parent.forkpoint = parent.forkpoint, self.forkpoint
@@ -423,6 +780,9 @@ class Blockchain(Logger):
         self._prev_hash, parent._prev_hash = parent._prev_hash, self._prev_hash
         # parent's new name
         os.replace(child_old_name, parent.path())
+        os.replace(child_old_index_name, parent.hash_index_path())
+        self._header_cache.clear()
+        parent._header_cache.clear()
         self.update_size()
         parent.update_size()
         # update pointers
@@ -447,47 +807,119 @@ class Blockchain(Logger):
     def write(self, data: bytes, offset: int, truncate: bool=True) -> None:
         filename = self.path()
         self.assert_headers_file_available(filename)
+        # truncating a mapped file would make reads from the map fault
+        self.close_mmap()
+        truncate = truncate and offset != self._size * HEADER_SIZE
+        delta = offset // HEADER_SIZE
+        self._write_hash_index(delta, data, truncate)
         with open(filename, 'rb+') as f:
-            if truncate and offset != self._size * HEADER_SIZE:
+            if truncate:
                 f.seek(offset)
                 f.truncate()
             f.seek(offset)
             f.write(data)
             f.flush()
-            os.fsync(f.fileno())
-        self.update_size()
+            self._unsynced_headers += len(data) // HEADER_SIZE
+            if self._should_fsync():
+                self._fsync(f)
+        for height in [h for h in self._header_cache if h >= self.forkpoint + delta]:
+            del self._header_cache[height]
+        # the file only changed through us, so there is no need to stat it
+        new_size = delta + len(data) // HEADER_SIZE
+        self._size = new_size if truncate else max(self._size, new_size)
+        # Until the next flush, reads go to the file. Remapping, and hashing
+        # the new headers into the index, is done once per group commit.
+        self._maps_stale = True
+        if not self._unsynced_headers:
+            self._refresh_maps()
+
+    def _should_fsync(self) -> bool:
+        every_n = self.config.NETWORK_HEADERS_FSYNC_EVERY_N
+        interval = self.config.NETWORK_HEADERS_FSYNC_INTERVAL_MS / 1000
+        if every_n <= 1 or self._unsynced_headers >= every_n:
+            return True
+        return time.monotonic() - self._last_fsync >= interval
+
+    def _fsync(self, f) -> None:
+        os.fsync(f.fileno())
+        self._unsynced_headers = 0
+        self._last_fsync = time.monotonic()
+
+    @with_lock
+    def flush_pending_writes(self) -> None:
+        """fsync headers that were written but not yet made durable,
+        and make them available to the memory maps and the hash index.
+        """
+        if not self._unsynced_headers:
+            self._refresh_maps()
+            return
+        filename = self.path()
+        if not os.path.exists(filename):
+            self._unsynced_headers = 0
+            return
+        with open(filename, 'rb+') as f:
+            self._fsync(f)
+        self._refresh_maps()
+
+    @with_lock
+    def is_flush_due(self) -> bool:
+        interval = self.config.NETWORK_HEADERS_FSYNC_INTERVAL_MS / 1000
+        return (self._maps_stale or self._unsynced_headers > 0) \
+            and time.monotonic() - self._last_fsync >= interval
 
     @with_lock
-    def save_header(self, header: dict) -> None:
+    def save_header(self, header: Mapping) -> None:
         delta = header.get('block_height') - self.forkpoint
-        data = bfh(serialize_header(header))
+        data = header.raw if isinstance(header, BlockHeader) else bfh(serialize_header(header))
         # headers are only _appended_ to the end:
         assert delta == self.size(), (delta, self.size())
         assert len(data) == HEADER_SIZE
         self.write(data, delta*HEADER_SIZE)
+        if isinstance(header, BlockHeader):
+            self._header_cache[header.block_height] = header
         self.swap_with_parent()
 
     @with_lock
-    def read_header(self, height: int) -> Optional[dict]:
+    def read_header(self, height: int) -> Optional[BlockHeader]:
         if height < 0:
             return
         if height < self.forkpoint:
             return self.parent.read_header(height)
         if height > self.height():
             return
+        header = self._header_cache.get(height)
+        if header is not None:
+            return header
         delta = height - self.forkpoint
-        name = self.path()
-        self.assert_headers_file_available(name)
-        with open(name, 'rb') as f:
-            f.seek(delta * HEADER_SIZE)
-            h = f.read(HEADER_SIZE)
-            if len(h) < HEADER_SIZE:
-                raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
+        if self._mmap is not None:
+            h = self._mmap[delta * HEADER_SIZE:(delta + 1) * HEADER_SIZE]
+        else:
+            name = self.path()
+            self.assert_headers_file_available(name)
+            with open(name, 'rb') as f:
+                f.seek(delta * HEADER_SIZE)
+                h = f.read(HEADER_SIZE)
+        if len(h) < HEADER_SIZE:
+            raise Exception('Expected to read a full header. This was only {} bytes'.format(len(h)))
         if h == bytes([0])*HEADER_SIZE:
             return None
-        return deserialize_header(h, height)
+        header = deserialize_header(h, height)
+        self._header_cache[height] = header
+        return header
 
-    def header_at_tip(self) -> Optional[dict]:
+    @with_lock
+    def _get_hash_from_index(self, height: int) -> Optional[str]:
+        if height < self.forkpoint:
+            return self.parent._get_hash_from_index(height)
+        if height > self.height() or self._hash_index_mmap is None:
+            return None
+        delta = height - self.forkpoint
+        h = self._hash_index_mmap[delta * HASH_SIZE:(delta + 1) * HASH_SIZE]
+        if len(h) < HASH_SIZE or h == bytes(HASH_SIZE):
+            return None
+        return hash_encode(h)
+
+    def header_at_tip(self) -> Optional[BlockHeader]:
         """Return latest header."""
         height = self.height()
         return self.read_header(height)
@@ -521,6 +953,9 @@ class Blockchain(Logger):
             h, t = self.checkpoints[index]
             return h
         else:
+            header_hash = self._get_hash_from_index(height)
+            if header_hash is not None:
+                return header_hash
             header = self.read_header(height)
             if header is None:
                 raise MissingHeader(height)
@@ -598,6 +1033,7 @@ class Blockchain(Logger):
 
     @with_lock
     def get_chainwork(self, height=None) -> int:
+        global _chainwork_cache_dirty
         if height is None:
             height = max(0, self.height())
         if constants.net.TESTNET:
@@ -618,12 +1054,13 @@ class Blockchain(Logger):
             work_in_chunk = 2016 * work_in_single_header
             running_total += work_in_chunk
             _CHAINWORK_CACHE[self.get_hash(cached_height)] = running_total
+            _chainwork_cache_dirty = True
         cached_height += 2016
         work_in_single_header = self.chainwork_of_header_at_height(cached_height)
         work_in_last_partial_chunk = (height % 2016 + 1) * work_in_single_header
         return running_total + work_in_last_partial_chunk
 
-    def can_connect(self, header: dict, check_height: bool=True) -> bool:
+    def can_connect(self, header: Mapping, check_height: bool=True) -> bool:
         if header is None:
             return False
         height = header['block_height']
@@ -647,11 +1084,11 @@ class Blockchain(Logger):
             return False
         return True
 
-    def connect_chunk(self, idx: int, hexdata: str) -> bool:
+    def connect_chunk(self, idx: int, hexdata: str, *, pow_hashes: Sequence[str] = None) -> bool:
         assert idx >= 0, idx
         try:
             data = bfh(hexdata)
-            self.verify_chunk(idx, data)
+            self.verify_chunk(idx, data, pow_hashes=pow_hashes)
             self.save_chunk(idx, data)
             return True
         except BaseException as e:
@@ -669,9 +1106,9 @@ class Blockchain(Logger):
         return cp
 
 
-def check_header(header: dict) -> Optional[Blockchain]:
+def check_header(header: Mapping) -> Optional[Blockchain]:
     """Returns any Blockchain that contains header, or None."""
-    if type(header) is not dict:
+    if type(header) not in (dict, BlockHeader):
         return None
     with blockchains_lock: chains = list(blockchains.values())
     for b in chains:
@@ -680,7 +1117,7 @@ def check_header(header: dict) -> Optional[Blockchain]:
     return None
 
 
-def can_connect(header: dict) -> Optional[Blockchain]:
+def can_connect(header: Mapping) -> Optional[Blockchain]:
     """Returns the Blockchain that has a tip that directly links up
     with header, or None.
     """
@@ -698,3 +1135,90 @@ def get_chains_that_contain_header(height: int, header_hash: str) -> Sequence[Bl
               if chain.check_hash(height=height, header_hash=header_hash)]
     chains = sorted(chains, key=lambda x: x.get_chainwork(), reverse=True)
     return chains
+
+
+# headers snapshot file:
+#   magic | version (u8) | genesis hash (32 bytes) | number of headers (u32) | sha256 of headers (32 bytes)
+#   followed by the zlib-compressed raw headers, starting at height 0
+HEADERS_SNAPSHOT_MAGIC = b'ELHDRSNP'
+HEADERS_SNAPSHOT_VERSION = 1
+_HEADERS_SNAPSHOT_PREAMBLE = struct.Struct('<8sB32sI32s')
+
+
+class InvalidHeadersSnapshot(Exception):
+    pass
+
+
+def export_headers_snapshot(path: str) -> int:
+    """Writes the headers of the best chain to a snapshot file at path.
+    Returns the number of headers exported.
+    """
+    chain = get_best_chain()
+    with chain.lock:
+        num_headers = chain.size()
+        with open(chain.path(), 'rb') as f:
+            data = f.read(num_headers * HEADER_SIZE)
+    empty_header = bytes(HEADER_SIZE)
+    for i in range(0, len(data), HEADER_SIZE):
+        if data[i:i+HEADER_SIZE] == empty_header:
+            raise MissingHeader(i // HEADER_SIZE)
+    preamble = _HEADERS_SNAPSHOT_PREAMBLE.pack(
+        HEADERS_SNAPSHOT_MAGIC, HEADERS_SNAPSHOT_VERSION,
+        bytes.fromhex(constants.net.GENESIS)[::-1], num_headers, sha256(data))
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(preamble)
+        f.write(zlib.compress(data, 9))
+    os.replace(tmp_path, path)
+    return num_headers
+
+
+def read_headers_snapshot(path: str) -> bytes:
+    """Returns the raw headers stored in a snapshot file, after checking
+    that the file is intact, is for our network, and matches our checkpoints.
+    Note: the headers themselves are not verified here.
+    """
+    with open(path, 'rb') as f:
+        blob = f.read()
+    if len(blob) < _HEADERS_SNAPSHOT_PREAMBLE.size:
+        raise InvalidHeadersSnapshot('file too short')
+    magic, version, genesis, num_headers, checksum = _HEADERS_SNAPSHOT_PREAMBLE.unpack_from(blob)
+    if magic != HEADERS_SNAPSHOT_MAGIC:
+        raise InvalidHeadersSnapshot('not a headers snapshot')
+    if version != HEADERS_SNAPSHOT_VERSION:
+        raise InvalidHeadersSnapshot(f'unsupported snapshot version: {version}')
+    if hash_encode(genesis) != constants.net.GENESIS:
+        raise InvalidHeadersSnapshot('snapshot is for a different network')
+    try:
+        data = zlib.decompress(blob[_HEADERS_SNAPSHOT_PREAMBLE.size:])
+    except zlib.error as e:
+        raise InvalidHeadersSnapshot(f'cannot decompress snapshot: {e!r}') from e
+    if len(data) != num_headers * HEADER_SIZE or sha256(data) != checksum:
+        raise InvalidHeadersSnapshot('checksum mismatch')
+    for index, (cp_hash, _target) in enumerate(constants.net.CHECKPOINTS):
+        height = (index + 1) * 2016 - 1
+        if height >= num_headers:
+            break
+        raw_header = data[height*HEADER_SIZE:(height+1)*HEADER_SIZE]
+        if hash_encode(sha256d(raw_header)) != cp_hash:
+            raise InvalidHeadersSnapshot(f'snapshot conflicts with checkpoint at height {height}')
+    return data
+
+
+async def import_headers_snapshot(path: str, *, num_workers: int = None) -> int:
+    """Verifies the headers in a snapshot file and saves the ones our
+    best chain does not have yet. Returns the number of headers imported.
+    """
+    data = read_headers_snapshot(path)
+    num_headers = len(data) // HEADER_SIZE
+    chain = get_best_chain()
+    first_index = (chain.height() + 1) // 2016
+    num_imported = 0
+    for index in range(first_index, -(-num_headers // 2016)):
+        chunk = data[index*2016*HEADER_SIZE:(index+1)*2016*HEADER_SIZE]
+        pow_hashes = await pow_hash_chunk(chunk, num_workers=num_workers)
+        height_before = chain.height()
+        if not chain.connect_chunk(index, chunk.hex(), pow_hashes=pow_hashes):
+            raise InvalidHeadersSnapshot(f'chunk {index} of snapshot does not connect to our chain')
+        num_imported += max(0, chain.height() - height_before)
+    return num_imported
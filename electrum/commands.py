@@ -68,6 +68,7 @@ from . import GuiImportError
 from . import crypto
 from . import constants
 from . import descriptor
+from . import blockchain
 
 if TYPE_CHECKING:
     from .network import Network
@@ -591,6 +592,31 @@ class Commands:
         """Return the list of known servers (candidates for connecting)."""
         return self.network.get_servers()
 
+    @command('n')
+    async def getserverstats(self):
+        """Return request statistics for the servers we have been connected to:
+        latency histograms, traffic and error counts per RPC method."""
+        return self.network.get_server_stats()
+
+    @command('n')
+    async def export_headers(self, filename):
+        """Export the block headers of the best chain to a compressed snapshot file.
+        The snapshot can be used with import_headers to bootstrap another instance."""
+        num_headers = blockchain.export_headers_snapshot(filename)
+        return {'path': filename, 'num_headers': num_headers}
+
+    @command('n')
+    async def import_headers(self, filename):
+        """Import block headers from a snapshot file created by export_headers.
+        The snapshot is checked against our checkpoints, and all headers are
+        verified before being saved."""
+        async with self.network.bhi_lock:
+            num_headers = await blockchain.import_headers_snapshot(
+                filename, num_workers=self.config.NETWORK_HEADERS_POW_WORKERS)
+        util.trigger_callback('blockchain_updated')
+        util.trigger_callback('network_updated')
+        return {'num_headers': num_headers, 'height': self.network.get_local_height()}
+
     @command('')
     async def version(self):
         """Return the version of Electrum."""
@@ -672,6 +698,21 @@ class Commands:
             out = "Error: " + repr(e)
         return out
 
+    @command('w')
+    async def importaddresses(self, filename, wallet: Abstract_Wallet = None):
+        """Import watch-only addresses from a file, separated by whitespace or newlines.
+        Large files are imported in chunks; the wallet then subscribes to the
+        addresses gradually, see the synchronization progress."""
+        if not wallet.can_import_address():
+            return "Error: This type of wallet cannot import addresses."
+        def on_progress(num_imported, num_rejected):
+            wallet.logger.info(f"importaddresses: {num_imported} imported, {num_rejected} rejected")
+        num_imported, bad_addr = await wallet.import_addresses_from_file(filename, progress_callback=on_progress)
+        return {
+            'imported': num_imported,
+            'rejected': [{'address': addr, 'reason': reason} for addr, reason in bad_addr],
+        }
+
     def _resolver(self, x, wallet):
         if x is None:
             return None
@@ -775,13 +816,24 @@ class Commands:
 
     @command('w')
     async def onchain_history(self, year=None, show_addresses=False, show_fiat=False, wallet: Abstract_Wallet = None,
-                              from_height=None, to_height=None):
-        """Wallet onchain history. Returns the transaction history of your wallet."""
+                              from_height=None, to_height=None, limit=None, cursor=None):
+        """Wallet onchain history. Returns the transaction history of your wallet.
+        If limit or cursor is set, returns one page of transactions, without summary,
+        and the cursor of the next page.
+        """
         kwargs = {
             'show_addresses': show_addresses,
             'from_height': from_height,
             'to_height': to_height,
         }
+        paginated = limit is not None or cursor is not None
+        if paginated:
+            if year:
+                raise Exception('year cannot be used with pagination')
+            if limit is not None and limit <= 0:
+                raise Exception('limit must be positive')
+            kwargs['limit'] = limit
+            kwargs['cursor'] = cursor
         if year:
             import time
             start_date = datetime.datetime(year, 1, 1)
@@ -792,6 +844,8 @@ class Commands:
             from .exchange_rate import FxThread
             kwargs['fx'] = self.daemon.fx if self.daemon else FxThread(config=self.config)
 
+        if paginated:
+            return json_normalize(wallet.get_detailed_history_page(**kwargs))
         return json_normalize(wallet.get_detailed_history(**kwargs))
 
     @command('wp')
@@ -1404,6 +1458,7 @@ param_descriptions = {
     'pos': 'Position',
     'height': 'Block height',
     'tx': 'Serialized transaction (hexadecimal)',
+    'filename': 'Path to the file',
     'key': 'Variable name',
     'pubkey': 'Public key',
     'message': 'Clear text message. Use quotes if it contains spaces.',
@@ -1459,6 +1514,8 @@ command_options = {
     'year':        (None, "Show history for a given year"),
     'from_height': (None, "Only show transactions that confirmed after given block height"),
     'to_height':   (None, "Only show transactions that confirmed before given block height"),
+    'limit':       (None, "Maximum number of transactions to return"),
+    'cursor':      (None, "Return transactions after this cursor (next_cursor of the previous page)"),
     'iknowwhatimdoing': (None, "Acknowledge that I understand the full implications of what I am about to do"),
     'gossip':      (None, "Apply command to gossip node instead of wallet"),
     'connection_string':      (None, "Lightning network node ID or network address"),
@@ -1481,6 +1538,7 @@ arg_types = {
     'year': int,
     'from_height': int,
     'to_height': int,
+    'limit': int,
     'tx': convert_raw_tx_to_hex,
     'pubkeys': json_loads,
     'jsontx': json_loads,
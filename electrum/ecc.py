@@ -26,7 +26,7 @@
 import base64
 import hashlib
 import functools
-from typing import Union, Tuple, Optional
+from typing import Union, Tuple, Optional, Sequence, List
 from ctypes import (
     byref, c_byte, c_int, c_uint, c_char_p, c_size_t, c_void_p, create_string_buffer,
     CFUNCTYPE, POINTER, cast
@@ -36,7 +36,7 @@ from .util import bfh, assert_bytes, to_bytes, InvalidPassword, profiler, randra
 from .crypto import (sha256d, aes_encrypt_with_iv, aes_decrypt_with_iv, hmac_oneshot)
 from . import constants
 from .logging import get_logger
-from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED
+from .ecc_fast import _libsecp256k1, SECP256K1_EC_UNCOMPRESSED, SECP256K1_EC_COMPRESSED
 
 _logger = get_logger(__name__)
 
@@ -274,6 +274,31 @@ class ECPubkey(object):
     def __rmul__(self, other: int):
         return self * other
 
+    def add_tweaks(self, tweaks: Sequence[bytes]) -> List[Optional[bytes]]:
+        """Returns the compressed public key self + t*G for each 32-byte tweak t.
+        Items are None if t is not below the curve order, or the sum is the point at infinity.
+        The point is parsed only once, which makes this much faster than
+        ECPrivkey(t) + self in a loop.
+        """
+        if self.is_at_infinity():
+            raise InvalidECPointException('point is at infinity')
+        parent = self._to_libsecp256k1_pubkey_ptr()
+        pubkey = create_string_buffer(64)
+        pubkey_serialized = create_string_buffer(33)
+        pubkey_size = c_size_t(33)
+        results = []
+        for tweak in tweaks:
+            assert len(tweak) == 32, len(tweak)
+            pubkey.raw = parent.raw
+            if not _libsecp256k1.secp256k1_ec_pubkey_tweak_add(_libsecp256k1.ctx, pubkey, tweak):
+                results.append(None)
+                continue
+            pubkey_size.value = 33
+            _libsecp256k1.secp256k1_ec_pubkey_serialize(
+                _libsecp256k1.ctx, pubkey_serialized, byref(pubkey_size), pubkey, SECP256K1_EC_COMPRESSED)
+            results.append(pubkey_serialized.raw)
+        return results
+
     def __add__(self, other):
         if not isinstance(other, ECPubkey):
             raise TypeError('addition not defined for ECPubkey and {}'.format(type(other)))
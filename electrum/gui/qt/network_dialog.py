@@ -102,7 +102,7 @@ class NodesListWidget(QTreeWidget):
 
     def __init__(self):
         QTreeWidget.__init__(self)
-        self.setHeaderLabels([_('Server'), _('Height')])
+        self.setHeaderLabels([_('Server'), _('Height'), _('Latency')])
         self.setContextMenuPolicy(Qt.CustomContextMenu)
         self.customContextMenuRequested.connect(self.create_menu)
 
@@ -149,7 +149,7 @@ class NodesListWidget(QTreeWidget):
         use_tor = bool(network.is_proxy_tor)
 
         # connected servers
-        connected_servers_item = QTreeWidgetItem([_("Connected nodes"), ''])
+        connected_servers_item = QTreeWidgetItem([_("Connected nodes"), '', ''])
         connected_servers_item.setData(0, self.ITEMTYPE_ROLE, self.ItemType.TOPLEVEL)
         chains = network.get_blockchains()
         n_chains = len(chains)
@@ -159,13 +159,15 @@ class NodesListWidget(QTreeWidget):
                 continue
             name = b.get_name()
             if n_chains > 1:
-                x = QTreeWidgetItem([name + '@%d'%b.get_max_forkpoint(), '%d'%b.height()])
+                x = QTreeWidgetItem([name + '@%d'%b.get_max_forkpoint(), '%d'%b.height(), ''])
                 x.setData(0, self.ITEMTYPE_ROLE, self.ItemType.CHAIN)
                 x.setData(0, self.CHAIN_ID_ROLE, b.get_id())
             else:
                 x = connected_servers_item
             for i in interfaces:
-                item = QTreeWidgetItem([f"{i.server.to_friendly_name()}", '%d'%i.tip])
+                latency = network.get_server_latency(i.server)
+                latency_str = f"{1000 * latency:.0f} ms" if latency is not None else ''
+                item = QTreeWidgetItem([f"{i.server.to_friendly_name()}", '%d'%i.tip, latency_str])
                 item.setData(0, self.ITEMTYPE_ROLE, self.ItemType.CONNECTED_SERVER)
                 item.setData(0, self.SERVER_ADDR_ROLE, i.server)
                 item.setToolTip(0, str(i.server))
@@ -176,7 +178,7 @@ class NodesListWidget(QTreeWidget):
                 connected_servers_item.addChild(x)
 
         # disconnected servers
-        disconnected_servers_item = QTreeWidgetItem([_("Other known servers"), ""])
+        disconnected_servers_item = QTreeWidgetItem([_("Other known servers"), "", ""])
         disconnected_servers_item.setData(0, self.ITEMTYPE_ROLE, self.ItemType.TOPLEVEL)
         connected_hosts = set([iface.host for ifaces in chains.values() for iface in ifaces])
         protocol = PREFERRED_NETWORK_PROTOCOL
@@ -188,7 +190,7 @@ class NodesListWidget(QTreeWidget):
             port = d.get(protocol)
             if port:
                 server = ServerAddr(_host, port, protocol=protocol)
-                item = QTreeWidgetItem([server.net_addr_str(), ""])
+                item = QTreeWidgetItem([server.net_addr_str(), "", ""])
                 item.setData(0, self.ITEMTYPE_ROLE, self.ItemType.DISCONNECTED_SERVER)
                 item.setData(0, self.SERVER_ADDR_ROLE, server)
                 disconnected_servers_item.addChild(item)
@@ -206,6 +208,7 @@ class NodesListWidget(QTreeWidget):
         h.setStretchLastSection(False)
         h.setSectionResizeMode(0, QHeaderView.Stretch)
         h.setSectionResizeMode(1, QHeaderView.ResizeToContents)
+        h.setSectionResizeMode(2, QHeaderView.ResizeToContents)
 
         super().update()
 
@@ -23,6 +23,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import os
+import time
 import re
 import ssl
 import sys
@@ -30,7 +31,7 @@ import traceback
 import asyncio
 import socket
 from typing import Tuple, Union, List, TYPE_CHECKING, Optional, Set, NamedTuple, Any, Sequence, Dict
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 from ipaddress import IPv4Network, IPv6Network, ip_address, IPv6Address, IPv4Address
 import itertools
 import logging
@@ -130,15 +131,39 @@ def assert_list_or_tuple(val: Any) -> None:
 
 
 class NotificationSession(RPCSession):
+    """Session to a server. Subscriptions are shared by everyone using the
+    session (e.g. all wallets of the daemon on the main interface): a
+    subscription is requested from the server once, its notifications are
+    fanned out to the queue of each subscriber, and it is dropped once
+    the last subscriber unsubscribes.
+    """
+
+    # subscription methods that can be undone on the server (protocol 1.4.2+)
+    UNSUBSCRIBE_METHODS = {
+        'blockchain.scripthash.subscribe': 'blockchain.scripthash.unsubscribe',
+    }
+    # late notifications are only expected shortly after unsubscribing,
+    # we remember that many of the most recently undone subscriptions:
+    MAX_UNSUBSCRIBED_KEYS = 1000
 
     def __init__(self, *args, interface: 'Interface', **kwargs):
         super(NotificationSession, self).__init__(*args, **kwargs)
         self.subscriptions = defaultdict(list)
         self.cache = {}
+        self._subscription_requests = {}  # type: Dict[str, Tuple[str, List]]  # key -> (method, params)
+        self._pending_subscriptions = {}  # type: Dict[str, asyncio.Future]
+        self._pending_unsubscriptions = {}  # type: Dict[str, asyncio.Future]
+        self._unsubscribed_keys = OrderedDict()  # type: Dict[str, None]  # late notifications for these are ignored
+        self._server_can_unsubscribe = True
         self.default_timeout = NetworkTimeout.Generic.NORMAL
         self._msg_counter = itertools.count(start=1)
         self.interface = interface
         self.cost_hard_limit = 0  # disable aiorpcx resource limits
+        config = interface.network.config
+        self.batcher = RequestBatcher(
+            self,
+            max_size=config.NETWORK_BATCH_MAX_SIZE,
+            latency=config.NETWORK_BATCH_LATENCY_MS / 1000)
 
     async def handle_request(self, request):
         self.maybe_log(f"--> {request}")
@@ -150,6 +175,8 @@ class NotificationSession(RPCSession):
                     self.cache[key] = result
                     for queue in self.subscriptions[key]:
                         await queue.put(request.args)
+                elif key in self._unsubscribed_keys:
+                    pass  # sent before the server processed our unsubscription
                 else:
                     raise Exception(f'unexpected notification')
             else:
@@ -158,11 +185,19 @@ class NotificationSession(RPCSession):
             self.interface.logger.info(f"error handling request {request}. exc: {repr(e)}")
             await self.close()
 
+    async def connection_lost(self):
+        await super().connection_lost()
+        # sizes of the framed messages, as counted by aiorpcx
+        self.interface.stats.bytes_sent += self.send_size
+        self.interface.stats.bytes_received += self.recv_size
+
     async def send_request(self, *args, timeout=None, **kwargs):
         # note: semaphores/timeouts/backpressure etc are handled by
         # aiorpcx. the timeout arg here in most cases should not be set
         msg_id = next(self._msg_counter)
         self.maybe_log(f"<-- {args} {kwargs} (id: {msg_id})")
+        method = args[0]
+        start = time.monotonic()
         try:
             # note: RPCSession.send_request raises TaskTimeout in case of a timeout.
             # TaskTimeout is a subclass of CancelledError, which is *suppressed* in TaskGroups
@@ -170,37 +205,113 @@ class NotificationSession(RPCSession):
                 super().send_request(*args, **kwargs),
                 timeout)
         except (TaskTimeout, asyncio.TimeoutError) as e:
+            self.interface.stats.record(method, time.monotonic() - start, error=True)
             raise RequestTimedOut(f'request timed out: {args} (id: {msg_id})') from e
         except CodeMessageError as e:
+            self.interface.stats.record(method, time.monotonic() - start, error=True)
             self.maybe_log(f"--> {repr(e)} (id: {msg_id})")
             raise
         else:
+            self.interface.stats.record(method, time.monotonic() - start)
             self.maybe_log(f"--> {response} (id: {msg_id})")
             return response
 
+    async def send_request_batched(self, method: str, params: Sequence, *, timeout=None):
+        """Like send_request, but the request might be sent to the server
+        as part of a JSON-RPC batch together with other concurrent requests.
+        """
+        return await self.batcher.send_request(method, params, timeout=timeout)
+
     def set_default_timeout(self, timeout):
         self.sent_request_timeout = timeout
         self.max_send_delay = timeout
 
     async def subscribe(self, method: str, params: List, queue: asyncio.Queue):
-        # note: until the cache is written for the first time,
-        # each 'subscribe' call might make a request on the network.
+        # note: concurrent 'subscribe' calls for the same method and params
+        #       share a single request on the network.
         key = self.get_hashable_key_for_rpc_call(method, params)
         self.subscriptions[key].append(queue)
+        self._subscription_requests[key] = (method, params)
         if key in self.cache:
             result = self.cache[key]
         else:
-            result = await self.send_request(method, params)
-            self.cache[key] = result
+            fut = self._pending_subscriptions.get(key)
+            if fut is None:
+                fut = asyncio.ensure_future(self._send_subscription(
+                    key, method, params, self._pending_unsubscriptions.get(key)))
+                self._pending_subscriptions[key] = fut
+                fut.add_done_callback(lambda f: self._on_subscription_done(key, f))
+            result = await asyncio.shield(fut)
         await queue.put(params + [result])
 
+    def is_subscribed(self, method: str, params: List) -> bool:
+        """Whether 'subscribe' would be answered from the cache, without a request."""
+        return self.get_hashable_key_for_rpc_call(method, params) in self.cache
+
+    async def _send_subscription(
+            self, key: str, method: str, params: List,
+            pending_unsubscription: Optional[asyncio.Future],
+    ):
+        if pending_unsubscription is not None:
+            await asyncio.wait([pending_unsubscription])
+        self._unsubscribed_keys.pop(key, None)
+        result = await self.send_request_batched(method, params)
+        if self.subscriptions.get(key) and key not in self._pending_unsubscriptions:
+            self.cache[key] = result
+        return result
+
+    def _on_subscription_done(self, key: str, fut: asyncio.Future) -> None:
+        if self._pending_subscriptions.get(key) is fut:
+            del self._pending_subscriptions[key]
+
     def unsubscribe(self, queue):
-        """Unsubscribe a callback to free object references to enable GC."""
-        # note: we can't unsubscribe from the server, so we keep receiving
-        # subsequent notifications
-        for v in self.subscriptions.values():
-            if queue in v:
-                v.remove(queue)
+        """Unsubscribe a callback to free object references to enable GC.
+        Subscriptions left without subscribers are also undone on the server,
+        if it supports that; otherwise we keep receiving their notifications.
+        """
+        for key, queues in list(self.subscriptions.items()):
+            if queue not in queues:
+                continue
+            queues[:] = [q for q in queues if q is not queue]
+            if not queues:
+                self._maybe_unsubscribe_from_server(key)
+
+    def _maybe_unsubscribe_from_server(self, key: str) -> None:
+        method, params = self._subscription_requests[key]
+        unsubscribe_method = self.UNSUBSCRIBE_METHODS.get(method)
+        if unsubscribe_method is None or not self._server_can_unsubscribe:
+            return
+        del self.subscriptions[key]
+        del self._subscription_requests[key]
+        self.cache.pop(key, None)
+        self._unsubscribed_keys[key] = None
+        self._unsubscribed_keys.move_to_end(key)
+        while len(self._unsubscribed_keys) > self.MAX_UNSUBSCRIBED_KEYS:
+            self._unsubscribed_keys.popitem(last=False)
+        # a subscription still in flight is about to be undone on the server, so it
+        # must not be shared: new subscribers subscribe again after the unsubscription
+        pending_subscription = self._pending_subscriptions.pop(key, None)
+        fut = asyncio.ensure_future(self._send_unsubscription(
+            key, unsubscribe_method, params, pending_subscription))
+        self._pending_unsubscriptions[key] = fut
+
+    async def _send_unsubscription(
+            self, key: str, method: str, params: List,
+            pending_subscription: Optional[asyncio.Future],
+    ) -> None:
+        try:
+            if pending_subscription is not None:
+                await asyncio.wait([pending_subscription])
+            await self.send_request_batched(method, params)
+        except CodeMessageError as e:
+            if e.code == JSONRPC.METHOD_NOT_FOUND:
+                self._server_can_unsubscribe = False
+            self.maybe_log(f"unsubscribing failed: {e!r}")
+        except Exception as e:
+            self.maybe_log(f"unsubscribing failed: {e!r}")
+        finally:
+            if self._pending_unsubscriptions.get(key) is asyncio.current_task():
+                del self._pending_unsubscriptions[key]
 
     @classmethod
     def get_hashable_key_for_rpc_call(cls, method, params):
@@ -232,6 +343,191 @@ class NotificationSession(RPCSession):
         await super().close(force_after=force_after)
 
 
+class MethodStats:
+    """Counters for one RPC method on one server."""
+
+    __slots__ = ('count', 'errors', 'latency_sum', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.latency_sum = 0.0
+        self.histogram = [0] * (len(ServerStats.LATENCY_BUCKETS_MS) + 1)
+
+    def to_dict(self) -> dict:
+        buckets = [f"<{ms}ms" for ms in ServerStats.LATENCY_BUCKETS_MS]
+        buckets.append(f">={ServerStats.LATENCY_BUCKETS_MS[-1]}ms")
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean_latency_ms': round(1000 * self.latency_sum / self.count) if self.count else None,
+            'latency_histogram': dict(zip(buckets, self.histogram)),
+        }
+
+
+class ServerStats:
+    """Latency, traffic and error statistics for requests to a server.
+    Kept by Network per server, so they survive reconnects.
+    """
+
+    LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+    # Only cheap requests, that every interface makes, feed the latency score.
+    # Otherwise the main server would look slow just because it serves the wallet.
+    SCORED_METHODS = {
+        'server.version', 'server.ping', 'blockchain.estimatefee',
+        'blockchain.block.header', 'blockchain.headers.subscribe',
+    }
+    MIN_SCORED_SAMPLES = 5
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self):
+        self.methods = defaultdict(MethodStats)  # type: Dict[str, MethodStats]
+        self.bytes_sent = 0  # by past sessions
+        self.bytes_received = 0
+        self._latency = None  # type: Optional[float]  # smoothed, in seconds
+        self._num_scored_samples = 0
+
+    def record(self, method: str, latency: float, *, error: bool = False) -> None:
+        m = self.methods[method]
+        m.count += 1
+        m.errors += bool(error)
+        m.latency_sum += latency
+        latency_ms = 1000 * latency
+        bucket = next((i for i, ms in enumerate(self.LATENCY_BUCKETS_MS) if latency_ms < ms),
+                      len(self.LATENCY_BUCKETS_MS))
+        m.histogram[bucket] += 1
+        if method in self.SCORED_METHODS:
+            self._num_scored_samples += 1
+            if self._latency is None:
+                self._latency = latency
+            else:
+                self._latency += self.LATENCY_SMOOTHING * (latency - self._latency)
+
+    def get_latency(self) -> Optional[float]:
+        """Smoothed latency in seconds, or None if we do not know enough yet."""
+        if self._num_scored_samples < self.MIN_SCORED_SAMPLES:
+            return None
+        return self._latency
+
+    def to_dict(self) -> dict:
+        latency = self.get_latency()
+        return {
+            'latency_ms': round(1000 * latency) if latency is not None else None,
+            'requests': sum(m.count for m in self.methods.values()),
+            'errors': sum(m.errors for m in self.methods.values()),
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'methods': {method: m.to_dict() for method, m in sorted(self.methods.items())},
+        }
+
+
+class RequestBatcher:
+    """Coalesces concurrent requests on a session into JSON-RPC batches.
+
+    Requests are held back for up to 'latency' seconds, or until 'max_size'
+    of them are waiting, and are then sent as a single batch.
+    If the server cannot handle batches, requests are sent one by one.
+    """
+
+    def __init__(self, session: 'NotificationSession', *, max_size: int, latency: float):
+        self.session = session
+        self.max_size = max_size
+        self.latency = latency
+        self.batches_supported = True
+        self._pending = []  # type: List[Tuple[str, Sequence, asyncio.Future]]
+        self._flush_handle = None  # type: Optional[asyncio.TimerHandle]
+        self._tasks = set()  # type: Set[asyncio.Task]
+
+    def is_enabled(self) -> bool:
+        return self.max_size > 1 and self.batches_supported
+
+    async def send_request(self, method: str, params: Sequence, *, timeout=None):
+        if not self.is_enabled():
+            return await self.session.send_request(method, params, timeout=timeout)
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((method, params, fut))
+        if len(self._pending) >= self.max_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.latency, self._flush)
+        try:
+            return await util.wait_for2(fut, timeout)
+        except asyncio.TimeoutError as e:
+            raise RequestTimedOut(f'request timed out: {method} {params}') from e
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        task = asyncio.create_task(self._send_batch(pending))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_batch(self, pending: Sequence[Tuple[str, Sequence, asyncio.Future]]) -> None:
+        try:
+            if len(pending) == 1 or not self.batches_supported:
+                await asyncio.gather(*[self._send_single(*item) for item in pending])
+                return
+            self.session.maybe_log(f"<-- batch of {len(pending)} requests")
+            start = time.monotonic()
+            try:
+                async with self.session.send_batch() as batch:
+                    for method, params, fut in pending:
+                        batch.add_request(method, params)
+            except (TaskTimeout, asyncio.TimeoutError) as e:
+                # some servers silently drop batches. stop batching on this session
+                self.session.interface.logger.info(
+                    "batch request timed out. falling back to single requests")
+                self.batches_supported = False
+                await asyncio.gather(*[self._send_single(*item) for item in pending])
+                return
+            except CodeMessageError as e:
+                # the batch as a whole was rejected. unless it was just too large,
+                # assume the server does not support batches at all
+                if e.code != JSONRPC.EXCESSIVE_RESOURCE_USAGE:
+                    self.session.interface.logger.info(
+                        f"batch request failed: {e!r}. falling back to single requests")
+                    self.batches_supported = False
+                await asyncio.gather(*[self._send_single(*item) for item in pending])
+                return
+            except Exception as e:
+                for method, params, fut in pending:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            latency = time.monotonic() - start
+            for (method, params, fut), result in zip(pending, batch.results):
+                is_error = isinstance(result, Exception)
+                self.session.interface.stats.record(method, latency, error=is_error)
+                if fut.done():
+                    continue
+                if is_error:
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
+        finally:
+            # e.g. if we got cancelled as the session is closing
+            for method, params, fut in pending:
+                if not fut.done():
+                    fut.cancel()
+
+    async def _send_single(self, method: str, params: Sequence, fut: asyncio.Future) -> None:
+        if fut.done():
+            return
+        try:
+            result = await self.session.send_request(method, params)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+
+
 class NetworkException(Exception): pass
 
 
@@ -379,6 +675,8 @@ class Interface(Logger):
         self.cert_path = _get_cert_path_for_host(config=network.config, host=self.host)
         self.blockchain = None  # type: Optional[Blockchain]
         self._requested_chunks = set()  # type: Set[int]
+        self.num_fanout_fetches = 0  # see Network.fetch_from_any_interface
+        self.stats = ServerStats()  # note: Network replaces this with the stats it keeps for the server
         self.network = network
         self.session = None  # type: Optional[NotificationSession]
         self._ipaddr_bucket = None
@@ -631,15 +929,27 @@ class Interface(Logger):
         if can_return_early and index in self._requested_chunks:
             return
         self.logger.info(f"requesting chunk from height {height}")
-        size = 2016
-        if tip is not None:
-            size = min(size, tip - index * 2016 + 1)
-            size = max(size, 0)
+        size = self._get_chunk_size(index, tip)
         try:
             self._requested_chunks.add(index)
-            res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
+            hexdata = await self._fetch_chunk(index, size)
         finally:
             self._requested_chunks.discard(index)
+        return await self._connect_chunk(index, hexdata)
+
+    @classmethod
+    def _get_chunk_size(cls, index: int, tip: Optional[int]) -> int:
+        size = 2016
+        if tip is not None:
+            size = min(size, tip - index * 2016 + 1)
+            size = max(size, 0)
+        return size
+
+    async def _fetch_chunk(self, index: int, size: int) -> str:
+        """Requests 'size' headers starting at chunk 'index', and returns them as hex.
+        Only the format of the response is checked here, not the headers themselves.
+        """
+        res = await self.session.send_request('blockchain.block.headers', [index * 2016, size])
         assert_dict_contains_field(res, field_name='count')
         assert_dict_contains_field(res, field_name='hex')
         assert_dict_contains_field(res, field_name='max')
@@ -653,10 +963,74 @@ class Interface(Logger):
             raise RequestCorrupted(f"server uses too low 'max' count for block.headers: {res['max']} < 2016")
         if res['count'] != size:
             raise RequestCorrupted(f"expected {size} headers but only got {res['count']}")
-        conn = self.blockchain.connect_chunk(index, res['hex'])
+        return res['hex']
+
+    async def _connect_chunk(self, index: int, hexdata: str) -> Tuple[bool, int]:
+        # scrypt is expensive: hash in worker processes, keep the sequential checks here
+        pow_hashes = await blockchain.pow_hash_chunk(
+            bfh(hexdata), num_workers=self.network.config.NETWORK_HEADERS_POW_WORKERS)
+        conn = self.blockchain.connect_chunk(index, hexdata, pow_hashes=pow_hashes)
         if not conn:
             return conn, 0
-        return conn, res['count']
+        return conn, len(hexdata) // (HEADER_SIZE * 2)
+
+    async def _request_chunk_pipelined(
+            self, height: int, tip: int, prefetched: Dict[int, asyncio.Task]) -> Tuple[bool, int]:
+        """Like request_chunk, but also keeps requests for the following chunks in flight,
+        up to a window of NETWORK_HEADERS_PIPELINE_WINDOW chunks. 'prefetched' maps
+        chunk index -> fetch task, and is owned by the caller across calls.
+        Chunks are still verified and saved strictly in order.
+        """
+        index = height // 2016
+        window = max(1, self.network.config.NETWORK_HEADERS_PIPELINE_WINDOW)
+        for stale_index in [i for i in prefetched if i < index]:
+            self._cancel_prefetched_chunk(prefetched.pop(stale_index))
+        for i in range(index, min(index + window, tip // 2016 + 1)):
+            if i not in prefetched:
+                prefetched[i] = asyncio.create_task(self._fetch_chunk_for_pipeline(i, self._get_chunk_size(i, tip)))
+        self.logger.info(f"requesting chunk from height {height} ({len(prefetched)} in flight)")
+        iface, hexdata = await prefetched.pop(index)
+        could_connect, num_headers = await self._connect_chunk(index, hexdata)
+        if not could_connect and iface is not self:
+            # the other server might be on a different chain; ask ours
+            self.logger.info(f"chunk {index} from {iface.server} does not connect. re-requesting")
+            hexdata = await self._fetch_chunk(index, self._get_chunk_size(index, tip))
+            could_connect, num_headers = await self._connect_chunk(index, hexdata)
+        if not could_connect:
+            for i in list(prefetched):
+                self._cancel_prefetched_chunk(prefetched.pop(i))
+        return could_connect, num_headers
+
+    async def _fetch_chunk_for_pipeline(self, index: int, size: int) -> Tuple['Interface', str]:
+        iface = self._choose_interface_for_chunk(index, size)
+        if iface is not self:
+            try:
+                return iface, await iface._fetch_chunk(index, size)
+            except Exception as e:
+                self.logger.info(f"failed to get chunk {index} from {iface.server}: {repr(e)}")
+        return self, await self._fetch_chunk(index, size)
+
+    def _choose_interface_for_chunk(self, index: int, size: int) -> 'Interface':
+        if not self.network.config.NETWORK_HEADERS_PIPELINE_MULTI_SERVER:
+            return self
+        last_height = index * 2016 + size - 1
+        with self.network.interfaces_lock:
+            interfaces = list(self.network.interfaces.values())
+        candidates = [self] + [iface for iface in interfaces
+                               if iface is not self
+                               and iface.is_connected_and_ready()
+                               and iface.blockchain is self.blockchain
+                               and iface.tip >= last_height]
+        candidates.sort(key=lambda iface: str(iface.server))
+        return candidates[index % len(candidates)]
+
+    @classmethod
+    def _cancel_prefetched_chunk(cls, task: asyncio.Task) -> None:
+        if task.done():
+            if not task.cancelled():
+                task.exception()  # mark as retrieved
+        else:
+            task.cancel()
 
     def is_main_server(self) -> bool:
         return (self.network.interface == self or
@@ -781,28 +1155,34 @@ class Interface(Logger):
             # in the simple case, height == self.tip+1
             if height <= self.tip:
                 await self.sync_until(height)
+            blockchain.save_chainwork_cache(self.network.config)
             return True
 
     async def sync_until(self, height, next_height=None):
         if next_height is None:
             next_height = self.tip
         last = None
-        while last is None or height <= next_height:
-            prev_last, prev_height = last, height
-            if next_height > height + 10:
-                could_connect, num_headers = await self.request_chunk(height, next_height)
-                if not could_connect:
-                    if height <= constants.net.max_checkpoint():
-                        raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+        prefetched = {}  # type: Dict[int, asyncio.Task]  # chunk index -> fetch task
+        try:
+            while last is None or height <= next_height:
+                prev_last, prev_height = last, height
+                if next_height > height + 10:
+                    could_connect, num_headers = await self._request_chunk_pipelined(height, next_height, prefetched)
+                    if not could_connect:
+                        if height <= constants.net.max_checkpoint():
+                            raise GracefulDisconnect('server chain conflicts with checkpoints or genesis')
+                        last, height = await self.step(height)
+                        continue
+                    util.trigger_callback('network_updated')
+                    height = (height // 2016 * 2016) + num_headers
+                    assert height <= next_height+1, (height, self.tip)
+                    last = 'catchup'
+                else:
                     last, height = await self.step(height)
-                    continue
-                util.trigger_callback('network_updated')
-                height = (height // 2016 * 2016) + num_headers
-                assert height <= next_height+1, (height, self.tip)
-                last = 'catchup'
-            else:
-                last, height = await self.step(height)
-            assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
+                assert (prev_last, prev_height) != (last, height), 'had to prevent infinite loop in interface.sync_until'
+        finally:
+            for task in prefetched.values():
+                self._cancel_prefetched_chunk(task)
         return last, height
 
     async def step(self, height, header=None):
@@ -964,7 +1344,7 @@ class Interface(Logger):
         if not is_non_negative_integer(tx_height):
             raise Exception(f"{repr(tx_height)} is not a block height")
         # do request
-        res = await self.session.send_request('blockchain.transaction.get_merkle', [tx_hash, tx_height])
+        res = await self.session.send_request_batched('blockchain.transaction.get_merkle', [tx_hash, tx_height])
         # check response
         block_height = assert_dict_contains_field(res, field_name='block_height')
         merkle = assert_dict_contains_field(res, field_name='merkle')
@@ -980,7 +1360,7 @@ class Interface(Logger):
     async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
         if not is_hash256_str(tx_hash):
             raise Exception(f"{repr(tx_hash)} is not a txid")
-        raw = await self.session.send_request('blockchain.transaction.get', [tx_hash], timeout=timeout)
+        raw = await self.session.send_request_batched('blockchain.transaction.get', [tx_hash], timeout=timeout)
         # validate response
         if not is_hex_str(raw):
             raise RequestCorrupted(f"received garbage (non-hex) as tx data (txid {tx_hash}): {raw!r}")
@@ -997,7 +1377,7 @@ class Interface(Logger):
         if not is_hash256_str(sh):
             raise Exception(f"{repr(sh)} is not a scripthash")
         # do request
-        res = await self.session.send_request('blockchain.scripthash.get_history', [sh])
+        res = await self.session.send_request_batched('blockchain.scripthash.get_history', [sh])
         # check response
         assert_list_or_tuple(res)
         prev_height = 1
@@ -431,6 +431,12 @@ class MasterPublicKeyMixin(ABC):
         """
         pass
 
+    def derive_pubkey_range(self, for_change: int, start: int, count: int) -> Sequence[bytes]:
+        """Returns the pubkeys at paths (for_change, start), ..., (for_change, start+count-1).
+        May raise CannotDerivePubkey.
+        """
+        return [self.derive_pubkey(for_change, n) for n in range(start, start + count)]
+
     def get_pubkey_derivation(
             self,
             pubkey: bytes,
@@ -495,6 +501,7 @@ class Xpub(MasterPublicKeyMixin):
         self.xpub_receive = None
         self.xpub_change = None
         self._xpub_bip32_node = None  # type: Optional[BIP32Node]
+        self._bip32_nodes_for_change = {}  # type: Dict[int, BIP32Node]
 
         # "key origin" info (subclass should persist these):
         self._derivation_prefix = derivation_prefix  # type: Optional[str]
@@ -600,18 +607,27 @@ class Xpub(MasterPublicKeyMixin):
 
     @lru_cache(maxsize=None)
     def derive_pubkey(self, for_change: int, n: int) -> bytes:
+        return self.derive_pubkey_range(for_change, n, 1)[0]
+
+    def derive_pubkey_range(self, for_change: int, start: int, count: int) -> Sequence[bytes]:
         for_change = int(for_change)
         if for_change not in (0, 1):
             raise CannotDerivePubkey("forbidden path")
-        xpub = self.xpub_change if for_change else self.xpub_receive
-        if xpub is None:
-            rootnode = self.get_bip32_node_for_xpub()
-            xpub = rootnode.subkey_at_public_derivation((for_change,)).to_xpub()
-            if for_change:
-                self.xpub_change = xpub
+        node = self._bip32_nodes_for_change.get(for_change)
+        if node is None:
+            xpub = self.xpub_change if for_change else self.xpub_receive
+            if xpub is None:
+                rootnode = self.get_bip32_node_for_xpub()
+                node = rootnode.subkey_at_public_derivation((for_change,))
+                xpub = node.to_xpub()
+                if for_change:
+                    self.xpub_change = xpub
+                else:
+                    self.xpub_receive = xpub
             else:
-                self.xpub_receive = xpub
-        return self.get_pubkey_from_xpub(xpub, (n,))
+                node = BIP32Node.from_xkey(xpub)
+            self._bip32_nodes_for_change[for_change] = node
+        return node.derive_public_children(start, count)
 
     @classmethod
     def get_pubkey_from_xpub(self, xpub: str, sequence) -> bytes:
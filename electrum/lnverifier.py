@@ -111,7 +111,7 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
         # we are verifying channel announcements as they are from untrusted ln peers.
         # we use electrum servers to do this. however we don't trust electrum servers either...
         try:
-            async with self._network_request_semaphore:
+            async with self._network_request_limiter.request():
                 result = await self.network.get_txid_from_txpos(
                     block_height, short_channel_id.txpos, True)
         except aiorpcx.jsonrpc.RPCError:
@@ -129,9 +129,13 @@ class LNChannelVerifier(NetworkJobOnDefaultServer):
         except MerkleVerificationFailure as e:
             # the electrum server sent an incorrect proof. blame is on server, not the ln peer
             raise GracefulDisconnect(e) from e
+        # a cache hit is not a request to the server, so it bypasses the limiter
+        tx_cache = self.network.tx_cache
+        raw_tx = await tx_cache.get_transaction(tx_hash) if tx_cache else None
         try:
-            async with self._network_request_semaphore:
-                raw_tx = await self.network.get_transaction(tx_hash)
+            if raw_tx is None:
+                async with self._network_request_limiter.request():
+                    raw_tx = await self.network.get_transaction(tx_hash, check_cache=False)
         except aiorpcx.jsonrpc.RPCError as e:
             # the electrum server can't find the tx; but it was the
             # one who told us about the txid!! blame is on server
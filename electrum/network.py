@@ -31,7 +31,8 @@ import threading
 import socket
 import json
 import sys
-from typing import NamedTuple, Optional, Sequence, List, Dict, Tuple, TYPE_CHECKING, Iterable, Set, Any, TypeVar
+from typing import (NamedTuple, Optional, Sequence, List, Dict, Tuple, TYPE_CHECKING, Iterable, Set, Any, TypeVar,
+                    Callable, Awaitable)
 import traceback
 import concurrent
 from concurrent import futures
@@ -47,7 +48,7 @@ from . import util
 from .util import (log_exceptions, ignore_exceptions, OldTaskGroup,
                    bfh, make_aiohttp_session, send_exception_to_crash_reporter,
                    is_hash256_str, is_non_negative_integer, MyEncoder, NetworkRetryManager,
-                   nullcontext, error_text_str_to_safe_str)
+                   nullcontext, error_text_str_to_safe_str, get_headers_dir)
 from .bitcoin import COIN, DummyAddress, DummyAddressUsedInTxException
 from . import constants
 from . import blockchain
@@ -55,7 +56,8 @@ from . import bitcoin
 from . import dns_hacks
 from .transaction import Transaction
 from .blockchain import Blockchain, HEADER_SIZE
-from .interface import (Interface, PREFERRED_NETWORK_PROTOCOL,
+from .tx_cache import TxCache
+from .interface import (Interface, ServerStats, PREFERRED_NETWORK_PROTOCOL,
                         RequestTimedOut, NetworkTimeout, BUCKET_NAME_OF_ONION_SERVERS,
                         NetworkException, RequestCorrupted, ServerAddr)
 from .version import PROTOCOL_VERSION
@@ -320,6 +322,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         if self._blockchain_preferred_block is None:
             self._set_preferred_chain(None)
         self._blockchain = blockchain.get_best_chain()
+        self.tx_cache = None  # type: Optional[TxCache]
 
         self._allowed_protocols = {PREFERRED_NETWORK_PROTOCOL}
 
@@ -356,6 +359,8 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._connecting_ifaces = set()
         self.interfaces = {}  # these are the ifaces in "initialised and usable" state
         self._closing_ifaces = set()
+        # request statistics per server, kept across reconnects. used for server selection
+        self._server_stats = {}  # type: Dict[ServerAddr, ServerStats]
 
         # Dump network messages (all interfaces).  Set at runtime from the console.
         self.debug = False
@@ -605,17 +610,65 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                     continue
                 if not self._can_retry_addr(server, now=now):
                     continue
+                if self._is_server_slow(server):
+                    continue
                 return server
-        # try all servers we know about, pick one at random
+        # try all servers we know about, pick one at random,
+        # but servers we have seen to be slow only as a last resort
         hostmap = self.get_servers()
         servers = list(set(filter_protocol(hostmap, allowed_protocols=self._allowed_protocols)) - connected_servers)
         random.shuffle(servers)
+        servers.sort(key=self._get_server_latency_score)
         for server in servers:
             if not self._can_retry_addr(server, now=now):
                 continue
             return server
         return None
 
+    def get_server_latency(self, server: ServerAddr) -> Optional[float]:
+        """Smoothed latency of requests to server in seconds, if known."""
+        stats = self._server_stats.get(server)
+        return stats.get_latency() if stats else None
+
+    def _get_server_latency_score(self, server: ServerAddr) -> float:
+        # lower is better. unknown servers score like a typical known server:
+        # tried after the known fast ones, but before the known slow ones
+        latency = self.get_server_latency(server)
+        if latency is None:
+            return self._get_median_server_latency()
+        return latency if not self._is_server_slow(server) else float('inf')
+
+    def _get_median_server_latency(self) -> float:
+        latencies = sorted(
+            latency for stats in list(self._server_stats.values())
+            if (latency := stats.get_latency()) is not None
+            and 1000 * latency <= self.config.NETWORK_SLOW_SERVER_LATENCY_MS)
+        if not latencies:
+            return 0
+        return latencies[len(latencies) // 2]
+
+    def _is_server_slow(self, server: ServerAddr) -> bool:
+        latency = self.get_server_latency(server)
+        return latency is not None and 1000 * latency > self.config.NETWORK_SLOW_SERVER_LATENCY_MS
+
+    def get_server_stats(self) -> Dict[str, dict]:
+        """Request statistics for the servers we have been connected to."""
+        with self.interfaces_lock:
+            interfaces = dict(self.interfaces)
+        result = {}
+        for server, stats in list(self._server_stats.items()):
+            d = stats.to_dict()
+            iface = interfaces.get(server)
+            d['connected'] = iface is not None
+            d['main'] = iface is not None and iface == self.interface
+            if iface is not None:
+                d['height'] = iface.tip
+                if iface.session:
+                    d['session_bytes_sent'] = iface.session.send_size
+                    d['session_bytes_received'] = iface.session.recv_size
+            result[str(server)] = d
+        return result
+
     def _set_default_server(self) -> None:
         # Server for addresses and transactions
         server = self.config.NETWORK_SERVER
@@ -715,15 +768,34 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             await self.switch_to_interface(random.choice(servers))
 
     async def switch_lagging_interface(self):
-        """If auto_connect and lagging, switch interface (only within fork)."""
-        if self.auto_connect and await self._server_is_lagging():
-            # switch to one that has the correct header (not height)
-            best_header = self.blockchain().header_at_tip()
-            with self.interfaces_lock: interfaces = list(self.interfaces.values())
-            filtered = list(filter(lambda iface: iface.tip_header == best_header, interfaces))
+        """If auto_connect and lagging or slow, switch interface (only within fork)."""
+        if not self.auto_connect:
+            return
+        is_lagging = await self._server_is_lagging()
+        if not is_lagging and not self._is_server_slow(self.default_server):
+            return
+        # switch to one that has the correct header (not height)
+        best_header = self.blockchain().header_at_tip()
+        with self.interfaces_lock: interfaces = list(self.interfaces.values())
+        filtered = list(filter(lambda iface: iface.tip_header == best_header, interfaces))
+        if not is_lagging:
+            # only switch away from a slow server if there is a clearly faster one
+            main_latency = self.get_server_latency(self.default_server)
+            filtered = [iface for iface in filtered
+                        if (self.get_server_latency(iface.server) or float('inf')) < main_latency / 2]
             if filtered:
-                chosen_iface = random.choice(filtered)
-                await self.switch_to_interface(chosen_iface.server)
+                self.logger.info(f'{self.default_server} is slow ({1000 * main_latency:.0f} ms)')
+        if filtered:
+            # prefer servers known to be fast, then unknown ones, then slow ones
+            def switch_score(iface: Interface) -> float:
+                latency = self.get_server_latency(iface.server)
+                if latency is None:
+                    return self.config.NETWORK_SLOW_SERVER_LATENCY_MS / 1000
+                return self._get_server_latency_score(iface.server)
+            random.shuffle(filtered)
+            filtered.sort(key=switch_score)
+            chosen_iface = filtered[0]
+            await self.switch_to_interface(chosen_iface.server)
 
     async def switch_unwanted_fork_interface(self) -> None:
         """If auto_connect, maybe switch to another fork/chain."""
@@ -855,6 +927,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self._trying_addr_now(server)
 
         interface = Interface(network=self, server=server, proxy=self.proxy)
+        interface.stats = self._server_stats.setdefault(server, interface.stats)
         # note: using longer timeouts here as DNS can sometimes be slow!
         timeout = self.get_network_timeout_seconds(NetworkTimeout.Generic)
         try:
@@ -950,6 +1023,63 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                 raise wrapped_exc from e
         return wrapper
 
+    def _choose_interface_for_fetch(self, main: Interface, *, min_tip: int = 0) -> Interface:
+        """Returns the interface a read-only fetch on behalf of 'main' should use.
+        Helpers must be on the same chain as main, and have a free fetch slot.
+        """
+        if not self.config.NETWORK_FANOUT_FETCHES:
+            return main
+        limit = self.config.NETWORK_FANOUT_MAX_CONCURRENT_PER_SERVER
+        with self.interfaces_lock:
+            interfaces = list(self.interfaces.values())
+        candidates = [main] + [
+            iface for iface in interfaces
+            if iface is not main
+            and iface.is_connected_and_ready()
+            and iface.blockchain is main.blockchain
+            and iface.tip >= min_tip
+            and iface.num_fanout_fetches < limit]
+        return min(candidates, key=lambda iface: iface.num_fanout_fetches)
+
+    async def fetch_from_any_interface(
+            self,
+            main: Interface,
+            fetch: Callable[[Interface], Awaitable[T]],
+            *,
+            min_tip: int = 0,
+            validate: Callable[[T], Any] = None,
+    ) -> T:
+        """Runs the read-only request 'fetch' on a helper interface if
+        NETWORK_FANOUT_FETCHES is set, otherwise on 'main'.
+        Whatever goes wrong on a helper, incl. the result not passing 'validate',
+        the request is retried on main; so only main's errors reach the caller.
+        """
+        iface = self._choose_interface_for_fetch(main, min_tip=min_tip)
+        iface.num_fanout_fetches += 1
+        try:
+            if iface is main:
+                return await fetch(main)
+            # run as a separate task: if the helper disconnects, its requests get
+            # cancelled, and that must not cancel us
+            task = asyncio.create_task(fetch(iface))
+            try:
+                await asyncio.wait([task])
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            try:
+                if task.cancelled():
+                    raise Exception('helper request was cancelled')
+                result = task.result()
+                if validate is not None:
+                    validate(result)
+                return result
+            except Exception as e:
+                self.logger.info(f"fetch from helper {iface.server} failed: {e!r}. retrying on main")
+        finally:
+            iface.num_fanout_fetches -= 1
+        return await fetch(main)
+
     @best_effort_reliable
     @catch_server_exceptions
     async def get_merkle_for_transaction(self, tx_hash: str, tx_height: int) -> dict:
@@ -1176,9 +1306,20 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             raise RequestTimedOut()
         return await self.interface.request_chunk(height, tip=tip, can_return_early=can_return_early)
 
+    async def get_transaction(self, tx_hash: str, *, timeout=None, check_cache: bool = True) -> str:
+        """Returns the raw tx, from the tx cache if possible.
+        Callers that already looked in the cache can skip that with check_cache=False.
+        """
+        if check_cache and self.tx_cache and (raw_tx := await self.tx_cache.get_transaction(tx_hash)):
+            return raw_tx
+        raw_tx = await self._get_transaction_from_server(tx_hash, timeout=timeout)
+        if self.tx_cache:
+            await self.tx_cache.add_tx(tx_hash, raw_tx)
+        return raw_tx
+
     @best_effort_reliable
     @catch_server_exceptions
-    async def get_transaction(self, tx_hash: str, *, timeout=None) -> str:
+    async def _get_transaction_from_server(self, tx_hash: str, *, timeout=None) -> str:
         if self.interface is None:  # handled by best_effort_reliable
             raise RequestTimedOut()
         return await self.interface.get_transaction(tx_hash=tx_hash, timeout=timeout)
@@ -1295,6 +1436,10 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.logger.info('starting network')
         self._clear_addr_retry_times()
         self._init_parameters_from_config()
+        if self.tx_cache is None and self.config.NETWORK_TX_CACHE_MAX_SIZE_MB > 0:
+            self.tx_cache = TxCache(
+                self.asyncio_loop, os.path.join(get_headers_dir(self.config), 'tx_cache'),
+                max_size=self.config.NETWORK_TX_CACHE_MAX_SIZE_MB * 1_000_000)
         await self.taskgroup.spawn(self._run_new_interface(self.default_server))
 
         async def main():
@@ -1304,6 +1449,7 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
                 # will NOT raise, and the group will keep the other tasks running
                 async with taskgroup as group:
                     await group.spawn(self._maintain_sessions())
+                    await group.spawn(self._flush_headers_periodically())
                     [await group.spawn(job) for job in self._jobs]
             except Exception as e:
                 self.logger.exception(f"taskgroup died ({hex(id(taskgroup))}).")
@@ -1339,6 +1485,12 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
         self.taskgroup = None
         self.interface = None
         self.interfaces = {}
+        blockchain.flush_pending_writes()
+        blockchain.save_chainwork_cache(self.config)
+        if full_shutdown and self.tx_cache:
+            self.tx_cache.stop()
+            await self.tx_cache.stopped_event.wait()
+            self.tx_cache = None
         self._connecting_ifaces.clear()
         self._closing_ifaces.clear()
         if not full_shutdown:
@@ -1355,6 +1507,13 @@ class Network(Logger, NetworkRetryManager[ServerAddr]):
             if self._can_retry_addr(self.default_server, urgent=True):
                 await self.switch_to_interface(self.default_server)
 
+    async def _flush_headers_periodically(self):
+        # headers writes are group-committed on the next write; if no more
+        # headers arrive, they still have to become durable in time
+        while True:
+            await asyncio.sleep(self.config.NETWORK_HEADERS_FSYNC_INTERVAL_MS / 1000 / 2)
+            blockchain.flush_due_writes()
+
     async def _maintain_sessions(self):
         async def maybe_start_new_interfaces():
             num_existing_ifaces = len(self.interfaces) + len(self._connecting_ifaces) + len(self._closing_ifaces)
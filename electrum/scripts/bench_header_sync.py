@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+
+# Benchmarks header sync against an in-process fake Electrum server.
+#
+# The server listens on loopback and serves a synthetic regtest chain in the
+# Goldcoin header format. A Network is pointed at it and we measure:
+#  - catch-up: headers/sec and CPU time per 2016-header chunk,
+#  - reorgs: time until the client follows the server to a competing fork,
+#  - PoW: scrypt hashing throughput for one chunk (skipped by regtest verification).
+# Note: the server runs in the same process, so CPU figures include its (small) share.
+#
+# usage: bench_header_sync.py [--headers N] [--reorgs K] [--reorg-depth D] [--pow-headers P]
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from typing import List, Optional
+
+import aiorpcx
+
+from electrum import constants, blockchain, version
+from electrum.crypto import sha256, sha256d
+from electrum.network import Network
+from electrum.simple_config import SimpleConfig
+from electrum.util import create_and_start_event_loop, print_msg
+
+
+REGTEST_BITS = 0x207fffff
+BLOCK_INTERVAL = 120  # seconds
+GENESIS_TIMESTAMP = 1368576000
+
+
+def make_header(prev_raw: Optional[bytes], height: int, salt: bytes) -> bytes:
+    prev_hash = sha256d(prev_raw) if prev_raw is not None else bytes(32)
+    merkle_root = sha256(salt + height.to_bytes(4, 'little'))
+    return (int(1).to_bytes(4, 'little')
+            + prev_hash
+            + merkle_root
+            + (GENESIS_TIMESTAMP + height * BLOCK_INTERVAL).to_bytes(4, 'little')
+            + REGTEST_BITS.to_bytes(4, 'little')
+            + int(0).to_bytes(4, 'little'))
+
+
+def extend_chain(chain: List[bytes], count: int, salt: bytes) -> None:
+    for _ in range(count):
+        chain.append(make_header(chain[-1] if chain else None, len(chain), salt))
+
+
+class FakeServer:
+    """Serves a header chain, and can switch to a fork of it."""
+
+    def __init__(self, chain: List[bytes]):
+        self.chain = chain
+        self.sessions = set()
+        self.requests = {}  # method -> count
+        self._num_forks = 0
+        self._handlers = {
+            'server.version': lambda client_name, protocol_version: ['FakeServer', version.PROTOCOL_VERSION],
+            'server.ping': lambda: None,
+            'server.banner': lambda: '',
+            'server.donation_address': lambda: '',
+            'server.peers.subscribe': lambda: [],
+            'blockchain.relayfee': lambda: 0.00001,
+            'blockchain.estimatefee': lambda num_blocks: -1,
+            'mempool.get_fee_histogram': lambda: [],
+            'blockchain.headers.subscribe': self.tip,
+            'blockchain.block.header': self.block_header,
+            'blockchain.block.headers': self.block_headers,
+        }
+
+    def tip(self):
+        return {'hex': self.chain[-1].hex(), 'height': len(self.chain) - 1}
+
+    def block_header(self, height):
+        return self.chain[height].hex()
+
+    def block_headers(self, start_height, count):
+        headers = self.chain[start_height:start_height + min(count, 2016)]
+        return {'hex': b''.join(headers).hex(), 'count': len(headers), 'max': 2016}
+
+    def make_session(self, *args, **kwargs):
+        return FakeServerSession(*args, server=self, **kwargs)
+
+    async def reorg(self, depth: int) -> str:
+        """Replaces the last 'depth' headers with a fork one header longer,
+        and announces the new tip. Returns the hash of the new tip."""
+        self._num_forks += 1
+        del self.chain[len(self.chain) - depth:]
+        extend_chain(self.chain, depth + 1, salt=b'fork%d' % self._num_forks)
+        for session in list(self.sessions):
+            await session.send_notification('blockchain.headers.subscribe', (self.tip(),))
+        return blockchain.hash_raw_header(self.chain[-1].hex())
+
+
+class FakeServerSession(aiorpcx.RPCSession):
+
+    def __init__(self, *args, server: FakeServer, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.server = server
+
+    async def connection_lost(self):
+        await super().connection_lost()
+        self.server.sessions.discard(self)
+
+    async def handle_request(self, request):
+        self.server.sessions.add(self)
+        self.server.requests[request.method] = self.server.requests.get(request.method, 0) + 1
+        handler = self.server._handlers.get(request.method)
+        return aiorpcx.handler_invocation(handler, request)()
+
+
+async def wait_for_tip(network: Network, height: int, header_hash: str, *, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        chain = network.blockchain()
+        if chain.height() >= height and chain.check_hash(height, header_hash):
+            return
+        if time.monotonic() > deadline:
+            raise Exception(f'timed out waiting for header {height} ({header_hash})')
+        await asyncio.sleep(0.002)
+
+
+def bench_pow_hashing(chain: List[bytes], count: int) -> float:
+    data = b''.join(chain[:count])
+    t0 = time.perf_counter()
+    blockchain.pow_hash_raw_headers(data)
+    return len(data) // blockchain.HEADER_SIZE / (time.perf_counter() - t0)
+
+
+async def run(args, chain: List[bytes]) -> None:
+    server = FakeServer(chain)
+    tcp_server = await aiorpcx.serve_rs(server.make_session, '127.0.0.1', 0)
+    port = tcp_server.sockets[0].getsockname()[1]
+    config = SimpleConfig({
+        'electrum_path': tempfile.mkdtemp(prefix='bench_header_sync_'),
+        'server': f'127.0.0.1:{port}:t',
+        'oneserver': True,
+        'auto_connect': False,
+    })
+    network = Network(config)
+    try:
+        tip = server.tip()
+        tip_hash = blockchain.hash_raw_header(tip['hex'])
+        cpu0, t0 = time.process_time(), time.perf_counter()
+        network.start()
+        await wait_for_tip(network, tip['height'], tip_hash, timeout=args.timeout)
+        elapsed, cpu = time.perf_counter() - t0, time.process_time() - cpu0
+        num_headers = tip['height'] + 1
+        num_chunks = max(1, server.requests.get('blockchain.block.headers', 0))
+        print_msg(f'catch-up: {num_headers} headers in {elapsed:.3f}s '
+                  f'({num_headers / elapsed:.0f} headers/sec, {num_chunks} chunks, '
+                  f'{1000 * cpu / num_chunks:.1f} ms CPU/chunk)')
+
+        latencies = []
+        for _ in range(args.reorgs):
+            t0 = time.perf_counter()
+            tip_hash = await server.reorg(args.reorg_depth)
+            await wait_for_tip(network, len(server.chain) - 1, tip_hash, timeout=args.timeout)
+            latencies.append(time.perf_counter() - t0)
+        if latencies:
+            print_msg(f'reorg (depth {args.reorg_depth}): '
+                      f'min {1000 * min(latencies):.1f} ms, '
+                      f'median {1000 * statistics.median(latencies):.1f} ms, '
+                      f'max {1000 * max(latencies):.1f} ms over {len(latencies)} reorgs')
+    finally:
+        await network.stop()
+        tcp_server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark header sync against a local fake server.')
+    parser.add_argument('--headers', type=int, default=10 * 2016, help='length of the served chain')
+    parser.add_argument('--reorgs', type=int, default=10, help='number of reorgs to time')
+    parser.add_argument('--reorg-depth', type=int, default=6, help='number of blocks replaced per reorg')
+    parser.add_argument('--pow-headers', type=int, default=256, help='number of headers to scrypt-hash; 0 to skip')
+    parser.add_argument('--timeout', type=float, default=600, help='seconds to wait for each sync')
+    args = parser.parse_args()
+
+    chain = []  # type: List[bytes]
+    extend_chain(chain, args.headers, salt=b'main')
+    genesis = blockchain.hash_raw_header(chain[0].hex())
+    constants.net = type('BenchRegtest', (constants.BitcoinRegtest,), {'GENESIS': genesis})
+
+    if args.pow_headers > 0:
+        print_msg(f'PoW hashing: {bench_pow_hashing(chain, args.pow_headers):.0f} headers/sec')
+    loop, stopping_fut, loop_thread = create_and_start_event_loop()
+    try:
+        asyncio.run_coroutine_threadsafe(run(args, chain), loop).result()
+    finally:
+        loop.call_soon_threadsafe(stopping_fut.set_result, 1)
+        loop_thread.join(timeout=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,11 @@
 import hashlib
 import hmac
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 def scrypt_1024_1_1_80(header):
     if not isinstance(header, bytes) or len(header) != 80:
         raise ValueError('header must be 80 bytes')
@@ -244,6 +249,73 @@ def _xor_salsa8_2(X):
     ]
 
 
+# Salsa20 double round, as (target, a, b, rotation): x[target] ^= rotl(x[a] + x[b], rotation)
+_SALSA_OPS = [
+    (4, 0, 12, 7), (8, 4, 0, 9), (12, 8, 4, 13), (0, 12, 8, 18),
+    (9, 5, 1, 7), (13, 9, 5, 9), (1, 13, 9, 13), (5, 1, 13, 18),
+    (14, 10, 6, 7), (2, 14, 10, 9), (6, 2, 14, 13), (10, 6, 2, 18),
+    (3, 15, 11, 7), (7, 3, 15, 9), (11, 7, 3, 13), (15, 11, 7, 18),
+    (1, 0, 3, 7), (2, 1, 0, 9), (3, 2, 1, 13), (0, 3, 2, 18),
+    (6, 5, 4, 7), (7, 6, 5, 9), (4, 7, 6, 13), (5, 4, 7, 18),
+    (11, 10, 9, 7), (8, 11, 10, 9), (9, 8, 11, 13), (10, 9, 8, 18),
+    (12, 15, 14, 7), (13, 12, 15, 9), (14, 13, 12, 13), (15, 14, 13, 18),
+]
+
+# number of headers hashed together; V takes 128 KiB per header
+_BATCH_SIZE = 512
+
+def scrypt_1024_1_1_80_batch(headers):
+    """Same as scrypt_1024_1_1_80, for many headers at once.
+    If numpy is available, the headers are hashed together, one uint32 lane each.
+    """
+    headers = list(headers)
+    for header in headers:
+        if not isinstance(header, bytes) or len(header) != 80:
+            raise ValueError('header must be 80 bytes')
+    if np is None:
+        return [scrypt_1024_1_1_80(header) for header in headers]
+    result = []
+    for i in range(0, len(headers), _BATCH_SIZE):
+        result.extend(_scrypt_1024_1_1_80_np(headers[i:i+_BATCH_SIZE]))
+    return result
+
+def _scrypt_1024_1_1_80_np(headers):
+    n = len(headers)
+    if n == 0:
+        return []
+    B = b''.join(hashlib.pbkdf2_hmac('sha256', header, header, 1, 128) for header in headers)
+    # X[j] holds word j of every header
+    X = np.frombuffer(B, dtype='<u4').reshape(n, 32).T.astype(np.uint32, order='C')
+    V = np.empty((1024, 32, n), dtype=np.uint32)
+
+    for i in range(1024):
+        V[i] = X
+        _xor_salsa8_2_np(X)
+
+    lanes = np.arange(n)
+    for i in range(1024):
+        k = X[16] & 1023
+        X ^= V[k, :, lanes].T
+        _xor_salsa8_2_np(X)
+
+    B = X.T.astype('<u4').tobytes()
+    return [hashlib.pbkdf2_hmac('sha256', header, B[i*128:(i+1)*128], 1, 32)
+            for i, header in enumerate(headers)]
+
+def _xor_salsa8_2_np(X):
+    _xor_salsa8_np(X[0:16], X[16:32])
+    _xor_salsa8_np(X[16:32], X[0:16])
+
+def _xor_salsa8_np(B, Bx):
+    B ^= Bx
+    x = [B[i].copy() for i in range(16)]
+    for j in range(4):
+        for target, a, b, rot in _SALSA_OPS:
+            t = x[a] + x[b]
+            x[target] ^= (t << np.uint32(rot)) | (t >> np.uint32(32 - rot))
+    for i in range(16):
+        B[i] += x[i]
+
 
 if __name__ == '__main__':
     from binascii import unhexlify
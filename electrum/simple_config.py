@@ -932,6 +932,24 @@ class SimpleConfig(Logger):
     NETWORK_SERVERFINGERPRINT = ConfigVar('serverfingerprint', default=None, type_=str)
     NETWORK_MAX_INCOMING_MSG_SIZE = ConfigVar('network_max_incoming_msg_size', default=1_000_000, type_=int)  # in bytes
     NETWORK_TIMEOUT = ConfigVar('network_timeout', default=None, type_=int)
+    NETWORK_HEADERS_POW_WORKERS = ConfigVar('network_headers_pow_workers', default=None, type_=int)  # None: cpu count
+    NETWORK_HEADERS_PIPELINE_WINDOW = ConfigVar('network_headers_pipeline_window', default=4, type_=int)  # in chunks
+    NETWORK_HEADERS_PIPELINE_MULTI_SERVER = ConfigVar('network_headers_pipeline_multi_server', default=False, type_=bool)
+    # headers are fsync'd in groups: after this many headers or this much time, whichever comes first
+    NETWORK_HEADERS_FSYNC_EVERY_N = ConfigVar('network_headers_fsync_every_n', default=100, type_=int)  # <=1: fsync each write
+    NETWORK_HEADERS_FSYNC_INTERVAL_MS = ConfigVar('network_headers_fsync_interval_ms', default=1000, type_=int)
+    # tx, merkle and history requests are coalesced into JSON-RPC batches of up to this many requests
+    NETWORK_BATCH_MAX_SIZE = ConfigVar('network_batch_max_size', default=20, type_=int)  # <=1: no batching
+    NETWORK_BATCH_LATENCY_MS = ConfigVar('network_batch_latency_ms', default=10, type_=int)  # max time a request waits for a batch
+    # spread wallet tx and merkle proof fetches over all connected servers, not just the main one
+    NETWORK_FANOUT_FETCHES = ConfigVar('network_fanout_fetches', default=False, type_=bool)
+    NETWORK_FANOUT_MAX_CONCURRENT_PER_SERVER = ConfigVar('network_fanout_max_concurrent_per_server', default=10, type_=int)
+    # with auto_connect, we switch away from (and avoid connecting to) servers slower than this
+    NETWORK_SLOW_SERVER_LATENCY_MS = ConfigVar('network_slow_server_latency_ms', default=1500, type_=int)
+    # size cap of the cache of raw transactions and SPV merkle proofs shared by all
+    # wallets; 0 disables it, and with it the reuse of proofs by the verifier.
+    # opt-in: the cache is stored unencrypted, even for encrypted wallets
+    NETWORK_TX_CACHE_MAX_SIZE_MB = ConfigVar('network_tx_cache_max_size_mb', default=0, type_=int)
 
     WALLET_BATCH_RBF = ConfigVar(
         'batch_rbf', default=False, type_=bool,
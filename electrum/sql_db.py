@@ -66,6 +66,7 @@ class SqlDB(Logger):
                 if i == 0:
                     self.conn.commit()
         # write
+        self.before_close()
         self.conn.commit()
         self.conn.close()
 
@@ -74,3 +75,7 @@ class SqlDB(Logger):
 
     def create_database(self):
         raise NotImplementedError()
+
+    def before_close(self):
+        """Called in the sql thread before the final commit."""
+        pass
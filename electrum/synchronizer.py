@@ -23,8 +23,7 @@
 # CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import asyncio
-import hashlib
-from typing import Dict, List, TYPE_CHECKING, Tuple, Set
+from typing import Dict, List, TYPE_CHECKING, Tuple, Set, Optional
 from collections import defaultdict
 import logging
 
@@ -33,7 +32,7 @@ from aiorpcx import run_in_thread, RPCError
 from . import util
 from .transaction import Transaction, PartialTransaction
 from .util import make_aiohttp_session, NetworkJobOnDefaultServer, random_shuffled_copy, OldTaskGroup
-from .bitcoin import address_to_scripthash, is_address
+from .bitcoin import address_to_scripthash, is_address, history_status
 from .logging import Logger
 from .interface import GracefulDisconnect, NetworkTimeout
 
@@ -45,19 +44,14 @@ if TYPE_CHECKING:
 class SynchronizerFailure(Exception): pass
 
 
-def history_status(h):
-    if not h:
-        return None
-    status = ''
-    for tx_hash, height in h:
-        status += tx_hash + ':%d:' % height
-    return hashlib.sha256(status.encode('ascii')).digest().hex()
-
-
 class SynchronizerBase(NetworkJobOnDefaultServer):
     """Subscribe over the network to a set of addresses, and monitor their statuses.
     Every time a status changes, run a coroutine provided by the subclass.
     """
+    # Max number of addresses being subscribed to at once. When many addresses
+    # are added (e.g. bulk import), the others wait for a slot in their task.
+    MAX_CONCURRENT_SUBSCRIPTIONS = 500
+
     def __init__(self, network: 'Network'):
         self.asyncio_loop = network.asyncio_loop
 
@@ -70,6 +64,8 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
         self._handling_addr_statuses = set()
         self.scripthash_to_address = {}
         self._processed_some_notifications = False  # so that we don't miss them
+        self._wakeup_event = asyncio.Event()  # set when main() should re-check the state
+        self._subscription_slots = asyncio.Semaphore(self.MAX_CONCURRENT_SUBSCRIPTIONS)
         # Queues
         self.status_queue = asyncio.Queue()
 
@@ -86,6 +82,14 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     def add(self, addr):
         if not is_address(addr): raise ValueError(f"invalid bitcoin address {addr}")
         self._adding_addrs.add(addr)  # this lets is_up_to_date already know about addr
+        self.wakeup()
+
+    def wakeup(self) -> None:
+        """Wakes up main(), to re-check the state of synchronization.
+        Can be called from any thread.
+        """
+        if not self._wakeup_event.is_set():
+            self.asyncio_loop.call_soon_threadsafe(self._wakeup_event.set)
 
     async def _add_address(self, addr: str):
         try:
@@ -105,14 +109,17 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
     async def _subscribe_to_address(self, addr):
         h = address_to_scripthash(addr)
         self.scripthash_to_address[h] = addr
-        self._requests_sent += 1
-        try:
-            async with self._network_request_semaphore:
-                await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
-        except RPCError as e:
-            if e.message == 'history too large':  # no unique error code
-                raise GracefulDisconnect(e, log_level=logging.ERROR) from e
-            raise
+        async with self._subscription_slots:  # backpressure
+            self._requests_sent += 1
+            try:
+                async with self._network_request_limiter.request() as request:
+                    if self.session.is_subscribed('blockchain.scripthash.subscribe', [h]):
+                        request.ignore_latency()  # answered from the session's cache
+                    await self.session.subscribe('blockchain.scripthash.subscribe', [h], self.status_queue)
+            except RPCError as e:
+                if e.message == 'history too large':  # no unique error code
+                    raise GracefulDisconnect(e, log_level=logging.ERROR) from e
+                raise
         self._requests_answered += 1
 
     async def handle_status(self):
@@ -123,6 +130,7 @@ class SynchronizerBase(NetworkJobOnDefaultServer):
             self.requested_addrs.discard(addr)  # ok for addr not to be present
             await self.taskgroup.spawn(self._on_address_status, addr, status)
             self._processed_some_notifications = True
+            self.wakeup()
 
     async def main(self):
         raise NotImplementedError()  # implemented by subclasses
@@ -162,8 +170,7 @@ class Synchronizer(SynchronizerBase):
 
     async def _on_address_status(self, addr, status):
         try:
-            history = self.adb.db.get_addr_history(addr)
-            if history_status(history) == status:
+            if self.adb.db.get_addr_history_status(addr) == status:
                 return
             # No point in requesting history twice for the same announced status.
             # However if we got announced a new status, we should request history again:
@@ -174,9 +181,10 @@ class Synchronizer(SynchronizerBase):
             self._stale_histories.pop(addr, asyncio.Future()).cancel()
         finally:
             self._handling_addr_statuses.discard(addr)
+            self.wakeup()
         h = address_to_scripthash(addr)
         self._requests_sent += 1
-        async with self._network_request_semaphore:
+        async with self._network_request_limiter.request():
             result = await self.interface.get_history_for_scripthash(h)
         self._requests_answered += 1
         self.logger.info(f"receiving history {addr} {len(result)}")
@@ -204,6 +212,7 @@ class Synchronizer(SynchronizerBase):
 
         # Remove request; this allows up_to_date to be True
         self.requested_histories.discard((addr, status))
+        self.wakeup()
 
     async def _request_missing_txs(self, hist, *, allow_server_not_finding_tx=False):
         # "hist" is a list of [tx_hash, tx_height] lists
@@ -223,25 +232,39 @@ class Synchronizer(SynchronizerBase):
                 await group.spawn(self._get_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx))
 
     async def _get_transaction(self, tx_hash, *, allow_server_not_finding_tx=False):
+        tx_cache = self.network.tx_cache
+        raw_tx = await tx_cache.get_transaction(tx_hash) if tx_cache else None
+        from_cache = raw_tx is not None
+        if not from_cache:
+            raw_tx = await self._fetch_transaction(tx_hash, allow_server_not_finding_tx=allow_server_not_finding_tx)
+            if raw_tx is None:
+                return
+        tx = Transaction(raw_tx)
+        if tx_hash != tx.txid():
+            raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
+        if tx_cache and not from_cache:
+            await tx_cache.add_tx(tx_hash, raw_tx)
+        tx_height = self.requested_tx.pop(tx_hash)
+        self.adb.receive_tx_callback(tx, tx_height)
+        self.wakeup()
+        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}"
+                         + (" (cached)" if from_cache else ""))
+
+    async def _fetch_transaction(self, tx_hash, *, allow_server_not_finding_tx=False) -> Optional[str]:
         self._requests_sent += 1
         try:
-            async with self._network_request_semaphore:
-                raw_tx = await self.interface.get_transaction(tx_hash)
+            return await self._fetch_from_any_interface(
+                lambda iface: iface.get_transaction(tx_hash))
         except RPCError as e:
             # most likely, "No such mempool or blockchain transaction"
             if allow_server_not_finding_tx:
                 self.requested_tx.pop(tx_hash)
-                return
+                self.wakeup()
+                return None
             else:
                 raise
         finally:
             self._requests_answered += 1
-        tx = Transaction(raw_tx)
-        if tx_hash != tx.txid():
-            raise SynchronizerFailure(f"received tx does not match expected txid ({tx_hash} != {tx.txid()})")
-        tx_height = self.requested_tx.pop(tx_hash)
-        self.adb.receive_tx_callback(tx, tx_height)
-        self.logger.info(f"received tx {tx_hash} height: {tx_height} bytes: {len(raw_tx)}")
 
     async def main(self):
         self.adb.up_to_date_changed()
@@ -259,7 +282,6 @@ class Synchronizer(SynchronizerBase):
         self._init_done = True
         prev_uptodate = False
         while True:
-            await asyncio.sleep(0.1)
             for addr in self._adding_addrs.copy(): # copy set to ensure iterator stability
                 await self._add_address(addr)
             up_to_date = self.adb.is_up_to_date()
@@ -269,6 +291,9 @@ class Synchronizer(SynchronizerBase):
                 self._processed_some_notifications = False
                 self.adb.up_to_date_changed()
             prev_uptodate = up_to_date
+            # sleep until something that might change the state happens
+            await self._wakeup_event.wait()
+            self._wakeup_event.clear()
 
 
 class Notifier(SynchronizerBase):
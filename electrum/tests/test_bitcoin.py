@@ -790,6 +790,23 @@ class Test_xprv_xpub(ElectrumTestCase):
         self.assertEqual("xpub6BJA1jSqiukeaesWfxe6sNK9CCGaujFFSJLomWHprUL9DePQ4JDkM5d88n49sMGJxrhpjazuXYWdMf17C9T5XnxkopaeS7jGk1GyyVziaMt", xpub)
         self.assertEqual("xprv9xJocDuwtYCMNAo3Zw76WENQeAS6WGXQ55RCy7tDJ8oALr4FWkuVoHJeHVAcAqiZLE7Je3vZJHxspZdFHfnBEjHqU5hG1Jaj32dVoS6XLT1", xprv)
 
+    def test_derive_public_children(self):
+        node = BIP32Node.from_xkey(self.xprv_xpub[0]['xpub'])
+        expected = [node.subkey_at_public_derivation([n]).eckey.get_public_key_bytes(compressed=True)
+                    for n in range(5, 25)]
+        self.assertEqual(expected, node.derive_public_children(5, 20))
+        self.assertEqual([], node.derive_public_children(5, 0))
+        # same for a private node
+        node = BIP32Node.from_xkey(self.xprv_xpub[0]['xprv'])
+        self.assertEqual(expected[:3], node.derive_public_children(5, 3))
+        last = bip32.BIP32_PRIME - 1
+        self.assertEqual([node.subkey_at_public_derivation([last]).eckey.get_public_key_bytes(compressed=True)],
+                         node.derive_public_children(last, 1))
+        with self.assertRaises(Exception):
+            node.derive_public_children(last, 2)
+        with self.assertRaises(ValueError):
+            node.derive_public_children(-1, 2)
+
     def test_xpub_from_xprv(self):
         """We can derive the xpub key from a xprv."""
         for xprv_details in self.xprv_xpub:
@@ -1,8 +1,12 @@
+import json
 import shutil
 import tempfile
 import os
+import unittest
+from unittest import mock
 
 from electrum import constants, blockchain
+from electrum import scrypt
 from electrum.simple_config import SimpleConfig
 from electrum.blockchain import Blockchain, deserialize_header, hash_header, InvalidHeader
 from electrum.util import bfh, make_dir
@@ -384,6 +388,142 @@ class TestBlockchain(ElectrumTestCase):
         self.assertEqual([chain_u], self.get_chains_that_contain_header_helper(self.HEADERS['O']))
         self.assertEqual([chain_z, chain_l], self.get_chains_that_contain_header_helper(self.HEADERS['I']))
 
+    def test_hash_index_follows_forks_and_swaps(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEFOPQR':
+            self._append_header(chain_u, self.HEADERS[name])
+        chain_l = chain_u.fork(self.HEADERS['G'])
+        for name in 'HIJK':  # K makes chain_l stronger: files get swapped
+            self._append_header(chain_l, self.HEADERS[name])
+        self.assertEqual(None, chain_l.parent)
+
+        def check_index(b: Blockchain):
+            self.assertEqual(b.size() * 32, os.stat(b.hash_index_path()).st_size)
+            for height in range(1, b.height() + 1):
+                self.assertEqual(hash_header(b.read_header(height)), b._get_hash_from_index(height))
+        check_index(chain_u)
+        check_index(chain_l)
+        self.assertEqual(hash_header(self.HEADERS['K']), chain_l.get_hash(10))
+        self.assertEqual(hash_header(self.HEADERS['R']), chain_u.get_hash(9))
+        # a missing index gets rebuilt from the headers file
+        chain_l.close_mmap()
+        os.unlink(chain_l.hash_index_path())
+        chain_l.update_size()
+        check_index(chain_l)
+
+    def test_chainwork_cache_is_validated_on_load(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEF':
+            self._append_header(chain_u, self.HEADERS[name])
+        hash_c = hash_header(self.HEADERS['C'])
+        hash_g = hash_header(self.HEADERS['G'])  # not in any of our chains
+        with open(os.path.join(self.data_dir, 'chainwork_cache'), 'w') as f:
+            json.dump([[2, hash_c, 123], [6, hash_g, 456], [3, hash_c, 789]], f)
+        blockchain._CHAINWORK_CACHE.pop(hash_c, None)
+        blockchain._CHAINWORK_CACHE.pop(hash_g, None)
+        blockchain.load_chainwork_cache(self.config)
+        try:
+            self.assertEqual(123, blockchain._CHAINWORK_CACHE[hash_c])
+            self.assertNotIn(hash_g, blockchain._CHAINWORK_CACHE)
+        finally:
+            blockchain._CHAINWORK_CACHE.pop(hash_c, None)
+
+    async def test_headers_snapshot_export_import(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        for name in 'ABCDEF':
+            self._append_header(chain_u, self.HEADERS[name])
+        snapshot_path = os.path.join(self.data_dir, 'headers_snapshot')
+        self.assertEqual(6, blockchain.export_headers_snapshot(snapshot_path))
+
+        # import into a fresh headers dir
+        data_dir2 = os.path.join(self.data_dir, 'other')
+        make_dir(data_dir2)
+        config2 = SimpleConfig({'electrum_path': data_dir2})
+        blockchain.blockchains = {}
+        blockchain.blockchains[constants.net.GENESIS] = chain_2 = Blockchain(
+            config=config2, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_2.path(), 'w+').close()
+        self._append_header(chain_2, self.HEADERS['A'])
+        self.assertEqual(5, await blockchain.import_headers_snapshot(snapshot_path))
+        self.assertEqual(5, chain_2.height())
+        self.assertEqual(hash_header(self.HEADERS['F']), chain_2.get_hash(5))
+        self.assertEqual(0, await blockchain.import_headers_snapshot(snapshot_path))
+
+        # corrupted snapshots are rejected
+        with open(snapshot_path, 'rb') as f:
+            blob = bytearray(f.read())
+        blob[-1] ^= 0xff
+        with open(snapshot_path, 'wb') as f:
+            f.write(blob)
+        with self.assertRaises(blockchain.InvalidHeadersSnapshot):
+            blockchain.read_headers_snapshot(snapshot_path)
+
+    def test_read_header_after_write_and_truncate(self):
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        self.assertIsNone(chain_u.read_header(0))
+        self._append_header(chain_u, self.HEADERS['A'])
+        self._append_header(chain_u, self.HEADERS['B'])
+        self._append_header(chain_u, self.HEADERS['C'])
+        self.assertEqual(self.HEADERS['C'], chain_u.read_header(2))
+        # overwrite the tip: the file gets truncated and the map recreated
+        chain_u.write(bfh(blockchain.serialize_header(self.HEADERS['B'])), 1 * 80)
+        self.assertEqual(1, chain_u.height())
+        self.assertEqual(self.HEADERS['B'], chain_u.read_header(1))
+        self.assertIsNone(chain_u.read_header(2))
+        # reads keep working without a map
+        chain_u.close_mmap()
+        self.assertEqual(self.HEADERS['A'], chain_u.read_header(0))
+        self.assertEqual(self.HEADERS['B'], chain_u.read_header(1))
+
+    def test_header_writes_are_group_committed(self):
+        self.config.NETWORK_HEADERS_FSYNC_EVERY_N = 2
+        self.config.NETWORK_HEADERS_FSYNC_INTERVAL_MS = 3600 * 1000
+        blockchain.blockchains[constants.net.GENESIS] = chain_u = Blockchain(
+            config=self.config, forkpoint=0, parent=None,
+            forkpoint_hash=constants.net.GENESIS, prev_hash=None)
+        open(chain_u.path(), 'w+').close()
+        with mock.patch.object(blockchain.os, 'fsync', wraps=os.fsync) as fsync:
+            self._append_header(chain_u, self.HEADERS['A'])
+            self.assertEqual(0, fsync.call_count)
+            self._append_header(chain_u, self.HEADERS['B'])
+            self.assertEqual(1, fsync.call_count)
+            self._append_header(chain_u, self.HEADERS['C'])
+            self.assertEqual(1, fsync.call_count)
+            # size is tracked without stat-ing the file
+            self.assertEqual(2, chain_u.height())
+            self.assertEqual(self.HEADERS['C'], chain_u.read_header(2))
+            # remapping and indexing wait for the flush
+            self.assertIsNone(chain_u._mmap)
+            self.assertEqual(2 * 32, os.stat(chain_u.hash_index_path()).st_size)
+            self.assertEqual(hash_header(self.HEADERS['C']), chain_u.get_hash(2))
+            # flushes are due once the fsync interval has passed
+            blockchain.flush_due_writes()
+            self.assertEqual(1, fsync.call_count)
+            chain_u._last_fsync -= 3600
+            blockchain.flush_due_writes()
+            self.assertEqual(2, fsync.call_count)
+            self.assertIsNotNone(chain_u._mmap)
+            self.assertEqual(3 * 32, os.stat(chain_u.hash_index_path()).st_size)
+            self.assertEqual(hash_header(self.HEADERS['C']), chain_u._get_hash_from_index(2))
+            blockchain.flush_pending_writes()
+            self.assertEqual(2, fsync.call_count)
+            self.assertFalse(chain_u.is_flush_due())
+        chain_u.update_size()
+        self.assertEqual(2, chain_u.height())
+
     def test_target_to_bits(self):
         # https://github.com/bitcoin/bitcoin/blob/7fcf53f7b4524572d1d0c9a5fdc388e87eb02416/src/arith_uint256.h#L269
         self.assertEqual(0x05123456, Blockchain.target_to_bits(0x1234560000))
@@ -454,7 +594,68 @@ class TestVerifyHeader(ElectrumTestCase):
             other_target = Blockchain.bits_to_target(0x1d00eeee)
             Blockchain.verify_header(self.header, self.prev_hash, other_target)
 
+    def test_precomputed_pow_hash(self):
+        pow_hash = blockchain.pow_hash_header(self.header)
+        self.assertEqual([pow_hash], blockchain.pow_hash_raw_headers(bfh(self.valid_header)))
+        # a precomputed PoW hash is trusted as-is
+        Blockchain.verify_header(self.header, self.prev_hash, self.target, pow_hash='00' * 32)
+        with self.assertRaises(InvalidHeader):
+            Blockchain.verify_header(self.header, self.prev_hash, self.target, pow_hash='ff' * 32)
+
     def test_insufficient_pow(self):
         with self.assertRaises(InvalidHeader):
-            self.header["nonce"] = 42
-            Blockchain.verify_header(self.header, self.prev_hash, self.target)
+            header = dict(self.header)
+            header["nonce"] = 42
+            Blockchain.verify_header(header, self.prev_hash, self.target)
+
+    def test_block_header_fields(self):
+        header = self.header
+        self.assertEqual(1, header.version)
+        self.assertEqual(self.prev_hash, header.prev_block_hash)
+        self.assertEqual("2d05f0c9c3e1c226e63b5fac240137687544cf631cd616fd34fd188fc9020866", header.merkle_root)
+        self.assertEqual(1231660825, header["timestamp"])
+        self.assertEqual(0x1d00ffff, header['bits'])
+        self.assertEqual(100, header.block_height)
+        self.assertEqual(self.valid_header, blockchain.serialize_header(header))
+        self.assertEqual(self.valid_header, blockchain.serialize_header(dict(header)))
+        self.assertEqual(blockchain.hash_raw_header(self.valid_header), blockchain.hash_header(header))
+        self.assertEqual(dict(header), header)
+        self.assertNotIn('mock', header)
+        with self.assertRaises(TypeError):
+            header['nonce'] = 42
+
+
+class TestScryptBatch(ElectrumTestCase):
+
+    # (header, scrypt hash) vectors, also in electrum/scrypt.py
+    vectors = [
+        ("00"*80, "161d0876f3b93b1048cda1bdeaa7332ee210f7131b42013cb43913a6553a4b69"),
+        ("ff"*80, "5253069c14ecedf978745486375ee37415e977f55cdbedac31ebee8bf33dd127"),
+        ("010000000000000000000000000000000000000000000000000000000000000000000000d9ced4ed1130f7b7faad9be25323ffafa33232a17c3edf6cfd97bee6bafbdd97b9aa8e4ef0ff0f1ecd513f7c", "001e67b013726fd7382e9acb69165b4b6316227fb3156b5b414ba6340c050000"),
+        ("01000000ae178934851bfa0e83ccb6a3fc4bfddff3641e104b6c4680c31509074e699be2bd672d8d2199ef37a59678f92443083e3b85edef8b45c71759371f823bab59a97126614f44d5001d45920180", "01796dae1f78a72dfb09356db6f027cd884ba0201e6365b72aa54b3b00000000"),
+        ("020000008f49e5fd7ef50db9a2a1bff5d3e93717a096329a8ac802a248463ef366ceea1099b1fd0db4ce8f4728251711f759081d0b5b4da015fb78421d8ffbfda1105a2abda1db521b64101b00e60cd0", "461ae94540dc88c9bffbf42bb47e46a2416280adbeeb1d883c18090000000000"),
+    ]
+
+    def test_scalar(self):
+        for header, expected in self.vectors:
+            self.assertEqual(expected, scrypt.scrypt_1024_1_1_80(bfh(header)).hex())
+
+    def test_batch_matches_scalar(self):
+        headers = [bfh(header) for header, _ in self.vectors]
+        expected = [bfh(h) for _, h in self.vectors]
+        self.assertEqual(expected, scrypt.scrypt_1024_1_1_80_batch(headers))
+        self.assertEqual([], scrypt.scrypt_1024_1_1_80_batch([]))
+        with self.assertRaises(ValueError):
+            scrypt.scrypt_1024_1_1_80_batch([b"\x00" * 79])
+
+    @unittest.skipIf(scrypt.np is None, "numpy not available")
+    def test_numpy_batch_matches_scalar_across_batches(self):
+        headers = [bfh(header) for header, _ in self.vectors]
+        headers += [bytes([i]) * 80 for i in range(3)]
+        expected = [scrypt.scrypt_1024_1_1_80(h) for h in headers]
+        orig_batch_size = scrypt._BATCH_SIZE
+        scrypt._BATCH_SIZE = 3  # exercise partial batches
+        try:
+            self.assertEqual(expected, scrypt.scrypt_1024_1_1_80_batch(headers))
+        finally:
+            scrypt._BATCH_SIZE = orig_batch_size
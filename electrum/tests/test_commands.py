@@ -236,6 +236,59 @@ class TestCommandsTestnet(ElectrumTestCase):
         self.assertEqual("02000000000101a0a8800d2d6bb0a4a8b93b793f39439c4139a40d30e634cf5cd601e5391de6ed0100000000fdffffff0240e2010000000000160014810480bbaf62145abf945ebe5f657c665a3a3732462b060000000000160014a5103285eb519f826520a9f7d3227e1eaa7ec5f802473044022057a6f4b1ec63336c7d0ba233e785ec9f2e2d9c2d67617a50e069f4498ee6a3b7022032fb331e0bef06f46e9cb77bfe94413142653c4912516835e941fa7f170c1a53012103001b55f19541faaf7e6d57dd1bdb9fdc37725fc500e12f2418cc11e0aed4154978181e00",
                          tx_str)
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_onchain_history_pagination(self, mock_save_db):
+        wallet = restore_wallet_from_text('disagree rug lemon bean unaware square alone beach tennis exhibit fix mimic',
+                                          gap_limit=2,
+                                          path='if_this_exists_mocking_failed_648151893',
+                                          config=self.config)['wallet']
+        funding_tx = Transaction('0200000000010165806607dd458280cb57bf64a16cf4be85d053145227b98c28932e953076b8e20000000000fdffffff02ac150700000000001600147e3ddfe6232e448a8390f3073c7a3b2044fd17eb102908000000000016001427fbe3707bc57e5bb63d6f15733ec88626d8188a02473044022049ce9efbab88808720aa563e2d9bc40226389ab459c4390ea3e89465665d593502206c1c7c30a2f640af1e463e5107ee4cfc0ee22664cfae3f2606a95303b54cdef80121026269e54d06f7070c1f967eb2874ba60de550dfc327a945c98eb773672d9411fd77181e00')
+        funding_txid = funding_tx.txid()
+        wallet.adb.receive_tx_callback(funding_tx, TX_HEIGHT_UNCONFIRMED)
+        funding_addr = wallet.adb.db.get_txo_addresses(funding_txid)[0]
+        wallet.adb.receive_history_callback(funding_addr, [(funding_txid, 1972340)], {})
+        cmds = Commands(config=self.config)
+        tx_str = await cmds.payto(
+            destination="tb1qsyzgpwa0vg2940u5t6l97etuvedr5dejpf9tdy",
+            amount="0.00123456",
+            feerate=50,
+            locktime=1972344,
+            addtransaction=True,
+            wallet=wallet)
+        spending_txid = tx_from_any(tx_str).txid()
+
+        page = await cmds.onchain_history(limit=1, wallet=wallet)
+        self.assertEqual([funding_txid], [item['txid'] for item in page['transactions']])
+        self.assertEqual(f"1972340:-1:{funding_txid}", page['next_cursor'])
+        cursor = page['next_cursor']
+        page = await cmds.onchain_history(limit=1, cursor=cursor, wallet=wallet)
+        self.assertEqual([spending_txid], [item['txid'] for item in page['transactions']])
+        self.assertIsNone(page['next_cursor'])
+        # the pages match the full history
+        history = await cmds.onchain_history(wallet=wallet)
+        self.assertEqual([funding_txid, spending_txid], [item['txid'] for item in history['transactions']])
+        self.assertEqual(history['transactions'][1]['bc_balance'], page['transactions'][0]['bc_balance'])
+        # height filters
+        page = await cmds.onchain_history(to_height=1972341, limit=10, wallet=wallet)
+        self.assertEqual([funding_txid], [item['txid'] for item in page['transactions']])
+        self.assertIsNone(page['next_cursor'])
+        # like without pagination, height filters exclude unconfirmed and local txs
+        for from_height in (1972340, 1972341):
+            page = await cmds.onchain_history(from_height=from_height, limit=10, wallet=wallet)
+            history = await cmds.onchain_history(from_height=from_height, wallet=wallet)
+            self.assertEqual([item['txid'] for item in history['transactions']],
+                             [item['txid'] for item in page['transactions']])
+        self.assertEqual([], page['transactions'])
+        # the tx of a cursor may disappear between pages
+        wallet.adb.remove_transaction(spending_txid)
+        page = await cmds.onchain_history(limit=1, cursor=cursor, wallet=wallet)
+        self.assertEqual([], page['transactions'])
+        self.assertIsNone(page['next_cursor'])
+        page = await cmds.onchain_history(limit=1, cursor=f"1972339:-1:{'00' * 32}", wallet=wallet)
+        self.assertEqual([funding_txid], [item['txid'] for item in page['transactions']])
+        with self.assertRaises(Exception):
+            await cmds.onchain_history(cursor='00' * 32, wallet=wallet)
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     async def test_payto__confirmed_only(self, mock_save_db):
         """test that payto respects 'confirmed_only' config var"""
@@ -1,4 +1,11 @@
-from electrum.interface import ServerAddr
+import asyncio
+from collections import defaultdict, OrderedDict
+from unittest import mock
+
+from aiorpcx import Notification
+from aiorpcx.jsonrpc import JSONRPC, RPCError
+
+from electrum.interface import ServerAddr, RequestBatcher, ServerStats, NotificationSession
 
 from . import ElectrumTestCase
 
@@ -46,3 +53,265 @@ class TestServerAddr(ElectrumTestCase):
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50002, protocol="s").to_friendly_name())
         self.assertEqual("[2400:6180:0:d1::86b:e001]:50001:t",
                          ServerAddr(host="2400:6180:0:d1::86b:e001", port=50001, protocol="t").to_friendly_name())
+
+
+class MockBatchSession:
+
+    def __init__(self, *, supports_batches=True, drops_batches=False):
+        self.supports_batches = supports_batches
+        self.drops_batches = drops_batches
+        self.batches = []
+        self.single_requests = []
+        self.interface = mock.Mock()
+
+    def maybe_log(self, msg):
+        pass
+
+    @staticmethod
+    def _respond(method, params):
+        if params == ['bad']:
+            return RPCError(JSONRPC.INVALID_ARGS, 'bad params')
+        return f"{method}:{params[0]}"
+
+    async def send_request(self, method, params, timeout=None):
+        self.single_requests.append((method, params))
+        result = self._respond(method, params)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def send_batch(self):
+        session = self
+
+        class Batch:
+            def __init__(self):
+                self.requests = []
+                self.results = None
+
+            def add_request(self, method, args=()):
+                self.requests.append((method, args))
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, exc_type, exc_value, traceback):
+                if not session.supports_batches:
+                    raise RPCError(JSONRPC.INVALID_REQUEST, 'batches not supported')
+                if session.drops_batches:
+                    raise asyncio.TimeoutError()
+                session.batches.append(self.requests)
+                self.results = tuple(session._respond(*req) for req in self.requests)
+        return Batch()
+
+
+class TestRequestBatcher(ElectrumTestCase):
+
+    async def test_concurrent_requests_are_batched(self):
+        session = MockBatchSession()
+        batcher = RequestBatcher(session, max_size=3, latency=0.01)
+        results = await asyncio.gather(*[
+            batcher.send_request('blockchain.transaction.get', [str(i)]) for i in range(5)])
+        self.assertEqual([f'blockchain.transaction.get:{i}' for i in range(5)], results)
+        self.assertEqual([3, 2], [len(batch) for batch in session.batches])
+        self.assertEqual([], session.single_requests)
+
+    async def test_errors_are_returned_per_request(self):
+        session = MockBatchSession()
+        batcher = RequestBatcher(session, max_size=10, latency=0.01)
+        results = await asyncio.gather(
+            batcher.send_request('blockchain.scripthash.get_history', ['good']),
+            batcher.send_request('blockchain.scripthash.get_history', ['bad']),
+            return_exceptions=True)
+        self.assertEqual('blockchain.scripthash.get_history:good', results[0])
+        self.assertIsInstance(results[1], RPCError)
+        self.assertEqual(1, len(session.batches))
+
+    async def test_fallback_to_single_requests(self):
+        session = MockBatchSession(supports_batches=False)
+        batcher = RequestBatcher(session, max_size=10, latency=0.01)
+        results = await asyncio.gather(*[
+            batcher.send_request('blockchain.transaction.get_merkle', [str(i)]) for i in range(3)])
+        self.assertEqual([f'blockchain.transaction.get_merkle:{i}' for i in range(3)], results)
+        self.assertFalse(batcher.batches_supported)
+        self.assertEqual(3, len(session.single_requests))
+        # once we know, requests are no longer held back
+        self.assertEqual('x:4', await batcher.send_request('x', ['4']))
+        self.assertEqual(4, len(session.single_requests))
+
+    async def test_fallback_to_single_requests_on_timeout(self):
+        session = MockBatchSession(drops_batches=True)
+        batcher = RequestBatcher(session, max_size=10, latency=0.01)
+        results = await asyncio.gather(*[
+            batcher.send_request('blockchain.transaction.get_merkle', [str(i)]) for i in range(3)])
+        self.assertEqual([f'blockchain.transaction.get_merkle:{i}' for i in range(3)], results)
+        self.assertFalse(batcher.batches_supported)
+        self.assertEqual(3, len(session.single_requests))
+
+    async def test_disabled_with_max_size_one(self):
+        session = MockBatchSession()
+        batcher = RequestBatcher(session, max_size=1, latency=0.01)
+        await asyncio.gather(*[batcher.send_request('x', [str(i)]) for i in range(3)])
+        self.assertEqual([], session.batches)
+        self.assertEqual(3, len(session.single_requests))
+
+
+class TestServerStats(ElectrumTestCase):
+
+    def test_record(self):
+        stats = ServerStats()
+        stats.record('blockchain.transaction.get', 0.005)
+        stats.record('blockchain.transaction.get', 0.3)
+        stats.record('blockchain.transaction.get', 20, error=True)
+        d = stats.to_dict()
+        self.assertEqual(3, d['requests'])
+        self.assertEqual(1, d['errors'])
+        tx_stats = d['methods']['blockchain.transaction.get']
+        self.assertEqual(1, tx_stats['latency_histogram']['<10ms'])
+        self.assertEqual(1, tx_stats['latency_histogram']['<500ms'])
+        self.assertEqual(1, tx_stats['latency_histogram']['>=10000ms'])
+        # heavy wallet requests do not count towards the latency score
+        self.assertIsNone(stats.get_latency())
+        self.assertIsNone(d['latency_ms'])
+
+    def test_latency_score(self):
+        stats = ServerStats()
+        for _ in range(ServerStats.MIN_SCORED_SAMPLES - 1):
+            stats.record('server.ping', 0.1)
+        self.assertIsNone(stats.get_latency())
+        stats.record('blockchain.estimatefee', 0.1)
+        self.assertAlmostEqual(0.1, stats.get_latency())
+        for _ in range(20):
+            stats.record('server.ping', 2.0)
+        self.assertGreater(stats.get_latency(), 1.9)
+
+
+class MockSubscriptionSession(NotificationSession):
+
+    def __init__(self, *, can_unsubscribe=True):
+        # note: skips RPCSession.__init__, there is no transport
+        self.subscriptions = defaultdict(list)
+        self.cache = {}
+        self._subscription_requests = {}
+        self._pending_subscriptions = {}
+        self._pending_unsubscriptions = {}
+        self._unsubscribed_keys = OrderedDict()
+        self._server_can_unsubscribe = True
+        self.can_unsubscribe = can_unsubscribe
+        self.requests = []
+        self.release = asyncio.Event()
+        self.release.set()
+
+    def maybe_log(self, msg):
+        pass
+
+    async def send_request(self, method, params, timeout=None):
+        self.requests.append((method, params))
+        await self.release.wait()
+        if method.endswith('.unsubscribe'):
+            if not self.can_unsubscribe:
+                raise RPCError(JSONRPC.METHOD_NOT_FOUND, f'unknown method {method}')
+            return True
+        return f'status:{params[0]}'
+
+    async def send_request_batched(self, method, params, *, timeout=None):
+        return await self.send_request(method, params)
+
+
+class TestNotificationSessionSubscriptions(ElectrumTestCase):
+
+    SUBSCRIBE = 'blockchain.scripthash.subscribe'
+    UNSUBSCRIBE = 'blockchain.scripthash.unsubscribe'
+
+    async def _notify(self, session, sh, status):
+        await session.handle_request(Notification(self.SUBSCRIBE, [sh, status]))
+
+    async def test_concurrent_subscriptions_are_deduplicated(self):
+        session = MockSubscriptionSession()
+        session.release.clear()
+        queues = [asyncio.Queue() for _ in range(3)]
+        tasks = [asyncio.create_task(session.subscribe(self.SUBSCRIBE, ['sh'], q)) for q in queues]
+        await asyncio.sleep(0)
+        session.release.set()
+        await asyncio.gather(*tasks)
+        # a later subscriber is served from the cache
+        queues.append(asyncio.Queue())
+        await session.subscribe(self.SUBSCRIBE, ['sh'], queues[-1])
+        self.assertEqual([(self.SUBSCRIBE, ['sh'])], session.requests)
+        for q in queues:
+            self.assertEqual(['sh', 'status:sh'], q.get_nowait())
+        # notifications are fanned out to all subscribers
+        await self._notify(session, 'sh', 'new')
+        for q in queues:
+            self.assertEqual(['sh', 'new'], q.get_nowait())
+
+    async def test_unsubscribe_is_reference_counted(self):
+        session = MockSubscriptionSession()
+        q1, q2 = asyncio.Queue(), asyncio.Queue()
+        await session.subscribe(self.SUBSCRIBE, ['sh'], q1)
+        await session.subscribe(self.SUBSCRIBE, ['sh'], q2)
+        session.unsubscribe(q1)
+        await asyncio.sleep(0)
+        self.assertEqual([(self.SUBSCRIBE, ['sh'])], session.requests)
+        session.unsubscribe(q2)
+        await asyncio.sleep(0)
+        self.assertEqual([(self.SUBSCRIBE, ['sh']), (self.UNSUBSCRIBE, ['sh'])], session.requests)
+        # a late notification is ignored
+        await self._notify(session, 'sh', 'late')
+        self.assertNotIn(session.get_hashable_key_for_rpc_call(self.SUBSCRIBE, ['sh']), session.cache)
+        # subscribing again goes to the server
+        q3 = asyncio.Queue()
+        await session.subscribe(self.SUBSCRIBE, ['sh'], q3)
+        self.assertEqual((self.SUBSCRIBE, ['sh']), session.requests[-1])
+        self.assertEqual(['sh', 'status:sh'], q3.get_nowait())
+
+    async def test_resubscribe_while_unsubscribing(self):
+        session = MockSubscriptionSession()
+        session.release.clear()
+        q1, q2 = asyncio.Queue(), asyncio.Queue()
+        t1 = asyncio.create_task(session.subscribe(self.SUBSCRIBE, ['sh'], q1))
+        await asyncio.sleep(0)
+        # the only subscriber leaves while the subscription is in flight,
+        # and a new one arrives before the unsubscription is sent
+        session.unsubscribe(q1)
+        t2 = asyncio.create_task(session.subscribe(self.SUBSCRIBE, ['sh'], q2))
+        await asyncio.sleep(0)
+        session.release.set()
+        await asyncio.gather(t1, t2)
+        # the server ends up subscribed
+        self.assertEqual(
+            [(self.SUBSCRIBE, ['sh']), (self.UNSUBSCRIBE, ['sh']), (self.SUBSCRIBE, ['sh'])],
+            session.requests)
+        self.assertFalse(session._pending_subscriptions)
+        self.assertFalse(session._pending_unsubscriptions)
+        self.assertEqual(['sh', 'status:sh'], q2.get_nowait())
+        await self._notify(session, 'sh', 'new')
+        self.assertEqual(['sh', 'new'], q2.get_nowait())
+
+    async def test_unsubscribed_keys_are_bounded(self):
+        session = MockSubscriptionSession()
+        session.MAX_UNSUBSCRIBED_KEYS = 3
+        for i in range(5):
+            q = asyncio.Queue()
+            await session.subscribe(self.SUBSCRIBE, [f'sh{i}'], q)
+            session.unsubscribe(q)
+        await asyncio.sleep(0)
+        self.assertEqual(
+            [session.get_hashable_key_for_rpc_call(self.SUBSCRIBE, [f'sh{i}']) for i in range(2, 5)],
+            list(session._unsubscribed_keys))
+
+    async def test_server_without_unsubscribe(self):
+        session = MockSubscriptionSession(can_unsubscribe=False)
+        q1, q2 = asyncio.Queue(), asyncio.Queue()
+        await session.subscribe(self.SUBSCRIBE, ['sh1'], q1)
+        await session.subscribe(self.SUBSCRIBE, ['sh2'], q2)
+        session.unsubscribe(q1)
+        await asyncio.sleep(0)
+        self.assertFalse(session._server_can_unsubscribe)
+        # after that, subscriptions are kept, and their notifications still accepted
+        session.unsubscribe(q2)
+        await asyncio.sleep(0)
+        self.assertEqual(1, sum(method == self.UNSUBSCRIBE for method, _ in session.requests))
+        self.assertEqual(['sh2', 'status:sh2'], q2.get_nowait())
+        await self._notify(session, 'sh2', 'new')
+        self.assertTrue(q2.empty())
+        self.assertEqual('new', session.cache[session.get_hashable_key_for_rpc_call(self.SUBSCRIBE, ['sh2'])])
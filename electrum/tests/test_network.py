@@ -1,11 +1,14 @@
 import asyncio
 import tempfile
+import threading
 import unittest
+from unittest import mock
 
 from electrum import constants
 from electrum.simple_config import SimpleConfig
 from electrum import blockchain
-from electrum.interface import Interface, ServerAddr
+from electrum.interface import Interface, ServerAddr, ServerStats
+from electrum.network import Network
 from electrum.crypto import sha256
 from electrum.util import OldTaskGroup
 from electrum import util
@@ -126,6 +129,150 @@ class TestNetwork(ElectrumTestCase):
         self.assertEqual(('catchup', 7), res)
         self.assertEqual(self.interface.q.qsize(), 0)
 
+    async def test_pipelined_catchup_connects_chunks_in_order(self):
+        blockchain.blockchains = {}
+        self.config.NETWORK_HEADERS_PIPELINE_WINDOW = 3
+        ifa = self.interface
+        ifa.tip = 5 * 2016 + 100
+        in_flight = 0
+        max_in_flight = 0
+        async def mock_fetch_chunk(index, size):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01 * (3 - index % 3))  # responses arrive out of order
+            in_flight -= 1
+            return "00" * blockchain.HEADER_SIZE * size
+        connected = []
+        def mock_connect_chunk(index, hexdata, *, pow_hashes=None):
+            connected.append((index, len(hexdata) // (2 * blockchain.HEADER_SIZE)))
+            return True
+        ifa._fetch_chunk = mock_fetch_chunk
+        ifa.blockchain.connect_chunk = mock_connect_chunk
+        res = await ifa.sync_until(0, next_height=5 * 2016 + 100)
+        self.assertEqual(('catchup', 5 * 2016 + 101), res)
+        self.assertEqual([(0, 2016), (1, 2016), (2, 2016), (3, 2016), (4, 2016), (5, 101)], connected)
+        self.assertEqual(3, max_in_flight)
+
+
+class TestFetchFromAnyInterface(ElectrumTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        constants.set_regtest()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        constants.set_mainnet()
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        blockchain.blockchains = {}
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.main, self.helper, self.other_chain = [MockInterface(self.config) for _ in range(3)]
+        self.helper.blockchain = self.main.blockchain
+        for iface in (self.main, self.helper, self.other_chain):
+            iface.ready.set_result(1)
+        self.network = Network.__new__(Network)
+        self.network.config = self.config
+        self.network.logger = mock.Mock()
+        self.network.interfaces_lock = threading.Lock()
+        self.network.interfaces = {i: iface for i, iface in enumerate((self.main, self.helper, self.other_chain))}
+
+    async def _fetch_concurrently(self, n, *, fail_on=None):
+        used = []
+        release = asyncio.Event()
+        async def fetch(iface):
+            used.append(iface)
+            await release.wait()
+            if iface is fail_on:
+                raise Exception('helper error')
+            return iface
+        tasks = [asyncio.create_task(self.network.fetch_from_any_interface(self.main, fetch)) for _ in range(n)]
+        await asyncio.sleep(0)
+        release.set()
+        return used, await asyncio.gather(*tasks)
+
+    async def test_fanout_disabled_by_default(self):
+        used, results = await self._fetch_concurrently(3)
+        self.assertEqual([self.main] * 3, used)
+
+    async def test_fanout_respects_chain_and_limit(self):
+        self.config.NETWORK_FANOUT_FETCHES = True
+        self.config.NETWORK_FANOUT_MAX_CONCURRENT_PER_SERVER = 1
+        used, results = await self._fetch_concurrently(4)
+        self.assertEqual(3, used.count(self.main))
+        self.assertEqual(1, used.count(self.helper))
+        self.assertEqual([self.main, self.helper, self.main, self.main], results)
+        self.assertEqual(0, self.main.num_fanout_fetches)
+        self.assertEqual(0, self.helper.num_fanout_fetches)
+
+    async def test_fanout_retries_on_main(self):
+        self.config.NETWORK_FANOUT_FETCHES = True
+        used, results = await self._fetch_concurrently(2, fail_on=self.helper)
+        self.assertEqual(2, used.count(self.main))
+        self.assertEqual(1, used.count(self.helper))
+        self.assertEqual([self.main, self.main], results)
+        # results that do not validate are not used either
+        def validate(result):
+            if result is not self.main:
+                raise Exception('invalid')
+        self.assertIs(self.main, await self.network.fetch_from_any_interface(
+            self.main, lambda iface: asyncio.sleep(0, iface), validate=validate))
+
+    async def test_chunks_are_only_fetched_from_our_chain(self):
+        self.config.NETWORK_HEADERS_PIPELINE_MULTI_SERVER = True
+        self.main.network = self.network
+        self.helper.tip = 20_000
+        self.other_chain.tip = 20_000  # a fork, as far ahead
+        chosen = {self.main._choose_interface_for_chunk(index, 2016) for index in range(6)}
+        self.assertEqual({self.main, self.helper}, chosen)
+        # helpers that are behind are skipped too
+        self.helper.tip = 2014
+        chosen = {self.main._choose_interface_for_chunk(0, 2016) for _ in range(6)}
+        self.assertEqual({self.main}, chosen)
+
+class TestServerSelection(ElectrumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.config = SimpleConfig({'electrum_path': self.electrum_path})
+        self.network = Network.__new__(Network)
+        self.network.config = self.config
+        self.network._server_stats = {}
+
+    def _add_server(self, name, latency):
+        server = ServerAddr.from_str(f'{name}:50002:s')
+        if latency is not None:
+            stats = self.network._server_stats[server] = ServerStats()
+            for _ in range(ServerStats.MIN_SCORED_SAMPLES):
+                stats.record('server.ping', latency)
+        return server
+
+    def test_slow_servers_are_tried_last(self):
+        self.config.NETWORK_SLOW_SERVER_LATENCY_MS = 1000
+        slow = self._add_server('slow', 3.0)
+        fast = self._add_server('fast', 0.05)
+        unknown = self._add_server('unknown', None)
+        self.assertTrue(self.network._is_server_slow(slow))
+        self.assertFalse(self.network._is_server_slow(fast))
+        self.assertFalse(self.network._is_server_slow(unknown))
+        # unknown servers score like the median known server that is not slow
+        medium = self._add_server('medium', 0.2)
+        slower = self._add_server('slower', 0.5)
+        self.assertEqual(0.2, self.network._get_server_latency_score(unknown))
+        self.assertEqual([fast, unknown, medium, slower, slow],
+                         sorted([slow, unknown, slower, medium, fast], key=self.network._get_server_latency_score))
+        self.network.interfaces_lock = threading.Lock()
+        self.network.interfaces = {}
+        self.network.interface = None
+        stats = self.network.get_server_stats()
+        self.assertEqual({'slow:50002:s', 'fast:50002:s', 'medium:50002:s', 'slower:50002:s'}, set(stats))
+        self.assertEqual(3000, stats['slow:50002:s']['latency_ms'])
+        self.assertFalse(stats['slow:50002:s']['connected'])
+
 
 if __name__=="__main__":
     constants.set_regtest()
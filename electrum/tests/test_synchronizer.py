@@ -0,0 +1,89 @@
+import asyncio
+from unittest import mock
+
+from electrum.bitcoin import hash160_to_p2pkh
+from electrum.synchronizer import Synchronizer
+
+from . import ElectrumTestCase
+
+
+class TestSynchronizerMainLoop(ElectrumTestCase):
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.up_to_date = False
+        self.adb = mock.Mock()
+        self.adb.db.get_history.return_value = []
+        self.adb.get_addresses.return_value = []
+        self.adb.is_up_to_date.side_effect = lambda: self.up_to_date
+        self.sync = Synchronizer.__new__(Synchronizer)
+        self.sync.adb = self.adb
+        self.sync.asyncio_loop = asyncio.get_running_loop()
+        self.sync.logger = mock.Mock()
+        self.sync._reset()
+        self.main_task = asyncio.create_task(self.sync.main())
+        await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        self.main_task.cancel()
+        await self.sync.taskgroup.cancel_remaining()
+        await super().asyncTearDown()
+
+    async def test_idle_main_loop_does_not_poll(self):
+        num_checks = self.adb.is_up_to_date.call_count
+        await asyncio.sleep(0.3)
+        self.assertEqual(num_checks, self.adb.is_up_to_date.call_count)
+
+    async def test_up_to_date_transitions_are_reported_on_wakeup(self):
+        self.assertEqual(1, self.adb.up_to_date_changed.call_count)
+        self.up_to_date = True
+        self.sync.wakeup()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        self.assertEqual(2, self.adb.up_to_date_changed.call_count)
+        # a wakeup without a change is not reported
+        self.sync.wakeup()
+        await asyncio.sleep(0.01)
+        self.assertEqual(2, self.adb.up_to_date_changed.call_count)
+        # processed notifications are reported, even if we stay up to date
+        self.sync._processed_some_notifications = True
+        self.sync.wakeup()
+        await asyncio.sleep(0.01)
+        self.assertEqual(3, self.adb.up_to_date_changed.call_count)
+
+    async def test_added_addresses_are_subscribed(self):
+        addr = hash160_to_p2pkh(bytes(20))
+        with mock.patch.object(self.sync, '_add_address') as add_address:
+            self.sync.add(addr)
+            await asyncio.sleep(0.01)
+        add_address.assert_called_once_with(addr)
+
+    async def test_subscriptions_are_throttled(self):
+        in_flight, max_in_flight = 0, 0
+        release = asyncio.Event()
+        async def subscribe(method, params, queue):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await release.wait()
+            in_flight -= 1
+        self.sync.interface = mock.Mock()
+        self.sync.interface.session.subscribe = subscribe
+        self.sync._subscription_slots = asyncio.Semaphore(2)
+        addresses = [hash160_to_p2pkh(i.to_bytes(20, 'big')) for i in range(1, 6)]
+        for addr in addresses:
+            self.sync.add(addr)
+        await asyncio.sleep(0.01)
+        self.assertEqual(2, max_in_flight)
+        self.assertEqual(set(), self.sync._adding_addrs)
+        self.assertFalse(self.sync.is_up_to_date())
+        # waiting for slots does not block the main loop
+        num_checks = self.adb.is_up_to_date.call_count
+        self.sync.wakeup()
+        await asyncio.sleep(0.01)
+        self.assertGreater(self.adb.is_up_to_date.call_count, num_checks)
+        release.set()
+        await asyncio.sleep(0.01)
+        self.assertEqual(2, max_in_flight)
+        self.assertEqual(set(addresses), self.sync.requested_addrs)
+        self.assertEqual(set(), self.sync._adding_addrs)
@@ -0,0 +1,142 @@
+import os
+from typing import Optional
+from unittest import mock
+
+from electrum import util
+from electrum.network import Network
+from electrum.transaction import Transaction
+from electrum.tx_cache import TxCache
+
+from . import ElectrumTestCase
+from .test_transaction import signed_blob
+
+
+class TestTxCache(ElectrumTestCase):
+
+    cache = None  # type: Optional[TxCache]
+
+    async def asyncTearDown(self):
+        if self.cache:
+            await self._stop_cache()
+        await super().asyncTearDown()
+
+    def _start_cache(self, max_size: int) -> TxCache:
+        self.cache = TxCache(util.get_asyncio_loop(), os.path.join(self.electrum_path, 'tx_cache'), max_size=max_size)
+        return self.cache
+
+    async def _stop_cache(self):
+        self.cache.stop()
+        await self.cache.stopped_event.wait()
+        self.cache = None
+
+    async def test_get_and_add(self):
+        cache = self._start_cache(max_size=10_000)
+        txid = Transaction(signed_blob).txid()
+        self.assertIsNone(await cache.get_transaction(txid))
+        await cache.add_tx(txid, signed_blob)
+        self.assertEqual(signed_blob, await cache.get_transaction(txid))
+        self.assertEqual(len(signed_blob) // 2, await cache.get_total_size())
+
+    async def test_persisted_across_restarts(self):
+        cache = self._start_cache(max_size=10_000)
+        txid = Transaction(signed_blob).txid()
+        await cache.add_tx(txid, signed_blob)
+        await self._stop_cache()
+        cache = self._start_cache(max_size=10_000)
+        self.assertEqual(signed_blob, await cache.get_transaction(txid))
+        self.assertEqual(len(signed_blob) // 2, await cache.get_total_size())
+
+    async def test_least_recently_used_are_evicted(self):
+        cache = self._start_cache(max_size=300)
+        for i in range(3):
+            await cache.add_tx(f'{i:064x}', 100 * 'aa')
+        # touch the oldest entry, so that the second and third ones are evicted next
+        self.assertIsNotNone(await cache.get_tx(f'{0:064x}'))
+        await cache.add_tx(f'{3:064x}', 100 * 'bb')
+        # once full, the cache is shrunk below its low-water mark
+        self.assertIsNotNone(await cache.get_tx(f'{0:064x}'))
+        self.assertIsNone(await cache.get_tx(f'{1:064x}'))
+        self.assertIsNone(await cache.get_tx(f'{2:064x}'))
+        self.assertIsNotNone(await cache.get_tx(f'{3:064x}'))
+        self.assertEqual(200, await cache.get_total_size())
+        # txs larger than the cache are not stored
+        await cache.add_tx(f'{4:064x}', 301 * 'cc')
+        self.assertIsNone(await cache.get_tx(f'{4:064x}'))
+        self.assertEqual(200, await cache.get_total_size())
+
+    async def test_reads_are_remembered_across_restarts(self):
+        cache = self._start_cache(max_size=300)
+        for i in range(3):
+            await cache.add_tx(f'{i:064x}', 100 * 'aa')
+        self.assertIsNotNone(await cache.get_tx(f'{0:064x}'))
+        await self._stop_cache()
+        cache = self._start_cache(max_size=200)
+        self.assertIsNotNone(await cache.get_tx(f'{0:064x}'))
+        self.assertIsNone(await cache.get_tx(f'{1:064x}'))
+        self.assertIsNone(await cache.get_tx(f'{2:064x}'))
+
+    async def test_shrinking_the_cap_evicts_on_startup(self):
+        cache = self._start_cache(max_size=300)
+        for i in range(3):
+            await cache.add_tx(f'{i:064x}', 100 * 'aa')
+        await self._stop_cache()
+        cache = self._start_cache(max_size=150)
+        self.assertEqual(100, await cache.get_total_size())
+        self.assertIsNotNone(await cache.get_tx(f'{2:064x}'))
+
+    async def test_corrupt_entry_is_dropped(self):
+        cache = self._start_cache(max_size=10_000)
+        txid = Transaction(signed_blob).txid()
+        await cache.add_tx(txid, signed_blob[:-2] + '01')
+        self.assertIsNone(await cache.get_transaction(txid))
+        self.assertIsNone(await cache.get_tx(txid))
+        self.assertEqual(0, await cache.get_total_size())
+
+    async def test_network_get_transaction_uses_cache(self):
+        network = Network.__new__(Network)
+        network.tx_cache = self._start_cache(max_size=10_000)
+        network.interface = None
+        txid = Transaction(signed_blob).txid()
+        with mock.patch.object(Network, '_get_transaction_from_server', return_value=signed_blob) as from_server:
+            self.assertEqual(signed_blob, await network.get_transaction(txid))
+            self.assertEqual(signed_blob, await network.get_transaction(txid))
+        from_server.assert_called_once()
+
+    async def test_merkle_proofs(self):
+        cache = self._start_cache(max_size=10_000)
+        branch = [32 * 'ab', 32 * 'cd']
+        self.assertIsNone(await cache.get_merkle_proof(64 * '1', 64 * '2'))
+        await cache.add_merkle_proof(64 * '1', 64 * '2', 5, branch)
+        await cache.add_merkle_proof(64 * '1', 64 * '3', 6, branch[:1])
+        self.assertEqual((5, branch), await cache.get_merkle_proof(64 * '1', 64 * '2'))
+        self.assertEqual((6, branch[:1]), await cache.get_merkle_proof(64 * '1', 64 * '3'))
+        await cache.remove_merkle_proof(64 * '1', 64 * '2')
+        self.assertIsNone(await cache.get_merkle_proof(64 * '1', 64 * '2'))
+        self.assertEqual(32 + 64, await cache.get_total_size())
+
+    async def test_txs_and_merkle_proofs_share_the_size_cap(self):
+        cache = self._start_cache(max_size=200)
+        await cache.add_merkle_proof(64 * '1', 64 * '2', 0, [32 * 'ab'])
+        await cache.add_tx(f'{0:064x}', 100 * 'aa')
+        self.assertIsNotNone(await cache.get_merkle_proof(64 * '1', 64 * '2'))
+        await cache.add_tx(f'{1:064x}', 100 * 'aa')
+        # evicted in order of last use, across both tables
+        self.assertIsNone(await cache.get_tx(f'{0:064x}'))
+        self.assertIsNone(await cache.get_merkle_proof(64 * '1', 64 * '2'))
+        self.assertIsNotNone(await cache.get_tx(f'{1:064x}'))
+        self.assertEqual(100, await cache.get_total_size())
+
+    async def test_eviction_across_many_entries(self):
+        cache = self._start_cache(max_size=100_000)
+        for i in range(300):
+            if i % 3:
+                await cache.add_tx(f'{i:064x}', 'aa')
+            else:
+                await cache.add_merkle_proof(f'{i:064x}', 64 * '2', 0, [])
+        await self._stop_cache()
+        # 200 txs of 1 byte and 100 proofs of 64 bytes; keep the most recent ones
+        cache = self._start_cache(max_size=1000)
+        self.assertLessEqual(await cache.get_total_size(), 900)
+        self.assertIsNotNone(await cache.get_tx(f'{299:064x}'))
+        self.assertIsNotNone(await cache.get_merkle_proof(f'{297:064x}', 64 * '2'))
+        self.assertIsNone(await cache.get_tx(f'{200:064x}'))
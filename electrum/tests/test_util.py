@@ -1,3 +1,5 @@
+import asyncio
+import random
 from datetime import datetime
 from decimal import Decimal
 
@@ -435,3 +437,113 @@ class TestUtil(ElectrumTestCase):
                          util.age(from_date=now.timestamp()+103012200, since_date=now))
 
 
+
+
+class TestAIMDConcurrencyLimiter(ElectrumTestCase):
+
+    async def test_window_limits_concurrency(self):
+        limiter = util.AIMDConcurrencyLimiter()
+        limiter.window = limiter.MAX_WINDOW = 3
+        max_in_flight = 0
+        release = asyncio.Event()
+        async def request():
+            nonlocal max_in_flight
+            async with limiter.request():
+                max_in_flight = max(max_in_flight, limiter.in_flight)
+                await release.wait()
+        tasks = [asyncio.create_task(request()) for _ in range(10)]
+        await asyncio.sleep(0.01)
+        self.assertEqual(3, limiter.in_flight)
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(3, max_in_flight)
+        self.assertEqual(0, limiter.in_flight)
+
+    async def test_additive_increase_multiplicative_decrease(self):
+        limiter = util.AIMDConcurrencyLimiter()
+        window = limiter.window
+        # slow start while latency stays flat
+        for _ in range(10):
+            limiter.on_response(0.05)
+        self.assertEqual(window + 10, limiter.window)
+        self.assertEqual(0.05, limiter.min_rtt)
+        # timeouts halve the window, then growth is additive
+        limiter.on_timeout()
+        window = limiter.window
+        self.assertEqual((limiter.INITIAL_WINDOW + 10) / 2, window)
+        limiter.on_response(0.05)
+        self.assertAlmostEqual(window + 1 / window, limiter.window)
+        # rising latency shrinks the window
+        for _ in range(40):
+            limiter.on_response(0.05)
+        limiter._last_decrease = 0
+        window = limiter.window
+        for _ in range(15):
+            limiter.on_response(0.5)
+        self.assertLess(limiter.window, window)
+        self.assertGreater(limiter.get_stats()['rtt'], 2 * limiter.min_rtt)
+
+    async def test_window_survives_outliers_and_jitter(self):
+        def on_response(limiter, rtt):
+            limiter._last_decrease = 0  # don't rate limit decreases
+            limiter.on_response(rtt)
+        limiter = util.AIMDConcurrencyLimiter()
+        # one near-instant response must not become the baseline forever
+        on_response(limiter, 0.0001)
+        for _ in range(500):
+            on_response(limiter, 0.05)
+        self.assertGreater(limiter.window, limiter.INITIAL_WINDOW)
+        self.assertEqual(0.05, limiter.min_rtt)
+        # neither must random jitter around a stable latency
+        limiter = util.AIMDConcurrencyLimiter()
+        rng = random.Random(0)
+        for _ in range(1000):
+            on_response(limiter, rng.uniform(0.02, 0.08))
+        self.assertGreater(limiter.window, limiter.INITIAL_WINDOW)
+        # and even steadily rising latency is bounded by the floor
+        for i in range(1000):
+            on_response(limiter, 0.1 * 1.1 ** i)
+        self.assertEqual(limiter.MIN_WINDOW, limiter.window)
+
+    async def test_ignored_latency(self):
+        limiter = util.AIMDConcurrencyLimiter()
+        async with limiter.request() as request:
+            request.ignore_latency()
+        self.assertIsNone(limiter.min_rtt)
+        self.assertEqual(limiter.INITIAL_WINDOW, limiter.window)
+        # timeouts still count
+        with self.assertRaises(asyncio.TimeoutError):
+            async with limiter.request() as request:
+                request.ignore_latency()
+                raise asyncio.TimeoutError()
+        self.assertEqual(limiter.MIN_WINDOW, limiter.window)
+        async with limiter.request():
+            pass
+        self.assertIsNotNone(limiter.min_rtt)
+
+    async def test_timeouts_are_detected(self):
+        limiter = util.AIMDConcurrencyLimiter()
+        with self.assertRaises(asyncio.TimeoutError):
+            async with limiter.request():
+                raise asyncio.TimeoutError()
+        self.assertEqual(limiter.INITIAL_WINDOW / 2, limiter.window)
+        self.assertEqual(0, limiter.in_flight)
+
+    async def test_cancelled_waiter(self):
+        limiter = util.AIMDConcurrencyLimiter()
+        limiter.window = 1
+        release = asyncio.Event()
+        async def request():
+            async with limiter.request():
+                await release.wait()
+        first = asyncio.create_task(request())
+        waiting = asyncio.create_task(request())
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        release.set()
+        await first
+        with self.assertRaises(asyncio.CancelledError):
+            await waiting
+        self.assertEqual(0, limiter.in_flight)
+        async with limiter.request():
+            self.assertEqual(1, limiter.in_flight)
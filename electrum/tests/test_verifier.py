@@ -1,8 +1,14 @@
 # -*- coding: utf-8 -*-
+import asyncio
+import os
+from unittest import mock
 
+from electrum import util
 from electrum.bitcoin import hash_encode
+from electrum.blockchain import BlockHeader
 from electrum.transaction import Transaction
 from electrum.util import bfh
+from electrum.tx_cache import TxCache
 from electrum.verifier import SPV, InnerNodeOfSpvProofIsValidTx
 
 from . import ElectrumTestCase
@@ -49,3 +55,49 @@ class VerifierTestCase(ElectrumTestCase):
         f_tx_hash = hash_encode(bfh(VALID_64_BYTE_TX[:64]))
         with self.assertRaises(InnerNodeOfSpvProofIsValidTx):
             SPV.hash_merkle_root(fake_mbranch, f_tx_hash, 6)
+
+
+class CachedProofTestCase(ElectrumTestCase):
+    TESTNET = True
+
+    async def asyncSetUp(self):
+        await super().asyncSetUp()
+        self.tx_cache = TxCache(util.get_asyncio_loop(), os.path.join(self.electrum_path, 'tx_cache'), max_size=10_000)
+        self.header = BlockHeader(bytes(4) + bytes(32) + bfh(MERKLE_ROOT)[::-1] + bytes(12), 100)
+        self.wallet = mock.Mock()
+        self.network = mock.Mock()
+        self.network.tx_cache = self.tx_cache
+        self.network.bhi_lock = asyncio.Lock()
+        self.network.blockchain().read_header.return_value = self.header
+        self.spv = SPV.__new__(SPV)
+        self.spv.network = self.network
+        self.spv.wallet = self.wallet
+        self.spv.logger = mock.Mock()
+        self.spv.merkle_roots = {}
+        self.spv.requested_merkle = set()
+        self.tx_hash = Transaction(VALID_64_BYTE_TX).txid()
+
+    async def asyncTearDown(self):
+        self.tx_cache.stop()
+        await self.tx_cache.stopped_event.wait()
+        await super().asyncTearDown()
+
+    async def test_cached_proof_is_used(self):
+        self.assertFalse(await self.spv._verify_cached_proof(self.tx_hash, 100))
+        await self.tx_cache.add_merkle_proof(self.tx_hash, self.header.hash(), 3, MERKLE_BRANCH)
+        self.assertTrue(await self.spv._verify_cached_proof(self.tx_hash, 100))
+        self.assertEqual(MERKLE_ROOT, self.spv.merkle_roots[self.tx_hash])
+        tx_hash, tx_info = self.wallet.add_verified_tx.call_args[0]
+        self.assertEqual(self.tx_hash, tx_hash)
+        self.assertEqual((100, 3, self.header.hash()), (tx_info.height, tx_info.txpos, tx_info.header_hash))
+
+    async def test_invalid_cached_proof_is_dropped(self):
+        await self.tx_cache.add_merkle_proof(self.tx_hash, self.header.hash(), 2, MERKLE_BRANCH)
+        self.assertFalse(await self.spv._verify_cached_proof(self.tx_hash, 100))
+        self.assertIsNone(await self.tx_cache.get_merkle_proof(self.tx_hash, self.header.hash()))
+        self.wallet.add_verified_tx.assert_not_called()
+
+    async def test_proof_for_other_block_is_not_used(self):
+        await self.tx_cache.add_merkle_proof(self.tx_hash, 64 * '0', 3, MERKLE_BRANCH)
+        self.assertFalse(await self.spv._verify_cached_proof(self.tx_hash, 100))
+        self.wallet.add_verified_tx.assert_not_called()
@@ -7,6 +7,7 @@ from decimal import Decimal
 import time
 from io import StringIO
 import asyncio
+from unittest import mock
 
 from electrum.storage import WalletStorage
 from electrum.wallet_db import FINAL_SEED_VERSION
@@ -14,9 +15,10 @@ from electrum.wallet import (Abstract_Wallet, Standard_Wallet, create_new_wallet
                              restore_wallet_from_text, Imported_Wallet, Wallet)
 from electrum.exchange_rate import ExchangeBase, FxThread
 from electrum.util import TxMinedInfo, InvalidPassword
-from electrum.bitcoin import COIN
+from electrum.bitcoin import COIN, hash160_to_p2pkh
 from electrum.wallet_db import WalletDB, JsonDB
 from electrum.simple_config import SimpleConfig
+from electrum.bitcoin import history_status
 from electrum import util
 
 from . import ElectrumTestCase
@@ -188,6 +190,30 @@ class TestFiat(ElectrumTestCase):
         self.assertNotIn(ccy, self.fiat_value)
 
 
+class TestWalletDBHistoryStatus(ElectrumTestCase):
+
+    def test_history_status_is_cached_and_updated(self):
+        db = WalletDB('', storage=None, upgrade=False)
+        addr = 'some_address'
+        self.assertIsNone(db.get_addr_history_status(addr))
+        hist = [(64 * 'a', 10), (64 * 'b', 0)]
+        db.set_addr_history(addr, hist)
+        self.assertEqual(history_status(hist), db.get_addr_history_status(addr))
+        with mock.patch('electrum.wallet_db.history_status') as status_fn:
+            db.get_addr_history_status(addr)
+        status_fn.assert_not_called()
+        db.remove_addr_history(addr)
+        self.assertIsNone(db.get_addr_history_status(addr))
+
+    def test_history_status_of_loaded_history(self):
+        hist = [[64 * 'a', 10]]
+        db = WalletDB(json.dumps({'seed_version': FINAL_SEED_VERSION, 'addr_history': {'some_address': hist}}),
+                      storage=None, upgrade=False)
+        self.assertEqual(history_status(hist), db.get_addr_history_status('some_address'))
+        db.clear_history()
+        self.assertIsNone(db.get_addr_history_status('some_address'))
+
+
 class TestCreateRestoreWallet(WalletTestCase):
 
     async def test_create_new_wallet(self):
@@ -286,6 +312,31 @@ class TestCreateRestoreWallet(WalletTestCase):
         self.assertEqual(1, len(wallet.get_receiving_addresses()))
 
 
+class TestImportAddresses(WalletTestCase):
+
+    async def test_import_addresses_from_file(self):
+        addresses = [hash160_to_p2pkh(i.to_bytes(20, 'big')) for i in range(1, 26)]
+        d = restore_wallet_from_text(addresses[0], path=self.wallet_path, config=self.config)
+        wallet = d['wallet']  # type: Imported_Wallet
+        path = os.path.join(self.electrum_path, 'addresses.txt')
+        with open(path, 'w') as f:
+            f.write('\n'.join(addresses[:10]) + '\n')
+            f.write(' '.join(addresses[10:]) + ' notanaddress ' + addresses[1] + '\n')
+        progress = []
+        num_imported, bad = await wallet.import_addresses_from_file(
+            path, chunk_size=7, progress_callback=lambda *args: progress.append(args))
+        self.assertEqual(24, num_imported)
+        self.assertEqual(sorted(['notanaddress', addresses[0], addresses[1]]), sorted(addr for addr, reason in bad))
+        self.assertEqual(set(addresses), set(wallet.get_addresses()))
+        self.assertEqual((24, 3), progress[-1])
+        self.assertLess(1, len(progress))
+        # persisted
+        storage = WalletStorage(self.wallet_path)
+        db = WalletDB(storage.read(), storage=storage, upgrade=True)
+        wallet = Wallet(db, config=self.config)
+        self.assertEqual(sorted(addresses), sorted(wallet.get_addresses()))
+
+
 class TestWalletPassword(WalletTestCase):
 
     async def test_update_password_of_imported_wallet(self):
@@ -614,6 +614,22 @@ class TestWalletKeystoreAddressIntegrityForTestnet(ElectrumTestCase):
         super().setUp()
         self.config = SimpleConfig({'electrum_path': self.electrum_path})
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_synchronize_derives_addresses_in_batches(self, mock_save_db):
+        ks = keystore.from_xpub('vpub5VfkVzoT7qgd5gUKjxgGE2oMJU4zKSktusfLx2NaQCTfSeeSY3S723qXKUZZaJzaF6YaF8nwQgbMTWx54Ugkf4NZvSxdzicENHoLJh96EKg')
+        w = WalletIntegrityHelper.create_standard_wallet(ks, gap_limit=20, config=self.config)
+        xpub_node = bip32.BIP32Node.from_xkey(ks.xpub)
+        def address_at(for_change, n):
+            pubkey = xpub_node.subkey_at_public_derivation([for_change, n]).eckey.get_public_key_bytes()
+            return bitcoin.pubkey_to_address(w.txin_type, pubkey.hex())
+        self.assertEqual([address_at(0, n) for n in range(20)], w.get_receiving_addresses())
+        self.assertEqual([address_at(1, n) for n in range(10)], w.get_change_addresses())
+        # once an address gets used, the gap limit is restored after it
+        used_address = w.get_receiving_addresses()[5]
+        with mock.patch.object(w.adb, 'address_is_old', side_effect=lambda addr: addr == used_address):
+            self.assertEqual(6, w.synchronize())
+        self.assertEqual([address_at(0, n) for n in range(26)], w.get_receiving_addresses())
+
     @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
     async def test_bip39_multisig_seed_p2sh_segwit_testnet(self, mock_save_db):
         # bip39 seed: finish seminar arrange erosion sunny coil insane together pretty lunch lunch rose
@@ -1362,6 +1378,115 @@ class TestWalletSending(ElectrumTestCase):
         wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
         self.assertEqual((0, funding_output_value - 50000, 0), wallet.get_balance())
 
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_balance_index_follows_history_changes(self, mock_save_db):
+        wallet = self.create_standard_wallet_from_seed('fold object utility erase deputy output stadium feed stereo usage modify bean')
+        funding_tx = Transaction('010000000001010f40064d66d766144e17bb3276d96042fd5aee2196bcce7e415f839e55a83de800000000171600147b6d7c7763b9185b95f367cf28e4dc6d09441e73fdffffff02404b4c00000000001976a9141df43441a3a3ee563e560d3ddc7e07cc9f9c3cdb88ac009871000000000017a9143873281796131b1996d2f94ab265327ee5e9d6e28702473044022029c124e5a1e2c6fa12e45ccdbdddb45fec53f33b982389455b110fdb3fe4173102203b3b7656bca07e4eae3554900aa66200f46fec0af10e83daaa51d9e4e62a26f4012103c8f0460c245c954ef563df3b1743ea23b965f98b120497ac53bd6b8e8e9e0f9bbe391400')
+        funding_txid = funding_tx.txid()
+        funding_output_value = 5000000
+        wallet.adb.receive_tx_callback(funding_tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((0, funding_output_value, 0), wallet.get_balance())
+        funding_addr, = wallet.adb.db.get_txo_addresses(funding_txid)
+        other_addr = wallet.get_receiving_addresses()[1]
+        self.assertIn(other_addr, wallet.adb._addr_balance_index)
+
+        # the funding tx gets mined
+        wallet.adb.receive_history_callback(funding_addr, [(funding_txid, 1000)], {})
+        self.assertEqual((funding_output_value, 0, 0), wallet.get_balance())
+        wallet.adb.add_verified_tx(funding_txid, util.TxMinedInfo(height=1000, timestamp=0, txpos=1, header_hash='00' * 32))
+        self.assertEqual((funding_output_value, 0, 0), wallet.get_balance())
+        # only the addresses touched by the tx are recomputed
+        self.assertIn(other_addr, wallet.adb._addr_balance_index)
+
+        # spending a confirmed coin to ourselves keeps the balance confirmed
+        tx = wallet.cpfp(funding_tx, fee=50000)
+        wallet.sign_transaction(tx, password=None)
+        wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual((funding_output_value - 50000, 0, 0), wallet.get_balance())
+        self.assertEqual((0, 0, 0), wallet.get_balance(excluded_coins={tx.txid() + ':0'}))
+
+        # reorg
+        blockchain = mock.Mock()
+        blockchain.read_header.return_value = None
+        self.assertEqual({funding_txid}, wallet.adb.undo_verifications(blockchain, 999))
+        self.assertEqual((funding_output_value - 50000, 0, 0), wallet.get_balance())
+        # the server drops the tx from the history of the address: it becomes local
+        wallet.adb.receive_history_callback(funding_addr, [], {})
+        self.assertEqual((0, funding_output_value - 50000, 0), wallet.get_balance())
+        wallet.adb.remove_transaction(tx.txid())
+        self.assertEqual((0, funding_output_value, 0), wallet.get_balance())
+        # the index matches a recomputation from scratch
+        with wallet.adb.lock:
+            wallet.adb._addr_io_cache.clear()
+            wallet.adb._addr_balance_index.clear()
+        self.assertEqual((0, funding_output_value, 0), wallet.get_balance())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_history_index_is_patched_incrementally(self, mock_save_db):
+        wallet = self.create_standard_wallet_from_seed('fold object utility erase deputy output stadium feed stereo usage modify bean')
+        domain = wallet.get_addresses()
+        def get_history():
+            return [(h.txid, h.delta, h.balance) for h in wallet.adb.get_history(domain)]
+        def get_history_from_scratch():
+            with wallet.adb.lock:
+                wallet.adb._history_indexes.clear()
+            return get_history()
+        self.assertEqual([], get_history())
+        funding_tx = Transaction('010000000001010f40064d66d766144e17bb3276d96042fd5aee2196bcce7e415f839e55a83de800000000171600147b6d7c7763b9185b95f367cf28e4dc6d09441e73fdffffff02404b4c00000000001976a9141df43441a3a3ee563e560d3ddc7e07cc9f9c3cdb88ac009871000000000017a9143873281796131b1996d2f94ab265327ee5e9d6e28702473044022029c124e5a1e2c6fa12e45ccdbdddb45fec53f33b982389455b110fdb3fe4173102203b3b7656bca07e4eae3554900aa66200f46fec0af10e83daaa51d9e4e62a26f4012103c8f0460c245c954ef563df3b1743ea23b965f98b120497ac53bd6b8e8e9e0f9bbe391400')
+        funding_txid = funding_tx.txid()
+        wallet.adb.receive_tx_callback(funding_tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual([(funding_txid, 5000000, 5000000)], get_history())
+
+        tx = wallet.cpfp(funding_tx, fee=50000)
+        wallet.sign_transaction(tx, password=None)
+        wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONF_PARENT)
+        expected = [(funding_txid, 5000000, 5000000), (tx.txid(), -50000, 4950000)]
+        self.assertEqual(expected, get_history())
+        # with nothing changed, the history is not re-sorted
+        with mock.patch.object(wallet.adb, '_get_tx_sort_key') as get_tx_sort_key:
+            self.assertEqual(expected, get_history())
+        get_tx_sort_key.assert_not_called()
+
+        # the child gets mined first: it moves to the front
+        wallet.adb.add_verified_tx(tx.txid(), util.TxMinedInfo(height=1000, timestamp=0, txpos=1, header_hash='00' * 32))
+        expected = [(tx.txid(), -50000, -50000), (funding_txid, 5000000, 4950000)]
+        self.assertEqual(expected, get_history())
+        self.assertEqual(expected, get_history_from_scratch())
+
+        wallet.adb.remove_transaction(tx.txid())
+        self.assertEqual([(funding_txid, 5000000, 5000000)], get_history())
+        self.assertEqual([(funding_txid, 5000000, 5000000)], get_history_from_scratch())
+
+    @mock.patch.object(wallet.Abstract_Wallet, 'save_db')
+    async def test_tx_parents_are_invalidated_incrementally(self, mock_save_db):
+        wallet = self.create_standard_wallet_from_seed('fold object utility erase deputy output stadium feed stereo usage modify bean')
+        funding_tx = Transaction('010000000001010f40064d66d766144e17bb3276d96042fd5aee2196bcce7e415f839e55a83de800000000171600147b6d7c7763b9185b95f367cf28e4dc6d09441e73fdffffff02404b4c00000000001976a9141df43441a3a3ee563e560d3ddc7e07cc9f9c3cdb88ac009871000000000017a9143873281796131b1996d2f94ab265327ee5e9d6e28702473044022029c124e5a1e2c6fa12e45ccdbdddb45fec53f33b982389455b110fdb3fe4173102203b3b7656bca07e4eae3554900aa66200f46fec0af10e83daaa51d9e4e62a26f4012103c8f0460c245c954ef563df3b1743ea23b965f98b120497ac53bd6b8e8e9e0f9bbe391400')
+        funding_txid = funding_tx.txid()
+        funding_parent_txid = funding_tx.inputs()[0].prevout.txid.hex()
+        wallet.adb.receive_tx_callback(funding_tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual({funding_txid: ([funding_parent_txid], [])}, wallet.get_tx_parents(funding_txid))
+
+        tx = wallet.cpfp(funding_tx, fee=50000)
+        wallet.sign_transaction(tx, password=None)
+        wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        self.assertEqual({funding_txid: ([funding_parent_txid], []), tx.txid(): ([funding_txid], [])},
+                         wallet.get_tx_parents(tx.txid()))
+
+        # removing the child keeps the ancestors of the parent
+        with mock.patch.object(wallet, '_get_tx_graph_edges', wraps=wallet._get_tx_graph_edges) as get_edges:
+            wallet.adb.remove_transaction(tx.txid())
+            self.assertNotIn(tx.txid(), wallet._tx_parents_cache)
+            self.assertEqual({funding_txid: ([funding_parent_txid], [])}, wallet.get_tx_parents(funding_txid))
+        get_edges.assert_not_called()
+
+        # re-adding the parent invalidates its descendants
+        wallet.adb.receive_tx_callback(tx, TX_HEIGHT_UNCONFIRMED)
+        wallet.get_tx_parents(tx.txid())
+        wallet._invalidate_tx_parents(funding_txid)
+        self.assertEqual({}, wallet._tx_parents_cache)
+        self.assertEqual({funding_txid: ([funding_parent_txid], []), tx.txid(): ([funding_txid], [])},
+                         wallet.get_tx_parents(tx.txid()))
+
     async def _bump_fee_p2wpkh_when_there_is_a_change_address(self, *, simulate_moving_txs, config):
         wallet = self.create_standard_wallet_from_seed('frost repair depend effort salon ring foam oak cancel receive save usage',
                                                        config=config)
@@ -0,0 +1,224 @@
+import asyncio
+import heapq
+from typing import Optional, Sequence, Tuple, Dict
+
+from .sql_db import SqlDB, sql
+from .transaction import Transaction
+
+
+create_raw_txs = """
+CREATE TABLE IF NOT EXISTS raw_txs (
+txid TEXT NOT NULL,
+raw BLOB NOT NULL,
+size INTEGER NOT NULL,
+last_used INTEGER NOT NULL,
+PRIMARY KEY(txid)
+)"""
+
+create_raw_txs_last_used = """
+CREATE INDEX IF NOT EXISTS raw_txs_last_used ON raw_txs(last_used)"""
+
+create_merkle_proofs = """
+CREATE TABLE IF NOT EXISTS merkle_proofs (
+txid TEXT NOT NULL,
+header_hash TEXT NOT NULL,
+pos INTEGER NOT NULL,
+branch BLOB NOT NULL,
+size INTEGER NOT NULL,
+last_used INTEGER NOT NULL,
+PRIMARY KEY(txid, header_hash)
+)"""
+
+create_merkle_proofs_last_used = """
+CREATE INDEX IF NOT EXISTS merkle_proofs_last_used ON merkle_proofs(last_used)"""
+
+# a proof row is charged its branch plus the two hashes of its key
+MERKLE_PROOF_OVERHEAD = 64
+
+# once full, the cache is shrunk to this fraction of max_size,
+# so that not every insert has to evict
+EVICTION_LOW_WATER = 0.9
+# reads update last_used in batches of this many
+TOUCH_BATCH_SIZE = 100
+EVICTION_BATCH_SIZE = 100
+
+
+class TxCache(SqlDB):
+    """On-disk cache of raw transactions, keyed by txid, and of their SPV
+    merkle proofs, keyed by (txid, block header hash), shared by all wallets
+    of a daemon. The least recently used entries are evicted to stay below max_size.
+    Proofs are not trusted: the verifier checks them against its headers.
+    Note: the cache is not encrypted, not even for encrypted wallets.
+    """
+
+    def __init__(self, asyncio_loop: asyncio.AbstractEventLoop, path: str, *, max_size: int):
+        self.max_size = max_size  # in bytes
+        self._total_size = 0
+        self._clock = 0  # last_used values increase with each access
+        self._raw_tx_touches = {}  # type: Dict[str, int]  # txid -> last_used, not yet written
+        self._merkle_proof_touches = {}  # type: Dict[Tuple[str, str], int]
+        super().__init__(asyncio_loop, path, commit_interval=100)
+
+    def create_database(self):
+        c = self.conn.cursor()
+        c.execute(create_raw_txs)
+        c.execute(create_raw_txs_last_used)
+        c.execute(create_merkle_proofs)
+        c.execute(create_merkle_proofs_last_used)
+        self._total_size = self._clock = 0
+        for table in ('raw_txs', 'merkle_proofs'):
+            c.execute(f"SELECT COALESCE(SUM(size), 0), COALESCE(MAX(last_used), 0) FROM {table}")
+            size, clock = c.fetchone()
+            self._total_size += size
+            self._clock = max(self._clock, clock)
+        self.conn.commit()
+        self._evict()
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    @sql
+    def get_tx(self, txid: str) -> Optional[str]:
+        """Returns the raw tx as hex, if cached."""
+        c = self.conn.cursor()
+        c.execute("SELECT raw FROM raw_txs WHERE txid=?", (txid,))
+        r = c.fetchone()
+        if r is None:
+            return None
+        self._raw_tx_touches[txid] = self._tick()
+        self._maybe_flush_touches()
+        return r[0].hex()
+
+    @sql
+    def add_tx(self, txid: str, raw_tx: str) -> None:
+        """raw_tx must be a complete tx with the given txid."""
+        raw = bytes.fromhex(raw_tx)
+        if len(raw) > self.max_size:
+            return
+        c = self.conn.cursor()
+        c.execute("SELECT size FROM raw_txs WHERE txid=?", (txid,))
+        r = c.fetchone()
+        if r is not None:
+            self._total_size -= r[0]
+        self._raw_tx_touches.pop(txid, None)
+        c.execute("INSERT OR REPLACE INTO raw_txs (txid, raw, size, last_used) VALUES (?,?,?,?)",
+                  (txid, raw, len(raw), self._tick()))
+        self._total_size += len(raw)
+        self._evict()
+
+    @sql
+    def remove_tx(self, txid: str) -> None:
+        c = self.conn.cursor()
+        c.execute("SELECT size FROM raw_txs WHERE txid=?", (txid,))
+        r = c.fetchone()
+        if r is not None:
+            c.execute("DELETE FROM raw_txs WHERE txid=?", (txid,))
+            self._total_size -= r[0]
+
+    @sql
+    def get_merkle_proof(self, txid: str, header_hash: str) -> Optional[Tuple[int, Sequence[str]]]:
+        """Returns (pos, merkle_branch) of txid in the given block, if cached."""
+        c = self.conn.cursor()
+        c.execute("SELECT pos, branch FROM merkle_proofs WHERE txid=? AND header_hash=?", (txid, header_hash))
+        r = c.fetchone()
+        if r is None:
+            return None
+        self._merkle_proof_touches[(txid, header_hash)] = self._tick()
+        self._maybe_flush_touches()
+        pos, branch = r
+        return pos, [branch[i:i+32].hex() for i in range(0, len(branch), 32)]
+
+    @sql
+    def add_merkle_proof(self, txid: str, header_hash: str, pos: int, merkle_branch: Sequence[str]) -> None:
+        branch = b''.join(bytes.fromhex(item) for item in merkle_branch)
+        size = len(branch) + MERKLE_PROOF_OVERHEAD
+        c = self.conn.cursor()
+        self._delete_merkle_proof(txid, header_hash)
+        self._merkle_proof_touches.pop((txid, header_hash), None)
+        c.execute("INSERT INTO merkle_proofs (txid, header_hash, pos, branch, size, last_used) VALUES (?,?,?,?,?,?)",
+                  (txid, header_hash, pos, branch, size, self._tick()))
+        self._total_size += size
+        self._evict()
+
+    @sql
+    def remove_merkle_proof(self, txid: str, header_hash: str) -> None:
+        self._delete_merkle_proof(txid, header_hash)
+
+    def _delete_merkle_proof(self, txid: str, header_hash: str) -> None:
+        c = self.conn.cursor()
+        c.execute("SELECT size FROM merkle_proofs WHERE txid=? AND header_hash=?", (txid, header_hash))
+        r = c.fetchone()
+        if r is not None:
+            c.execute("DELETE FROM merkle_proofs WHERE txid=? AND header_hash=?", (txid, header_hash))
+            self._total_size -= r[0]
+
+    @sql
+    def get_total_size(self) -> int:
+        return self._total_size
+
+    def _maybe_flush_touches(self) -> None:
+        if len(self._raw_tx_touches) + len(self._merkle_proof_touches) >= TOUCH_BATCH_SIZE:
+            self._flush_touches()
+
+    def _flush_touches(self) -> None:
+        c = self.conn.cursor()
+        c.executemany("UPDATE raw_txs SET last_used=? WHERE txid=?",
+                      [(last_used, txid) for txid, last_used in self._raw_tx_touches.items()])
+        c.executemany("UPDATE merkle_proofs SET last_used=? WHERE txid=? AND header_hash=?",
+                      [(last_used, txid, header_hash)
+                       for (txid, header_hash), last_used in self._merkle_proof_touches.items()])
+        self._raw_tx_touches.clear()
+        self._merkle_proof_touches.clear()
+
+    def before_close(self):
+        self._flush_touches()
+
+    def _evict(self) -> None:
+        if self._total_size <= self.max_size:
+            return
+        self._flush_touches()
+        target = int(self.max_size * EVICTION_LOW_WATER)
+        c = self.conn.cursor()
+        while self._total_size > target:
+            # the oldest entries of each table, using its last_used index
+            c.execute("SELECT last_used, size, txid FROM raw_txs ORDER BY last_used LIMIT ?",
+                      (EVICTION_BATCH_SIZE,))
+            txs = c.fetchall()
+            c.execute("SELECT last_used, size, txid, header_hash FROM merkle_proofs ORDER BY last_used LIMIT ?",
+                      (EVICTION_BATCH_SIZE,))
+            proofs = c.fetchall()
+            if not txs and not proofs:
+                self._total_size = 0
+                break
+            # beyond the last row of a full batch, the merged order is not known
+            horizon = min((batch[-1][0] for batch in (txs, proofs) if len(batch) == EVICTION_BATCH_SIZE),
+                          default=None)
+            evicted_txs, evicted_proofs = [], []
+            for row in heapq.merge(txs, proofs, key=lambda row: row[0]):
+                last_used, size = row[0], row[1]
+                if self._total_size <= target or (horizon is not None and last_used > horizon):
+                    break
+                if len(row) == 3:
+                    evicted_txs.append(row[2:])
+                else:
+                    evicted_proofs.append(row[2:])
+                self._total_size -= size
+            c.executemany("DELETE FROM raw_txs WHERE txid=?", evicted_txs)
+            c.executemany("DELETE FROM merkle_proofs WHERE txid=? AND header_hash=?", evicted_proofs)
+
+    async def get_transaction(self, txid: str) -> Optional[str]:
+        """Like get_tx, but drops entries that do not match their txid."""
+        raw_tx = await self.get_tx(txid)
+        if raw_tx is None:
+            return None
+        try:
+            tx = Transaction(raw_tx)
+            tx.deserialize()
+            if tx.txid() == txid:
+                return raw_tx
+        except Exception:
+            pass
+        self.logger.warning(f"dropping corrupt cache entry for {txid}")
+        await self.remove_tx(txid)
+        return None
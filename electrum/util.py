@@ -23,9 +23,10 @@
 import binascii
 import concurrent.futures
 import os, sys, re, json
-from collections import defaultdict, OrderedDict
+import itertools
+from collections import defaultdict, OrderedDict, deque
 from typing import (NamedTuple, Union, TYPE_CHECKING, Tuple, Optional, Callable, Any,
-                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set, Awaitable)
+                    Sequence, Dict, Generic, TypeVar, List, Iterable, Set, Awaitable, Deque)
 from datetime import datetime, timezone
 import decimal
 from decimal import Decimal
@@ -48,6 +49,7 @@ import random
 import secrets
 import functools
 from functools import partial
+from contextlib import asynccontextmanager
 from abc import abstractmethod, ABC
 import socket
 
@@ -1384,6 +1386,144 @@ else:
         return TimeoutAfterAsynciolike(delay)
 
 
+class AIMDConcurrencyLimiter:
+    """Limits the number of concurrent requests to a server, like a semaphore
+    whose size adapts to the server (additive increase, multiplicative decrease).
+
+    The window grows while the median round-trip time of the last few requests
+    stays close to the median over a longer, sliding window of requests, and
+    shrinks when it rises, or when requests time out or the server says it is busy.
+    Use as 'async with limiter.request() as request:' around a single request;
+    call request.ignore_latency() if it was not a round trip to the server
+    (e.g. it was answered from a cache, or by another server).
+    """
+
+    INITIAL_WINDOW = 16
+    MIN_WINDOW = 8
+    MAX_WINDOW = 1000
+    RTT_TOLERANCE = 2.0  # the window shrinks if recent median rtt > RTT_TOLERANCE * baseline median rtt
+    RECENT_RTT_SAMPLES = 20
+    BASELINE_RTT_SAMPLES = 200  # older samples expire
+    DECREASE_FACTOR = 0.9  # on rising latency
+    TIMEOUT_DECREASE_FACTOR = 0.5  # on timeouts and busy servers
+    RTT_SMOOTHING = 0.1
+
+    class _Request:
+        def __init__(self):
+            self.measure_latency = True
+
+        def ignore_latency(self) -> None:
+            self.measure_latency = False
+
+    def __init__(self):
+        self.window = float(self.INITIAL_WINDOW)
+        self._slow_start_threshold = float(self.MAX_WINDOW)
+        self.in_flight = 0
+        self.rtt = None  # type: Optional[float]  # smoothed, in seconds
+        self._rtt_samples = deque(maxlen=self.BASELINE_RTT_SAMPLES)  # type: Deque[float]
+        self._last_decrease = 0.0
+        self._waiters = []  # type: List[asyncio.Future]
+
+    @property
+    def min_rtt(self) -> Optional[float]:
+        """Lowest rtt among the recent requests."""
+        return min(self._rtt_samples) if self._rtt_samples else None
+
+    @asynccontextmanager
+    async def request(self):
+        from .interface import RequestTimedOut
+        await self._acquire()
+        request = self._Request()
+        start = time.monotonic()
+        try:
+            yield request
+        except (RequestTimedOut, asyncio.TimeoutError, aiorpcx.curio.TaskTimeout):
+            self.on_timeout()
+            raise
+        except aiorpcx.jsonrpc.CodeMessageError as e:
+            if e.code in (aiorpcx.jsonrpc.JSONRPC.EXCESSIVE_RESOURCE_USAGE, aiorpcx.jsonrpc.JSONRPC.SERVER_BUSY):
+                self.on_timeout()
+            elif request.measure_latency:  # the server did answer
+                self.on_response(time.monotonic() - start)
+            raise
+        else:
+            if request.measure_latency:
+                self.on_response(time.monotonic() - start)
+        finally:
+            self._release()
+
+    async def _acquire(self) -> None:
+        if self.in_flight < int(self.window) and not self._waiters:
+            self.in_flight += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut in self._waiters:
+                self._waiters.remove(fut)
+            elif not fut.cancelled():
+                self._release()  # we were handed a slot already, pass it on
+            raise
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        while self._waiters and self.in_flight < int(self.window):
+            fut = self._waiters.pop(0)
+            if fut.done():  # cancelled
+                continue
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def on_response(self, rtt: float) -> None:
+        self._rtt_samples.append(rtt)
+        if self.rtt is None:
+            self.rtt = rtt
+        else:
+            self.rtt += self.RTT_SMOOTHING * (rtt - self.rtt)
+        if self._is_latency_rising():
+            self._decrease(self.DECREASE_FACTOR)
+        elif self.window < self._slow_start_threshold:
+            self.window = min(self.MAX_WINDOW, self.window + 1)
+        else:
+            self.window = min(self.MAX_WINDOW, self.window + 1 / self.window)
+
+    def _is_latency_rising(self) -> bool:
+        if len(self._rtt_samples) < 2 * self.RECENT_RTT_SAMPLES:
+            return False
+        recent = sorted(itertools.islice(
+            self._rtt_samples, len(self._rtt_samples) - self.RECENT_RTT_SAMPLES, None))
+        baseline = sorted(self._rtt_samples)
+        recent_median = recent[len(recent) // 2]
+        baseline_median = baseline[len(baseline) // 2]
+        return recent_median > self.RTT_TOLERANCE * baseline_median
+
+    def on_timeout(self) -> None:
+        self._decrease(self.TIMEOUT_DECREASE_FACTOR)
+
+    def _decrease(self, factor: float) -> None:
+        # back off at most once per round trip: the requests
+        # already in flight were sent with the old window
+        now = time.monotonic()
+        if now - self._last_decrease < (self.rtt or 0):
+            return
+        self._last_decrease = now
+        self.window = max(self.MIN_WINDOW, self.window * factor)
+        self._slow_start_threshold = self.window
+
+    def get_stats(self) -> dict:
+        return {
+            'window': int(self.window),
+            'in_flight': self.in_flight,
+            'rtt': self.rtt,
+            'min_rtt': self.min_rtt,
+        }
+
+
 class NetworkJobOnDefaultServer(Logger, ABC):
     """An abstract base class for a job that runs on the main network
     interface. Every time the main interface changes, the job is
@@ -1394,10 +1534,6 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         self.network = network
         self.interface = None  # type: Interface
         self._restart_lock = asyncio.Lock()
-        # Ensure fairness between NetworkJobs. e.g. if multiple wallets
-        # are open, a large wallet's Synchronizer should not starve the small wallets:
-        self._network_request_semaphore = asyncio.Semaphore(100)
-
         self._reset()
         # every time the main interface changes, restart:
         register_callback(self._restart, ['default_server_changed'])
@@ -1410,6 +1546,10 @@ class NetworkJobOnDefaultServer(Logger, ABC):
         """
         self.taskgroup = OldTaskGroup()
         self.reset_request_counters()
+        # Adapts to the current server. Also ensures fairness between NetworkJobs,
+        # e.g. if multiple wallets are open, a large wallet's Synchronizer should
+        # not starve the small wallets:
+        self._network_request_limiter = AIMDConcurrencyLimiter()
 
     async def _start(self, interface: 'Interface'):
         self.logger.debug(f"starting. interface.server={repr(str(interface.server))}")
@@ -1461,6 +1601,22 @@ class NetworkJobOnDefaultServer(Logger, ABC):
     def num_requests_sent_and_answered(self) -> Tuple[int, int]:
         return self._requests_sent, self._requests_answered
 
+    def get_request_concurrency_stats(self) -> dict:
+        """Current request window and round-trip times, for diagnostics."""
+        return self._network_request_limiter.get_stats()
+
+    async def _fetch_from_any_interface(self, fetch, **kwargs):
+        """Network.fetch_from_any_interface, counted against our request window.
+        Only round trips to the main server are timed.
+        """
+        async with self._network_request_limiter.request() as request:
+            def fetch_and_time_main(iface):
+                if iface is not self.interface:
+                    request.ignore_latency()
+                return fetch(iface)
+            return await self.network.fetch_from_any_interface(
+                self.interface, fetch_and_time_main, **kwargs)
+
     @property
     def session(self):
         s = self.interface.session
@@ -1572,6 +1728,31 @@ def create_and_start_event_loop() -> Tuple[asyncio.AbstractEventLoop,
     return loop, stopping_fut, loop_thread
 
 
+class LRUCache(OrderedDict):
+    """An OrderedDict with bounded size, that evicts the least recently used items."""
+
+    def __init__(self, *, maxsize: int):
+        super().__init__()
+        assert maxsize > 0, maxsize
+        self.maxsize = maxsize
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        self.move_to_end(key)
+        return value
+
+    def get(self, key, default=None):
+        if key not in self:
+            return default
+        return self[key]
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
+
+
 class OrderedDictWithIndex(OrderedDict):
     """An OrderedDict that keeps track of the positions of keys.
 
@@ -22,7 +22,7 @@
 # SOFTWARE.
 
 import asyncio
-from typing import Sequence, Optional, TYPE_CHECKING
+from typing import Sequence, Optional, Mapping, TYPE_CHECKING
 
 import aiorpcx
 
@@ -96,10 +96,14 @@ class SPV(NetworkJobOnDefaultServer):
             await self.taskgroup.spawn(self._request_and_verify_single_proof, tx_hash, tx_height)
 
     async def _request_and_verify_single_proof(self, tx_hash, tx_height):
+        if await self._verify_cached_proof(tx_hash, tx_height):
+            return
         try:
             self._requests_sent += 1
-            async with self._network_request_semaphore:
-                merkle = await self.interface.get_merkle_for_transaction(tx_hash, tx_height)
+            merkle = await self._fetch_from_any_interface(
+                lambda iface: iface.get_merkle_for_transaction(tx_hash, tx_height),
+                min_tip=tx_height,
+                validate=lambda merkle: self._verify_merkle_response(tx_hash, merkle))
         except aiorpcx.jsonrpc.RPCError:
             self.logger.info(f'tx {tx_hash} not at height {tx_height}')
             self.wallet.remove_unverified_tx(tx_hash, tx_height)
@@ -126,17 +130,56 @@ class SPV(NetworkJobOnDefaultServer):
             else:
                 self.logger.info(repr(e))
                 raise GracefulDisconnect(e) from e
+        else:
+            if self.network.tx_cache:
+                await self.network.tx_cache.add_merkle_proof(tx_hash, hash_header(header), pos, merkle_branch)
         # we passed all the tests
-        self.merkle_roots[tx_hash] = header.get('merkle_root')
-        self.requested_merkle.discard(tx_hash)
+        self._add_verified_tx(tx_hash, tx_height, pos, header)
         self.logger.info(f"verified {tx_hash}")
+
+    async def _verify_cached_proof(self, tx_hash: str, tx_height: int) -> bool:
+        """Verifies tx_hash using a merkle proof from the daemon-wide cache,
+        if there is one for the header we have at tx_height.
+        The cache is opt-in, see NETWORK_TX_CACHE_MAX_SIZE_MB.
+        """
+        tx_cache = self.network.tx_cache
+        if not tx_cache:
+            return False
+        async with self.network.bhi_lock:
+            header = self.network.blockchain().read_header(tx_height)
+        if header is None:
+            return False
+        header_hash = hash_header(header)
+        proof = await tx_cache.get_merkle_proof(tx_hash, header_hash)
+        if proof is None:
+            return False
+        pos, merkle_branch = proof
+        try:
+            verify_tx_is_in_block(tx_hash, merkle_branch, pos, header, tx_height)
+        except MerkleVerificationFailure as e:
+            self.logger.info(f"dropping cached merkle proof for {tx_hash}: {e!r}")
+            await tx_cache.remove_merkle_proof(tx_hash, header_hash)
+            return False
+        self._add_verified_tx(tx_hash, tx_height, pos, header)
+        self.logger.info(f"verified {tx_hash} (cached proof)")
+        return True
+
+    def _add_verified_tx(self, tx_hash: str, tx_height: int, pos: int, header: Mapping) -> None:
+        self.merkle_roots[tx_hash] = header.merkle_root
+        self.requested_merkle.discard(tx_hash)
         header_hash = hash_header(header)
         tx_info = TxMinedInfo(height=tx_height,
-                              timestamp=header.get('timestamp'),
+                              timestamp=header.timestamp,
                               txpos=pos,
                               header_hash=header_hash)
         self.wallet.add_verified_tx(tx_hash, tx_info)
 
+    def _verify_merkle_response(self, tx_hash: str, merkle: dict) -> None:
+        """Checks a merkle proof from a helper server against our headers."""
+        block_height = merkle.get('block_height')
+        header = self.network.blockchain().read_header(block_height)
+        verify_tx_is_in_block(tx_hash, merkle.get('merkle'), merkle.get('pos'), header, block_height)
+
     @classmethod
     def hash_merkle_root(cls, merkle_branch: Sequence[str], tx_hash: str, leaf_pos_in_tree: int):
         """Return calculated merkle root."""
@@ -196,7 +239,7 @@ class SPV(NetworkJobOnDefaultServer):
 
 
 def verify_tx_is_in_block(tx_hash: str, merkle_branch: Sequence[str],
-                          leaf_pos_in_tree: int, block_header: Optional[dict],
+                          leaf_pos_in_tree: int, block_header: Optional[Mapping],
                           block_height: int) -> None:
     """Raise MerkleVerificationFailure if verification fails."""
     if not block_header:
@@ -40,7 +40,7 @@ from functools import partial
 from collections import defaultdict
 from numbers import Number
 from decimal import Decimal
-from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable
+from typing import TYPE_CHECKING, List, Optional, Tuple, Union, NamedTuple, Sequence, Dict, Any, Set, Iterable, Callable
 from abc import ABC, abstractmethod
 import itertools
 import threading
@@ -73,7 +73,7 @@ from . import transaction, bitcoin, coinchooser, paymentrequest, ecc, bip32
 from .transaction import (Transaction, TxInput, UnknownTxinType, TxOutput,
                           PartialTransaction, PartialTxInput, PartialTxOutput, TxOutpoint, Sighash)
 from .plugin import run_hook
-from .address_synchronizer import (AddressSynchronizer, TX_HEIGHT_LOCAL,
+from .address_synchronizer import (AddressSynchronizer, HistoryItem, TX_HEIGHT_LOCAL,
                                    TX_HEIGHT_UNCONF_PARENT, TX_HEIGHT_UNCONFIRMED, TX_HEIGHT_FUTURE, TX_TIMESTAMP_INF)
 from .invoices import BaseInvoice, Invoice, Request
 from .invoices import PR_PAID, PR_UNPAID, PR_UNKNOWN, PR_EXPIRED, PR_UNCONFIRMED, PR_INFLIGHT
@@ -354,8 +354,10 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             self.adb.add_address(addr)
         self.lock = self.adb.lock
         self.transaction_lock = self.adb.transaction_lock
-        self._last_full_history = None
-        self._tx_parents_cache = {}
+        # graph of wallet txs, edges are computed lazily, see get_tx_parents
+        self._tx_graph = {}  # type: Dict[str, Tuple[List[str], List[str]]]  # txid -> (parents, uncles)
+        self._tx_graph_children = defaultdict(set)  # type: Dict[str, Set[str]]  # reverse edges
+        self._tx_parents_cache = {}  # type: Dict[str, Dict[str, Tuple[List[str], List[str]]]]
 
         self.taskgroup = OldTaskGroup()
 
@@ -505,9 +507,46 @@ class Abstract_Wallet(ABC, Logger, EventListener):
 
     def clear_tx_parents_cache(self):
         with self.lock, self.transaction_lock:
+            self._tx_graph.clear()
+            self._tx_graph_children.clear()
             self._tx_parents_cache.clear()
             self._num_parents.clear()
-            self._last_full_history = None
+
+    def _invalidate_tx_parents(self, txid: str, tx: Transaction = None) -> None:
+        """To be called when txid is added or removed, or its mined status changes.
+        Drops the edges of txid and of the txs that might have it as uncle,
+        and the ancestor sets of these txs and of their descendants.
+        """
+        with self.lock, self.transaction_lock:
+            seeds = {txid}
+            if tx is None:
+                tx = self.db.get_transaction(txid)
+            if tx is not None:
+                for txin in tx.inputs():
+                    addr = self.adb.get_txin_address(txin)
+                    if addr is None:
+                        continue
+                    received, sent = self.adb.get_addr_io(addr)
+                    for spending_txid, height, pos in sent.values():
+                        seeds.add(spending_txid)
+            for _txid in seeds:
+                parents, uncles = self._tx_graph.pop(_txid, ([], []))
+                for parent_txid in parents + uncles:
+                    children = self._tx_graph_children.get(parent_txid)
+                    if children is not None:
+                        children.discard(_txid)
+                        if not children:
+                            del self._tx_graph_children[parent_txid]
+            todo = list(seeds)
+            done = set()
+            while todo:
+                _txid = todo.pop()
+                if _txid in done:
+                    continue
+                done.add(_txid)
+                self._tx_parents_cache.pop(_txid, None)
+                self._num_parents.pop(_txid, None)
+                todo.extend(self._tx_graph_children.get(_txid, ()))
 
     @event_listener
     async def on_event_adb_set_up_to_date(self, adb):
@@ -534,7 +573,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             return
         if not self.tx_is_related(tx):
             return
-        self.clear_tx_parents_cache()
+        self._invalidate_tx_parents(tx_hash)
         if self.lnworker:
             self.lnworker.maybe_add_backup_from_tx(tx)
         self._update_invoices_and_reqs_touched_by_tx(tx_hash)
@@ -546,13 +585,14 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             return
         if not self.tx_is_related(tx):
             return
-        self.clear_tx_parents_cache()
+        self._invalidate_tx_parents(txid, tx)
         util.trigger_callback('removed_transaction', self, tx)
 
     @event_listener
     def on_event_adb_added_verified_tx(self, adb, tx_hash):
         if adb != self.adb:
             return
+        self._invalidate_tx_parents(tx_hash)
         self._update_invoices_and_reqs_touched_by_tx(tx_hash)
         tx_mined_status = self.adb.get_tx_height(tx_hash)
         util.trigger_callback('verified', self, tx_hash, tx_mined_status)
@@ -561,6 +601,7 @@ class Abstract_Wallet(ABC, Logger, EventListener):
     def on_event_adb_removed_verified_tx(self, adb, tx_hash):
         if adb != self.adb:
             return
+        self._invalidate_tx_parents(tx_hash)
         self._update_invoices_and_reqs_touched_by_tx(tx_hash)
 
     def clear_history(self):
@@ -936,48 +977,73 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         txid -> list of parent txids
         """
         with self.lock, self.transaction_lock:
-            if self._last_full_history is None:
-                self._last_full_history = self.get_full_history(None, include_lightning=False)
-                # populate cache in chronological order (confirmed tx only)
-                # todo: get_full_history should return unconfirmed tx topologically sorted
-                for _txid, tx_item in self._last_full_history.items():
-                    if tx_item['height'] > 0:
-                        self.get_tx_parents(_txid)
-
             result = self._tx_parents_cache.get(txid, None)
             if result is not None:
                 return result
-            result = {}   # type: Dict[str, Tuple[List[str], List[str]]]
-            parents = []  # type: List[str]
-            uncles = []   # type: List[str]
-            tx = self.adb.get_transaction(txid)
-            assert tx, f"cannot find {txid} in db"
-            for i, txin in enumerate(tx.inputs()):
-                _txid = txin.prevout.txid.hex()
-                parents.append(_txid)
-                # detect address reuse
-                addr = self.adb.get_txin_address(txin)
-                if addr is None:
+            # depth-first search, ancestors are added to the cache before their descendants
+            stack = [(txid, False)]
+            visited = set()
+            order = []
+            while stack:
+                _txid, is_expanded = stack.pop()
+                if is_expanded:
+                    order.append(_txid)
                     continue
-                received, sent = self.adb.get_addr_io(addr)
-                if len(sent) > 1:
-                    my_txid, my_height, my_pos = sent[txin.prevout.to_str()]
-                    assert my_txid == txid
-                    for k, v in sent.items():
-                        if k != txin.prevout.to_str():
-                            reuse_txid, reuse_height, reuse_pos = v
-                            if reuse_height <= 0:  # exclude not-yet-mined (we need topological ordering)
-                                continue
-                            if (reuse_height, reuse_pos) < (my_height, my_pos):
-                                uncle_txid, uncle_index = k.split(':')
-                                uncles.append(uncle_txid)
-
-            for _txid in parents + uncles:
-                if _txid in self._last_full_history.keys():
-                    result.update(self.get_tx_parents(_txid))
-            result[txid] = parents, uncles
-            self._tx_parents_cache[txid] = result
-            return result
+                if _txid in visited or _txid in self._tx_parents_cache:
+                    continue
+                visited.add(_txid)
+                stack.append((_txid, True))
+                parents, uncles = self._get_tx_graph_edges(_txid)
+                for parent_txid in parents + uncles:
+                    if self._is_tx_in_history(parent_txid):
+                        stack.append((parent_txid, False))
+            for _txid in order:
+                parents, uncles = self._tx_graph[_txid]
+                result = {}
+                for parent_txid in parents + uncles:
+                    if self._is_tx_in_history(parent_txid):
+                        result.update(self._tx_parents_cache[parent_txid])
+                result[_txid] = parents, uncles
+                self._tx_parents_cache[_txid] = result
+            return self._tx_parents_cache[txid]
+
+    def _is_tx_in_history(self, txid: str) -> bool:
+        return bool(self.db.get_txi_addresses(txid) or self.db.get_txo_addresses(txid))
+
+    def _get_tx_graph_edges(self, txid: str) -> Tuple[List[str], List[str]]:
+        """Returns the parents of txid, and its uncles:
+        earlier mined txs that spend from the same addresses.
+        """
+        edges = self._tx_graph.get(txid)
+        if edges is not None:
+            return edges
+        parents = []  # type: List[str]
+        uncles = []   # type: List[str]
+        tx = self.adb.get_transaction(txid)
+        assert tx, f"cannot find {txid} in db"
+        for i, txin in enumerate(tx.inputs()):
+            _txid = txin.prevout.txid.hex()
+            parents.append(_txid)
+            # detect address reuse
+            addr = self.adb.get_txin_address(txin)
+            if addr is None:
+                continue
+            received, sent = self.adb.get_addr_io(addr)
+            if len(sent) > 1:
+                my_txid, my_height, my_pos = sent[txin.prevout.to_str()]
+                assert my_txid == txid
+                for k, v in sent.items():
+                    if k != txin.prevout.to_str():
+                        reuse_txid, reuse_height, reuse_pos = v
+                        if reuse_height <= 0:  # exclude not-yet-mined (we need topological ordering)
+                            continue
+                        if (reuse_height, reuse_pos) < (my_height, my_pos):
+                            uncle_txid, uncle_index = k.split(':')
+                            uncles.append(uncle_txid)
+        self._tx_graph[txid] = parents, uncles
+        for parent_txid in parents + uncles:
+            self._tx_graph_children[parent_txid].add(txid)
+        return parents, uncles
 
     def get_balance(self, **kwargs):
         domain = self.get_addresses()
@@ -1076,23 +1142,66 @@ class Abstract_Wallet(ABC, Logger, EventListener):
         monotonic_timestamp = 0
         for hist_item in self.adb.get_history(domain=domain):
             monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
-            d = {
-                'txid': hist_item.txid,
-                'fee_sat': hist_item.fee,
-                'height': hist_item.tx_mined_status.height,
-                'confirmations': hist_item.tx_mined_status.conf,
-                'timestamp': hist_item.tx_mined_status.timestamp,
-                'monotonic_timestamp': monotonic_timestamp,
-                'incoming': True if hist_item.delta>0 else False,
-                'bc_value': Satoshis(hist_item.delta),
-                'bc_balance': Satoshis(hist_item.balance),
-                'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
-                'label': self.get_label_for_txid(hist_item.txid),
-                'txpos_in_block': hist_item.tx_mined_status.txpos,
-            }
-            if wanted_height := hist_item.tx_mined_status.wanted_height:
-                d['wanted_height'] = wanted_height
-            yield d
+            yield self._onchain_history_item_to_dict(hist_item, monotonic_timestamp)
+
+    def get_onchain_history_page(
+            self,
+            *,
+            domain=None,
+            from_height: int = None,
+            to_height: int = None,
+            limit: int = None,
+            cursor: str = None,
+    ) -> Tuple[List[dict], Optional[str]]:
+        """Returns a page of get_onchain_history, and the cursor of the next page,
+        or None if this is the last one. Only the returned items are built.
+        Note: monotonic_timestamp is only monotonic within the page.
+        """
+        if domain is None:
+            domain = self.get_addresses()
+        history, has_more = self.adb.get_history_page(
+            domain,
+            from_height=from_height,
+            to_height=to_height,
+            after_key=self._parse_history_cursor(cursor) if cursor is not None else None,
+            limit=limit)
+        out = []
+        monotonic_timestamp = 0
+        for key, hist_item in history:
+            monotonic_timestamp = max(monotonic_timestamp, (hist_item.tx_mined_status.timestamp or TX_TIMESTAMP_INF))
+            out.append(self._onchain_history_item_to_dict(hist_item, monotonic_timestamp))
+        next_cursor = None
+        if has_more and history:
+            next_cursor = ':'.join(map(str, history[-1][0]))
+        return out, next_cursor
+
+    @classmethod
+    def _parse_history_cursor(cls, cursor: str) -> Tuple[int, int, str]:
+        # a cursor is the sort key of the last item of a page: sort_height:txpos:txid
+        try:
+            sort_height, txpos, txid = cursor.split(':')
+            return int(sort_height), int(txpos), txid
+        except ValueError:
+            raise Exception(f"invalid history cursor: {cursor!r}") from None
+
+    def _onchain_history_item_to_dict(self, hist_item: HistoryItem, monotonic_timestamp: int) -> dict:
+        d = {
+            'txid': hist_item.txid,
+            'fee_sat': hist_item.fee,
+            'height': hist_item.tx_mined_status.height,
+            'confirmations': hist_item.tx_mined_status.conf,
+            'timestamp': hist_item.tx_mined_status.timestamp,
+            'monotonic_timestamp': monotonic_timestamp,
+            'incoming': True if hist_item.delta>0 else False,
+            'bc_value': Satoshis(hist_item.delta),
+            'bc_balance': Satoshis(hist_item.balance),
+            'date': timestamp_to_datetime(hist_item.tx_mined_status.timestamp),
+            'label': self.get_label_for_txid(hist_item.txid),
+            'txpos_in_block': hist_item.tx_mined_status.txpos,
+        }
+        if wanted_height := hist_item.tx_mined_status.wanted_height:
+            d['wanted_height'] = wanted_height
+        return d
 
     def create_invoice(self, *, outputs: List[PartialTxOutput], message, pr, URI) -> Invoice:
         height = self.adb.get_local_height()
@@ -1371,6 +1480,44 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                     item['fiat_default'] = True
         return transactions
 
+    def _add_detailed_history_fields(self, item: dict, *, fx=None, show_addresses=False) -> None:
+        tx_hash = item['txid']
+        tx_fee = item['fee_sat']
+        item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
+        if show_addresses:
+            tx = self.db.get_transaction(tx_hash)
+            item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
+            item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
+                                       tx.outputs()))
+        if fx:
+            item.update(self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=item['bc_value'].value, fx=fx, tx_fee=tx_fee))
+
+    def get_detailed_history_page(
+            self,
+            *,
+            from_height: int = None,
+            to_height: int = None,
+            limit: int = None,
+            cursor: str = None,
+            fx=None,
+            show_addresses=False,
+    ) -> dict:
+        """Paginated get_detailed_history, without the summary.
+        Pass the returned 'next_cursor' as cursor to get the next page.
+        """
+        show_fiat = fx and fx.is_enabled() and fx.has_history()
+        items, next_cursor = self.get_onchain_history_page(
+            from_height=from_height,
+            to_height=to_height,
+            limit=limit,
+            cursor=cursor)
+        for item in items:
+            self._add_detailed_history_fields(item, fx=fx if show_fiat else None, show_addresses=show_addresses)
+        return {
+            'transactions': items,
+            'next_cursor': next_cursor,
+        }
+
     @profiler
     def get_detailed_history(
             self,
@@ -1401,18 +1548,11 @@ class Abstract_Wallet(ABC, Logger, EventListener):
             if to_timestamp and (timestamp or now) >= to_timestamp:
                 continue
             height = item['height']
-            if from_height is not None and from_height > height > 0:
+            if from_height is not None and (height < from_height or height <= 0):
                 continue
             if to_height is not None and (height >= to_height or height <= 0):
                 continue
-            tx_hash = item['txid']
-            tx = self.db.get_transaction(tx_hash)
-            tx_fee = item['fee_sat']
-            item['fee'] = Satoshis(tx_fee) if tx_fee is not None else None
-            if show_addresses:
-                item['inputs'] = list(map(lambda x: x.to_json(), tx.inputs()))
-                item['outputs'] = list(map(lambda x: {'address': x.get_ui_address_str(), 'value': Satoshis(x.value)},
-                                           tx.outputs()))
+            self._add_detailed_history_fields(item, fx=fx if show_fiat else None, show_addresses=show_addresses)
             # fixme: use in and out values
             value = item['bc_value'].value
             if value < 0:
@@ -1421,11 +1561,9 @@ class Abstract_Wallet(ABC, Logger, EventListener):
                 income += value
             # fiat computations
             if show_fiat:
-                fiat_fields = self.get_tx_item_fiat(tx_hash=tx_hash, amount_sat=value, fx=fx, tx_fee=tx_fee)
-                fiat_value = fiat_fields['fiat_value'].value
-                item.update(fiat_fields)
+                fiat_value = item['fiat_value'].value
                 if value < 0:
-                    capital_gains += fiat_fields['capital_gain'].value
+                    capital_gains += item['capital_gain'].value
                     fiat_expenditures += -fiat_value
                 else:
                     fiat_income += fiat_value
@@ -3293,20 +3431,52 @@ class Imported_Wallet(Simple_Wallet):
                          write_to_disk=True) -> Tuple[List[str], List[Tuple[str, str]]]:
         good_addr = []  # type: List[str]
         bad_addr = []  # type: List[Tuple[str, str]]
+        seen = set()
         for address in addresses:
             if not bitcoin.is_address(address):
                 bad_addr.append((address, _('invalid address')))
                 continue
-            if self.db.has_imported_address(address):
+            if address in seen or self.db.has_imported_address(address):
                 bad_addr.append((address, _('address already in wallet')))
                 continue
+            seen.add(address)
             good_addr.append(address)
-            self.db.add_imported_address(address, {})
-            self.adb.add_address(address)
+        self.db.add_imported_addresses(good_addr)
+        self.adb.add_addresses(good_addr)
         if write_to_disk:
             self.save_db()
         return good_addr, bad_addr
 
+    async def import_addresses_from_file(
+            self, path: str, *,
+            chunk_size: int = 1000,
+            progress_callback: Callable[[int, int], None] = None,
+    ) -> Tuple[int, List[Tuple[str, str]]]:
+        """Imports the addresses listed in a file (separated by whitespace).
+        The file is read and imported in chunks, yielding to the event loop
+        in between, and the wallet is written to disk once at the end.
+        The synchronizer then subscribes to the new addresses gradually.
+        progress_callback is called with (num_imported, num_rejected) after each chunk.
+        Returns the number of imported addresses, and the rejected ones.
+        """
+        num_good = 0
+        bad_addr = []  # type: List[Tuple[str, str]]
+        chunk = []  # type: List[str]
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in itertools.chain(f, ['']):
+                chunk.extend(line.split())
+                if len(chunk) < chunk_size and line:
+                    continue
+                good, bad = self.import_addresses(chunk, write_to_disk=False)
+                num_good += len(good)
+                bad_addr.extend(bad)
+                chunk = []
+                if progress_callback:
+                    progress_callback(num_good, len(bad_addr))
+                await asyncio.sleep(0)
+        self.save_db()
+        return num_good, bad_addr
+
     def import_address(self, address: str) -> str:
         good_addr, bad_addr = self.import_addresses([address])
         if good_addr and good_addr[0] == address:
@@ -3556,6 +3726,13 @@ class Deterministic_Wallet(Abstract_Wallet):
         pubkeys = self.derive_pubkeys(for_change, n)
         return self.pubkeys_to_address(pubkeys)
 
+    def derive_addresses(self, for_change: int, start: int, count: int) -> Sequence[str]:
+        """Same as derive_address for n in [start, start+count), with batched key derivation."""
+        for_change = int(for_change)
+        pubkeys_per_keystore = [k.derive_pubkey_range(for_change, start, count) for k in self.get_keystores()]
+        return [self.pubkeys_to_address([pubkeys[i].hex() for pubkeys in pubkeys_per_keystore])
+                for i in range(count)]
+
     def export_private_key_for_path(self, path: Union[Sequence[int], str], password: Optional[str]) -> str:
         if isinstance(path, str):
             path = convert_bip32_strpath_to_intpath(path)
@@ -3580,16 +3757,20 @@ class Deterministic_Wallet(Abstract_Wallet):
             txinout.bip32_paths[pubkey] = (fp_bytes, der_full)
 
     def create_new_address(self, for_change: bool = False):
+        return self.create_new_addresses(for_change, 1)[0]
+
+    def create_new_addresses(self, for_change: bool, count: int) -> Sequence[str]:
         assert type(for_change) is bool
         with self.lock:
             n = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
-            address = self.derive_address(int(for_change), n)
-            self.db.add_change_address(address) if for_change else self.db.add_receiving_address(address)
-            self.adb.add_address(address)
+            addresses = self.derive_addresses(int(for_change), n, count)
+            for address in addresses:
+                self.db.add_change_address(address) if for_change else self.db.add_receiving_address(address)
+            self.adb.add_addresses(addresses)
             if for_change:
                 # note: if it's actually "old", it will get filtered later
-                self._not_old_change_addresses.append(address)
-            return address
+                self._not_old_change_addresses.extend(addresses)
+            return addresses
 
     def synchronize_sequence(self, for_change: bool) -> int:
         count = 0  # num new addresses we generated
@@ -3597,16 +3778,21 @@ class Deterministic_Wallet(Abstract_Wallet):
         while True:
             num_addr = self.db.num_change_addresses() if for_change else self.db.num_receiving_addresses()
             if num_addr < limit:
-                count += 1
-                self.create_new_address(for_change)
+                count += limit - num_addr
+                self.create_new_addresses(for_change, limit - num_addr)
                 continue
             if for_change:
                 last_few_addresses = self.get_change_addresses(slice_start=-limit)
             else:
                 last_few_addresses = self.get_receiving_addresses(slice_start=-limit)
-            if any(map(self.adb.address_is_old, last_few_addresses)):
-                count += 1
-                self.create_new_address(for_change)
+            # we need 'limit' unused addresses after the last old one
+            num_needed = 0
+            for i, address in enumerate(last_few_addresses):
+                if self.adb.address_is_old(address):
+                    num_needed = i + 1
+            if num_needed:
+                count += num_needed
+                self.create_new_addresses(for_change, num_needed)
             else:
                 break
         return count
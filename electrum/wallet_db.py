@@ -37,6 +37,7 @@ from functools import partial
 import attr
 
 from . import util, bitcoin
+from .bitcoin import history_status
 from .util import profiler, WalletFileException, multisig_type, TxMinedInfo, bfh, MyEncoder
 from .invoices import Invoice, Request
 from .keystore import bip44_derivation
@@ -1415,15 +1416,27 @@ class WalletDB(JsonDB):
         assert isinstance(addr, str)
         return self.history.get(addr, [])
 
+    @locked
+    def get_addr_history_status(self, addr: str) -> Optional[str]:
+        """Returns the status of the history of addr, as announced by servers.
+        It is cached, and updated by set_addr_history.
+        """
+        assert isinstance(addr, str)
+        if addr not in self._history_status:
+            self._history_status[addr] = history_status(self.history.get(addr, []))
+        return self._history_status[addr]
+
     @modifier
     def set_addr_history(self, addr: str, hist) -> None:
         assert isinstance(addr, str)
         self.history[addr] = hist
+        self._history_status[addr] = history_status(hist)
 
     @modifier
     def remove_addr_history(self, addr: str) -> None:
         assert isinstance(addr, str)
         self.history.pop(addr, None)
+        self._history_status.pop(addr, None)
 
     @locked
     def list_verified_tx(self) -> Sequence[str]:
@@ -1555,6 +1568,13 @@ class WalletDB(JsonDB):
         assert isinstance(addr, str)
         self.imported_addresses[addr] = d
 
+    @modifier
+    def add_imported_addresses(self, addrs: Sequence[str]) -> None:
+        """Adds many watch-only addresses under a single lock."""
+        for addr in addrs:
+            assert isinstance(addr, str)
+            self.imported_addresses[addr] = {}
+
     @modifier
     def remove_imported_address(self, addr: str) -> None:
         assert isinstance(addr, str)
@@ -1602,6 +1622,7 @@ class WalletDB(JsonDB):
         self.transactions = self.get_dict('transactions')        # type: Dict[str, Transaction]
         self.spent_outpoints = self.get_dict('spent_outpoints')  # txid -> output_index -> next_txid
         self.history = self.get_dict('addr_history')             # address -> list of (txid, height)
+        self._history_status = {}                                # address -> status of history (not persisted)
         self.verified_tx = self.get_dict('verified_tx3')         # txid -> (height, timestamp, txpos, header_hash)
         self.tx_fees = self.get_dict('tx_fees')                  # type: Dict[str, TxFeesValue]
         # scripthash -> set of (outpoint, value)
@@ -1626,6 +1647,7 @@ class WalletDB(JsonDB):
         self.spent_outpoints.clear()
         self.transactions.clear()
         self.history.clear()
+        self._history_status.clear()
         self.verified_tx.clear()
         self.tx_fees.clear()
         self._prevouts_by_scripthash.clear()